@@ -0,0 +1,360 @@
+"""
+Offline benchmarks for the hot paths of the orbit-checker
+
+Generates synthetic orbfit output (.eq0_postfit / .eq1_postfit element files & .rwo residual files)
+for a configurable number of objects & observations, then reports the throughput & peak memory of
+ - parsing            : o2d.fel_to_dict, o2d.rwo_to_dict & orbfit_arrays.read_rwo
+ - check_quality      : to_db.check_quality
+ - dict_to_insert     : to_db.dict_to_insert (json serialization)
+ - upsert             : DBConnect.upsert-style single-row upserts
+ - assess             : orbit_checker.assess_quality_of_any_database_orbit
+ - status             : orbit_checker.generate_status_code
+ - tracklets          : orbfit_arrays.screen_tracklets (outlying-tracklet screening of all objects at once)
+ - startup            : the time to import orbit_checker in a fresh interpreter (c.f. its STARTUP_BUDGET_SECONDS)
+
+No production database or orbfit is needed:
+ - backend 'sqlite'   : a file-backed stand-in (SQLiteStandIn) for DBConnect / QueryOrbfitResults
+ - backend 'postgres' : a local postgres with an orbfit_results table (e.g. --db_host localhost)
+
+Only numpy & psycopg2 (imported by to_orbfit_db_tables_dev) are required. Stages that need the
+production modules are skipped (with a message) when those modules cannot be imported:
+ - orbfit_to_dict     : fel_to_dict / rwo_to_dict (synthetic element-dictionaries are used instead)
+ - mpc_convert        : dict_to_insert & upsert
+ - orbit_checker      : startup, assess & status (orbit_checker also needs mpc_convert & query_ids)
+
+e.g.
+python3 benchmark_orbit_checker.py --n_objects 200 --n_obs 500 --backend sqlite
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import sqlite3
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+# --------- Local imports -----------
+import orbfit_arrays as oa
+
+
+# Coordinate-types written to (& expected in) each element file
+COORD_TYPES = ['EQU', 'KEP', 'CAR', 'COM', 'COT']
+
+# Element-file extensions generated for each object
+FEL_EXTS    = ['eq0', 'eq1']
+
+
+# ------------------ SYNTHETIC ORBFIT OUTPUT ------------------------------------------
+
+def synthetic_designations(n_objects):
+    """ Unpacked & packed designations in the 20th/21st-century provisional format """
+    letters = 'ABCDEFGHJKLMNOPQRSTUVWXY'
+    unpacked = [ f'20{10 + i//(24*24*99) % 20:02d} {letters[i//(24*99) % 24]}{letters[i//99 % 24]}{1 + i % 99}' for i in range(n_objects) ]
+    packed   = [ f'K{d[2:4]}{d[5]}{d[7:].zfill(2)}{d[6]}' for d in unpacked ]
+    return unpacked, packed
+
+
+def orbfit_name(unpacked):
+    """ Object name used in orbfit file-names (see to_db.packeddes_to_orbfitdes) """
+    return unpacked.replace(' ','').replace('/','').replace('(','').replace(')','')
+
+
+def _random_cov(rng):
+    """ A random symmetric positive-definite 6x6 covariance matrix """
+    a = rng.normal(size=(6,6)) * 1e-6
+    return a @ a.T + np.eye(6) * 1e-12
+
+
+def synthetic_fel_dict(rng, epoch_mjd=60000.0):
+    """
+    An element-dictionary in the o2d.fel_to_dict layout
+     - { coordtype : {'element0'..'element5', 'cov00'..'cov55'} } for each of COORD_TYPES
+     - used when orbfit_to_dict is not importable, & to write the synthetic element files
+    """
+    feldict = {'epoch' : epoch_mjd}
+    for coordtype in COORD_TYPES:
+        elements = rng.uniform(0.01, 3.0, size=6)
+        cov      = _random_cov(rng)
+        d        = { f'element{i}' : float(elements[i]) for i in range(6) }
+        d.update( { f'cov{i}{j}' : float(cov[i,j]) for i in range(6) for j in range(6) } )
+        feldict[coordtype] = d
+    return feldict
+
+
+def format_rwo_line(values):
+    """ Format one optical observation (dict of RWO_COLUMNS values) as a fixed-width .rwo line """
+    line = [' '] * oa.RWO_LINE_LENGTH
+    for name, start, stop, dtype in oa.RWO_COLUMNS:
+        v = values.get(name, '')
+        if isinstance(v, float):
+            s = f'{v:.6f}' if name in ('day', 'ra_s', 'dec_s') else f'{v:.3f}'
+        else:
+            s = str(v)
+        s = s.rjust(stop - start)[:stop - start]
+        line[start:stop] = list(s)
+    return ''.join(line)
+
+
+def write_rwo_file(filepath, name, n_obs, rng):
+    """ Write a .rwo residual file with n_obs synthetic optical observations (grouped into 4-obs tracklets) """
+    lines = [
+        "version =   3",
+        "errmod  = 'vfcc17'",
+        "RMSast  =   5.00000E-01",
+        "RMSmag  =   3.50000E-01",
+        "END_OF_HEADER",
+        "! Object   Obser ============= Date ============= ================== Right Ascension =================  ================= Declination ===================== ==== Magnitude ==== Ast Obs  Residual SEL",
+    ]
+    stations = ['F51', 'G96', '703', 'T05', 'C51']
+    mjd0     = 58000.0
+    for k in range(n_obs):
+        mjd  = mjd0 + 30.0*(k // 4) + 0.02*(k % 4)
+        # MJD -> calendar (adequate for synthetic data)
+        t    = time.gmtime( (mjd - 40587.0) * 86400.0 )
+        day  = t.tm_mday + (mjd % 1.0)
+        lines.append(format_rwo_line({
+            'design'    : name,         'obs_type'  : 'O',          'tech'      : 'C',
+            'year'      : t.tm_year,    'month'     : t.tm_mon,     'day'       : day,
+            'time_acc'  : 1e-5,
+            'ra_h'      : 1 + k % 22,   'ra_m'      : k % 60,       'ra_s'      : float(rng.uniform(0, 60)),
+            'ra_acc'    : 0.001,        'ra_rms'    : 0.5,          'ra_flag'   : 'F',
+            'ra_bias'   : 0.0,          'ra_resid'  : float(rng.normal(0, 0.5)),
+            'dec_sign'  : '+',          'dec_d'     : k % 60,       'dec_m'     : k % 60,
+            'dec_s'     : float(rng.uniform(0, 60)),
+            'dec_acc'   : 0.01,         'dec_rms'   : 0.5,          'dec_flag'  : 'F',
+            'dec_bias'  : 0.0,          'dec_resid' : float(rng.normal(0, 0.5)),
+            'mag'       : 20.5,         'mag_band'  : 'V',          'mag_rms'   : 0.35,
+            'mag_resid' : 0.1,          'catalog'   : 'V',          'station'   : stations[(k // 4) % len(stations)],
+            'chi'       : float(abs(rng.normal(0, 1))),
+            'sel_astrom': 1,            'sel_mag'   : 1,
+        }))
+    with open(filepath, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+
+
+def generate_files(workdir, n_objects, n_obs, seed=0):
+    """
+    Write synthetic orbfit output for n_objects into workdir/neofitels & workdir/res
+     - the same layout as load_orbfit_files expects (feldir / obsdir)
+
+    returns:
+    --------
+    unpacked, packed : lists of designations
+    """
+    rng = np.random.default_rng(seed)
+    feldir, obsdir = os.path.join(workdir, 'neofitels'), os.path.join(workdir, 'res')
+    os.makedirs(feldir, exist_ok=True)
+    os.makedirs(obsdir, exist_ok=True)
+    unpacked, packed = synthetic_designations(n_objects)
+    for desig in unpacked:
+        name = orbfit_name(desig)
+        for ext in FEL_EXTS:
+            oa.write_fel_file( os.path.join(feldir, f'{name}.{ext}_postfit') , {name : synthetic_fel_dict(rng)} , COORD_TYPES )
+        write_rwo_file( os.path.join(obsdir, f'{name}.rwo') , name , n_obs , rng )
+    return unpacked, packed
+
+
+# ------------------ FILE-BACKED DATABASE STAND-IN ------------------------------------
+
+class SQLiteStandIn():
+    '''
+    File-backed stand-in for DBConnect (upsert) & QueryOrbfitResults (has_orbfit_result, get_quality_json)
+     - an orbfit_results table with the to_db.ORBFIT_RESULTS_COLUMNS (as text)
+     - the upserts have the same "INSERT ... ON CONFLICT ... DO UPDATE" shape as DBConnect.upsert
+    '''
+
+    def __init__(self, filepath, columns):
+        self.dbConn = sqlite3.connect(filepath)
+        self.dbCur  = self.dbConn.cursor()
+        self.dbCur.execute( f"CREATE TABLE IF NOT EXISTS orbfit_results ( id INTEGER PRIMARY KEY, " + \
+                            ', '.join( f'{c} TEXT' for c in columns ) + \
+                            ", UNIQUE (packed_primary_provisional_designation) )" )
+        self.dbCur.execute( "CREATE INDEX IF NOT EXISTS orbfit_results_unpacked ON orbfit_results (unpacked_primary_provisional_designation)" )
+        self.dbConn.commit()
+
+    def upsert(self, data_dictionary, db_table_name):
+        columns = list(data_dictionary.keys())
+        self.dbCur.execute(
+            f"INSERT INTO {db_table_name} ({','.join(columns)}) VALUES ({','.join('?'*len(columns))}) " + \
+            f"ON CONFLICT (packed_primary_provisional_designation) DO UPDATE SET " + \
+            ', '.join( f'{c}=excluded.{c}' for c in columns ),
+            [ data_dictionary[c] for c in columns ] )
+        self.dbConn.commit()
+
+    def has_orbfit_result(self, unpacked_primary_desig):
+        self.dbCur.execute("SELECT id FROM orbfit_results WHERE unpacked_primary_provisional_designation = ?", (unpacked_primary_desig,))
+        return self.dbCur.fetchone() is not None
+
+    def get_quality_json(self, unpacked_primary_desig):
+        self.dbCur.execute("SELECT quality_json FROM orbfit_results WHERE unpacked_primary_provisional_designation = ?", (unpacked_primary_desig,))
+        return json.loads(self.dbCur.fetchone()[0])
+
+    def db_close(self):
+        self.dbConn.close()
+
+
+# ------------------ BENCHMARK HARNESS ------------------------------------------------
+
+def measure(name, func, items, repeat=1):
+    """
+    Run func(item) over every item
+     - timing  : best of *repeat* passes (without tracemalloc)
+     - memory  : peak traced allocation during one further pass
+
+    returns : dict
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    for item in items:
+        func(item)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        'stage'         : name,
+        'n'             : len(items),
+        'seconds'       : best,
+        'per_second'    : len(items) / best if best else None,
+        'peak_kib'      : peak / 1024,
+    }
+    print(f"{name:<28} N={result['n']:<6} {result['seconds']:10.4f}s {result['per_second'] or 0:12.1f}/s  peak={result['peak_kib']:10.1f} KiB")
+    return result
+
+
+def measure_startup(repeat=3):
+    """
+    Time 'import orbit_checker' in a fresh interpreter (best of *repeat*) & compare with its STARTUP_BUDGET_SECONDS
+
+    returns : dict
+    """
+    script = "import time; t = time.perf_counter(); import orbit_checker as oc; print(time.perf_counter() - t, oc.STARTUP_BUDGET_SECONDS)"
+    best, budget = None, None
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if out.returncode != 0:
+            reason = (out.stderr.strip().splitlines() or ['unknown error'])[-1]
+            print(f"{'startup (import orbit_checker)':<28} skipped: orbit_checker cannot be imported here ({reason})")
+            return { 'stage' : 'startup (import orbit_checker)' , 'n' : 0 , 'seconds' : None , 'per_second' : None , 'peak_kib' : None , 'budget_seconds' : None , 'skipped' : reason }
+        seconds, budget = [ float(_) for _ in out.stdout.split()[-2:] ]
+        best = seconds if best is None else min(best, seconds)
+
+    result = { 'stage' : 'startup (import orbit_checker)' , 'n' : 1 , 'seconds' : best , 'per_second' : None , 'peak_kib' : None , 'budget_seconds' : budget }
+    print(f"{result['stage']:<28} {best:10.4f}s  budget={budget:.2f}s  {'OK' if best <= budget else '*** OVER BUDGET ***'}")
+    return result
+
+
+def run(n_objects=100, n_obs=200, backend='sqlite', workdir=None, repeat=3, seed=0, db_host='localhost', db_user='postgres', db_name='vmsops', output=None):
+    """
+    Generate the synthetic files & benchmark each stage
+
+    returns : list of result-dicts (see measure)
+    """
+    import to_orbfit_db_tables_dev as to_db
+
+    cleanup = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='orbit_checker_benchmark_')
+    results = [ measure_startup(repeat) ]
+    try:
+        print(f'Generating N={n_objects} objects with {n_obs} observations each in {workdir} ...')
+        unpacked, packed = generate_files(workdir, n_objects, n_obs, seed=seed)
+        feldir, obsdir   = os.path.join(workdir, 'neofitels') + '/', os.path.join(workdir, 'res') + '/'
+        names            = [ orbfit_name(d) for d in unpacked ]
+        file_list        = [ f'{ext}_postfit' for ext in FEL_EXTS ] + ['rwo']
+
+        # (1) Parsing
+        filedicts = []
+        try:
+            import orbfit_to_dict as o2d
+            results.append( measure('fel_to_dict', lambda n: o2d.fel_to_dict(feldir + n + '.eq0_postfit', allcoords=True), names, repeat) )
+            results.append( measure('rwo_to_dict', lambda n: o2d.rwo_to_dict(obsdir + n + '.rwo'), names, repeat) )
+            for p in packed:
+                filedict, _ = to_db.load_orbfit_files(p, file_list, to_db.add_orbitfiles({}, file_list), feldir=feldir, obsdir=obsdir)
+                filedicts.append(filedict)
+        except ImportError:
+            print('orbfit_to_dict is not available: skipping fel_to_dict / rwo_to_dict & using synthetic element-dictionaries')
+            rng = np.random.default_rng(seed)
+            for n in names:
+                with open(obsdir + n + '.rwo') as fh:
+                    rwodict = { str(k) : line.rstrip('\n') for k, line in enumerate(fh) }     # a stand-in of representative size for the rwo_json
+                filedicts.append({ **{ f'{ext}dict' : synthetic_fel_dict(rng) for ext in FEL_EXTS } , 'rwodict' : rwodict })
+        results.append( measure('orbfit_arrays.read_rwo', lambda n: oa.read_rwo(obsdir + n + '.rwo'), names, repeat) )
+        rwo_arrays = [ oa.read_rwo(obsdir + n + '.rwo')[1] for n in names ]
+        results.append( measure('screen_tracklets (batch)', oa.screen_tracklets, [rwo_arrays], repeat) )
+
+        # (2) Quality checks & serialization
+        pairs = list(zip(packed, filedicts))
+        results.append( measure('check_quality', lambda pf: to_db.check_quality(pf[1], file_list), pairs, repeat) )
+        try:
+            rows  = [ to_db.dict_to_insert(p, f, to_db.check_quality(f, file_list)) for p, f in pairs ]
+            results.append( measure('dict_to_insert', lambda pf: to_db.dict_to_insert(pf[0], pf[1], to_db.check_quality(pf[1], file_list)), pairs, repeat) )
+        except ImportError as e:
+            print(f'dict_to_insert / upsert skipped: {e}')
+            rows  = None
+
+        # (3) Database upserts & reads
+        if backend == 'sqlite':
+            dbUpdate = dbQuery = SQLiteStandIn( os.path.join(workdir, 'orbfit_results.sqlite') , to_db.ORBFIT_RESULTS_COLUMNS )
+        else:
+            import db_query_orbits_dev as query_orbs
+            dbUpdate = to_db.DBConnect(db_host=db_host, db_user=db_user, db_name=db_name)
+            dbQuery  = query_orbs.QueryOrbfitResults(db_host=db_host, db_user=db_user, db_name=db_name)
+        if rows is not None:
+            results.append( measure(f'upsert ({backend})', lambda row: dbUpdate.upsert(row, 'orbfit_results'), rows, repeat) )
+
+        # (4) Assessment & status
+        try:
+            import orbit_checker as oc
+        except ImportError as e:
+            print(f'assess_quality / generate_status_code skipped: orbit_checker cannot be imported here ({e})')
+            oc = None
+        if oc is not None:
+            def assess(desig):
+                assessment_dict = dict.fromkeys(['IS_IN_ORBFIT_RESULTS','IS_IN_COMET_RESULTS','IS_IN_SATELLITE_RESULTS','HAS_NO_RESULTS',
+                                                 'HAS_BAD_QUALITY_DICT','HAS_INTERMEDIATE_QUALITY_DICT','HAS_GOOD_QUALITY_DICT'], False)
+                oc.assess_quality_of_any_database_orbit({'unpacked_provisional_designation' : desig}, assessment_dict, dbQuery)
+                return assessment_dict
+            results.append( measure('assess_quality (db)', assess, unpacked, repeat) )
+            assessments = [ assess(d) for d in unpacked ]
+            results.append( measure('generate_status_code', oc.generate_status_code, assessments, repeat) )
+
+        dbUpdate.db_close()
+        if dbQuery is not dbUpdate:
+            dbQuery.db_close()
+
+    finally:
+        if cleanup:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output is not None:
+        with open(output, 'w') as fh:
+            json.dump({ 'n_objects' : n_objects , 'n_obs' : n_obs , 'backend' : backend , 'results' : results }, fh, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the orbit-checker hot paths')
+    parser.add_argument("--n_objects", help="number of synthetic objects",                      type=int, default=100)
+    parser.add_argument("--n_obs",     help="number of observations in each synthetic .rwo",    type=int, default=200)
+    parser.add_argument("--backend",   help="database to upsert into",                          type=str, choices=['sqlite','postgres'], default='sqlite')
+    parser.add_argument("--workdir",   help="directory for the synthetic files (default: a temporary directory, removed afterwards)", type=str, default=None)
+    parser.add_argument("--repeat",    help="timing passes per stage (the best is reported)",   type=int, default=3)
+    parser.add_argument("--seed",      help="random seed for the synthetic data",               type=int, default=0)
+    parser.add_argument("--db_host",   help="postgres host (backend=postgres)",                 type=str, default='localhost')
+    parser.add_argument("--db_user",   help="postgres user (backend=postgres)",                 type=str, default='postgres')
+    parser.add_argument("--db_name",   help="postgres database (backend=postgres)",             type=str, default='vmsops')
+    parser.add_argument("--output",    help="optional json file for the results",               type=str, default=None)
+    args = parser.parse_args()
+    run(**vars(args))
@@ -0,0 +1,227 @@
+"""
+Per-stage timing & throughput metrics for orbit-checking sweeps
+
+The stages of check_single_designation are already marked by sweep_journal.record_stage.
+A StageTimer has the same record(...) interface as a SweepJournal, and turns those
+marks into per-designation durations: a stage lasts from its own mark to the next mark
+for the same designation (or to a pause_stage). The DONE mark closes the designation.
+
+ - StageTimer       : per-process; collects the finished per-designation timings
+ - SweepMetrics     : aggregates the timings (from any number of processes) into
+                      percentiles, outcome/status counts & throughput, and writes them
+                      to a metrics file (Prometheus text format if the path ends in .prom, else json)
+ - RecorderGroup    : lets a journal & a timer both receive the record_stage marks
+"""
+
+# --------- Third-Party imports -----
+import os
+import json
+import time
+import numpy as np
+
+# --------- Local imports -----------
+import sweep_journal
+
+
+# Percentiles reported for each stage
+PERCENTILES = [50, 90, 99]
+
+
+class StageTimer():
+    '''
+    Times the stages of each designation, from the record_stage marks
+    '''
+
+    def __init__(self):
+        self.open     = {}      # designation -> (current stage or None, time of mark, {stage : seconds})
+        self.finished = []      # per-designation timing records (see pop_finished)
+
+
+    def record(self, designation, stage, status=None):
+        """ Same interface as SweepJournal.record: designation has reached stage """
+        now = time.perf_counter()
+        current, marked, durations = self.open.pop(designation, (None, now, {}))
+        if current is not None:
+            durations[current] = durations.get(current, 0.0) + (now - marked)
+
+        if stage == 'DONE':
+            self.finished.append({
+                'designation'   : designation,
+                'durations'     : durations,
+                'total'         : sum(durations.values()),
+                'outcome'       : outcome_from_stages(durations),
+                'status'        : status,
+            })
+        else:
+            self.open[designation] = (stage, now, durations)
+
+
+    def pause(self, designation):
+        """ Close the current stage without starting another (e.g. after a fit shared by a batch) """
+        now = time.perf_counter()
+        current, marked, durations = self.open.pop(designation, (None, now, {}))
+        if current is not None:
+            durations[current] = durations.get(current, 0.0) + (now - marked)
+        self.open[designation] = (None, now, durations)
+
+
+    def pop_finished(self):
+        """ Return (& forget) the timing records of the designations that have reached DONE """
+        finished, self.finished = self.finished, []
+        return finished
+
+
+    def close(self):
+        pass
+
+
+def outcome_from_stages(durations):
+    """
+    Summarize what happened to a designation from the stages it passed through
+     - 'fit_written'     : orbfit was run & the result was written to the db
+     - 'fit_not_written' : orbfit was run, but the result was not written (not attempted, or DB_WRITE_FAILED)
+     - 'assessed'        : only the db-orbit was assessed (e.g. unchanged observations)
+    """
+    if 'ORBFIT' in durations:
+        return 'fit_written' if 'DB_WRITE' in durations and 'DB_WRITE_FAILED' not in durations else 'fit_not_written'
+    return 'assessed'
+
+
+class RecorderGroup():
+    '''
+    Forward the record_stage marks to several recorders (e.g. a SweepJournal & a StageTimer)
+    '''
+
+    def __init__(self, *recorders):
+        self.recorders = [ _ for _ in recorders if _ is not None ]
+
+    def record(self, designation, stage, status=None):
+        for recorder in self.recorders:
+            recorder.record(designation, stage, status=status)
+
+    def pause(self, designation):
+        for recorder in self.recorders:
+            pause_stage(recorder, designation)
+
+    def close(self):
+        for recorder in self.recorders:
+            recorder.close()
+
+
+def pause_stage(recorder, designation):
+    """ Pause the timing of a designation if the recorder (may be None) keeps time """
+    if hasattr(recorder, 'pause'):
+        recorder.pause(designation)
+
+
+class SweepMetrics():
+    '''
+    Aggregate per-designation timing records into sweep-level metrics
+    '''
+
+    def __init__(self, filepath=None, interval=60):
+        """
+        filepath: str or None
+         - If supplied, the metrics are (re)written here every *interval* seconds (see maybe_write)
+         - Prometheus text format if filepath ends in '.prom', otherwise json
+        """
+        self.filepath   = filepath
+        self.interval   = interval
+        self.started    = time.time()
+        self.written    = self.started
+        self.durations  = { stage : [] for stage in sweep_journal.STAGES if stage != 'DONE' }
+        self.totals     = []
+        self.outcomes   = {}
+        self.statuses   = {}
+
+
+    def add(self, records):
+        """ Add StageTimer records """
+        for record in records:
+            for stage, seconds in record['durations'].items():
+                self.durations[stage].append(seconds)
+            self.totals.append(record['total'])
+            self.outcomes[record['outcome']]      = self.outcomes.get(record['outcome'], 0) + 1
+            self.statuses[str(record['status'])]  = self.statuses.get(str(record['status']), 0) + 1
+
+
+    def add_crashed(self, designation):
+        """ Count a designation whose check crashed (so has no timing record) """
+        self.outcomes['crashed'] = self.outcomes.get('crashed', 0) + 1
+
+
+    def as_dict(self):
+        """ Percentiles per stage, counts & throughput """
+        elapsed = time.time() - self.started
+        n       = sum(self.outcomes.values())
+        def summarize(seconds):
+            summary = { 'count' : len(seconds), 'sum' : float(np.sum(seconds)) if seconds else 0.0 }
+            for p in PERCENTILES:
+                summary[f'p{p}'] = float(np.percentile(seconds, p)) if seconds else None
+            summary['max'] = float(np.max(seconds)) if seconds else None
+            return summary
+
+        return {
+            'elapsed_seconds'       : elapsed,
+            'designations'          : n,
+            'designations_per_hour' : 3600.0 * n / elapsed if elapsed > 0 else None,
+            'stages'                : { stage : summarize(seconds) for stage, seconds in self.durations.items() },
+            'total'                 : summarize(self.totals),
+            'outcomes'              : dict(self.outcomes),
+            'statuses'              : dict(self.statuses),
+        }
+
+
+    def to_prometheus(self):
+        """ The metrics in the Prometheus text exposition format """
+        metrics = self.as_dict()
+        lines   = ['# TYPE orbit_checker_stage_seconds summary']
+        for stage, summary in list(metrics['stages'].items()) + [('TOTAL', metrics['total'])]:
+            for p in PERCENTILES:
+                if summary[f'p{p}'] is not None:
+                    lines.append(f'orbit_checker_stage_seconds{{stage="{stage}",quantile="{p/100}"}} {summary[f"p{p}"]}')
+            lines.append(f'orbit_checker_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+            lines.append(f'orbit_checker_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        lines.append('# TYPE orbit_checker_designations_total counter')
+        for outcome, n in metrics['outcomes'].items():
+            lines.append(f'orbit_checker_designations_total{{outcome="{outcome}"}} {n}')
+        lines.append('# TYPE orbit_checker_status_total counter')
+        for status, n in metrics['statuses'].items():
+            lines.append(f'orbit_checker_status_total{{status="{status}"}} {n}')
+        lines.append('# TYPE orbit_checker_designations_per_hour gauge')
+        lines.append(f'orbit_checker_designations_per_hour {metrics["designations_per_hour"] or 0.0}')
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, filepath=None):
+        """ (Atomically) rewrite the metrics file """
+        filepath = filepath or self.filepath
+        if filepath is None:
+            return
+        with open(filepath + '.tmp', 'w') as fh:
+            if filepath.endswith('.prom'):
+                fh.write(self.to_prometheus())
+            else:
+                json.dump(self.as_dict(), fh, indent=2)
+        os.replace(filepath + '.tmp', filepath)
+        self.written = time.time()
+
+
+    def maybe_write(self):
+        """ Rewrite the metrics file if *interval* seconds have passed since it was last written """
+        if self.filepath is not None and time.time() - self.written > self.interval:
+            self.write()
+
+
+    def summary(self):
+        """ Human-readable end-of-sweep summary """
+        metrics = self.as_dict()
+        lines   = [ f"Checked N={metrics['designations']} designations in {metrics['elapsed_seconds']:.1f}s " + \
+                    f"({metrics['designations_per_hour'] or 0.0:.1f} per hour)" ,
+                    f"\toutcomes : {metrics['outcomes']}" ,
+                    f"\tstatuses : {metrics['statuses']}" ]
+        for stage, summary in list(metrics['stages'].items()) + [('TOTAL', metrics['total'])]:
+            if summary['count']:
+                lines.append( f"\t{stage:<20} N={summary['count']:<8} " + \
+                              ' '.join( f"p{p}={summary[f'p{p}']:.3f}s" for p in PERCENTILES ) + f" max={summary['max']:.3f}s" )
+        return '\n'.join(lines)
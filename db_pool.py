@@ -0,0 +1,127 @@
+"""
+Shared, size-bounded pool(s) of psycopg2 connections
+
+Used by QueryOrbfitResults & DBConnect so that
+ - connection set-up (to e.g. marsden) is paid once per process, not once per object
+ - the total number of connections a process can hold is bounded
+
+There is one pool per (db_host, db_user, db_name), created on first use.
+All pool settings live in POOL_CONFIG: change them via configure(...) before the first connection is made.
+
+NB: pools are per-process. A forked child (e.g. a multiprocessing worker)
+gets fresh pools: the connections inherited from the parent are never used (or closed) by the child.
+"""
+
+# --------- Third-Party imports -----
+import os
+import threading
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+
+# --------- Pool settings -----------
+POOL_CONFIG = {
+    'minconn'       : 1,        # connections opened when a pool is created
+    'maxconn'       : 8,        # maximum connections per pool (per process)
+    'timeout'       : 60,       # seconds to wait for a free connection before raising
+    'validate'      : True,     # check each connection is alive on checkout (& reconnect if not)
+    'max_retries'   : 3,        # number of dead connections to replace on a single checkout
+}
+
+_lock       = threading.Lock()
+_pools      = {}    # (db_host, db_user, db_name) -> [ThreadedConnectionPool, Semaphore]
+_owners     = {}    # id(connection) -> (db_host, db_user, db_name)
+_pid        = os.getpid()
+_abandoned  = []    # pools inherited across a fork: kept referenced so that they are never closed by the child
+
+
+def configure(**kwargs):
+    """
+    Change the pool settings (see POOL_CONFIG for the allowed keys)
+     - Only affects pools created after the call
+    """
+    unknown = set(kwargs) - set(POOL_CONFIG)
+    assert not unknown, f'Unknown pool setting(s): {unknown}'
+    POOL_CONFIG.update(kwargs)
+
+
+def _get_pool(db_host, db_user, db_name):
+    """ Get (or create) the pool for this process & database """
+    global _pid
+    key = (db_host, db_user, db_name)
+    with _lock:
+
+        # After a fork, the parent's connections must not be touched
+        if os.getpid() != _pid:
+            _abandoned.extend(_pools.values())
+            _pools.clear()
+            _owners.clear()
+            _pid = os.getpid()
+
+        if key not in _pools:
+            pool = ThreadedConnectionPool( POOL_CONFIG['minconn'], POOL_CONFIG['maxconn'], host=db_host, user=db_user, database=db_name)
+            _pools[key] = [pool, threading.BoundedSemaphore(POOL_CONFIG['maxconn'])]
+        return key, _pools[key]
+
+
+def _is_alive(conn):
+    """ Cheap round-trip to check that a pooled connection is still usable """
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (Exception, psycopg2.Error):
+        return False
+
+
+def getconn(db_host, db_user, db_name):
+    """
+    Check-out a connection from the pool for this database
+     - Blocks (up to POOL_CONFIG['timeout'] seconds) if all connections are in use
+     - Dead connections are discarded and replaced
+    """
+    key, (pool, semaphore) = _get_pool(db_host, db_user, db_name)
+    if not semaphore.acquire(timeout=POOL_CONFIG['timeout']):
+        raise PoolError(f"Timed-out waiting for a connection to {db_name}@{db_host}")
+
+    try:
+        for attempt in range(POOL_CONFIG['max_retries'] + 1):
+            conn = pool.getconn()
+            if not POOL_CONFIG['validate'] or _is_alive(conn):
+                _owners[id(conn)] = key
+                return conn
+            print(f"Discarding dead connection to {db_name}@{db_host} ...")
+            pool.putconn(conn, close=True)
+    except:
+        semaphore.release()
+        raise
+
+    semaphore.release()
+    raise psycopg2.OperationalError(f"Could not obtain a live connection to {db_name}@{db_host}")
+
+
+def putconn(conn, close=False):
+    """
+    Return a connection to its pool
+     - Any open transaction is rolled-back by the pool
+     - close=True discards the connection rather than keeping it for re-use
+    """
+    key = _owners.pop(id(conn), None)
+    if key is None or key not in _pools:
+        # Not from a pool in this process (e.g. checked-out before a fork)
+        return
+    pool, semaphore = _pools[key]
+    pool.putconn(conn, close=close)
+    semaphore.release()
+
+
+def closeall():
+    """ Close every pooled connection in this process """
+    with _lock:
+        for pool, semaphore in _pools.values():
+            pool.closeall()
+        _pools.clear()
+        _owners.clear()
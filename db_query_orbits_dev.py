@@ -10,37 +10,84 @@ It will likely overlap with code already written by MPan
 # --------- Third-Party imports -----
 import sys
 import os
+import numpy as np
 import psycopg2
+from psycopg2 import sql
+
+# --------- Local imports -----------
+import db_pool
+
+# SQL conditions (on a designation "d") defining each type of designation (see get_random_unpacked_primary_desigs)
+DESIGNATION_TYPE_CONDITIONS = {
+    'asteroid'  : "d !~ '^[A-Z]/'",
+    'comet'     : "d ~ '^C/'",
+    'satellite' : "d ~ '^S/'",
+}
+
+# Array layout of get_observation_statistics (one element per requested designation)
+OBSERVATION_STATISTICS_DTYPE = np.dtype([
+    ('unpacked_primary_provisional_designation', 'U32'),
+    ('n_obs',       'i4'),      # number of observations
+    ('arc_days',    'f8'),      # time from first to last observation (days)
+    ('n_c51',       'i4'),      # number of observations from C51 (WISE)
+    ('frac_c51',    'f8'),      # n_c51 / n_obs (0 if no observations)
+])
 
 class QueryOrbfitResults():
 
     def __init__(self, db_host='localhost', db_user ='postgres', db_name='vmsops'):
         """
         Initialize ...
+         - the connection is checked-out from the shared pool (see db_pool) & must be returned with db_close
+         - a failed checkout (e.g. a pool timeout) is raised here, rather than leaving an object without a connection
         """
-        try:
-            self.dbConn = psycopg2.connect(host=db_host, user=db_user, database=db_name)
-            self.dbCur = self.dbConn.cursor()
-        except (Exception, psycopg2.Error) as error :
-            error_message = "Error while connecting via QueryOrbfitResults :%r" % error
-            #send_email_exit.send_mail_exit(email_data,error_message)
+        self.dbConn = db_pool.getconn(db_host, db_user, db_name)
+        self.dbCur = self.dbConn.cursor()
 
 
-    def execute_query(self, query):
+    def execute_query(self, query, params=None):
         """
         Execute a generic supplied query
+         - params: optional parameters to be bound into the query by psycopg2 (e.g. lists for "= ANY(%s)")
+         - the transaction is ended once the data is fetched (see end_read)
         """
         try:
-            self.dbCur.execute(query)
-        except (Exception, psycopg2.Error) as error :
-            error_message = "Error while querying identification tables :%r" % error
-            #send_email_exit.send_mail_exit(email_data,error_message)
+            self.dbCur.execute(query, params)
 
-        # Fetch the data and return a list not tuples!
-        data = [r[0] for r in self.dbCur.fetchall()]
+            # Fetch the data and return a list not tuples!
+            data = [r[0] for r in self.dbCur.fetchall()]
+        finally:
+            self.end_read()
 
         return data
 
+    def execute_query_rows(self, query, params=None):
+        """
+        Execute a generic supplied query
+         - returns a list of row-tuples (rather than just the first column, as in execute_query)
+        """
+        try:
+            self.dbCur.execute(query, params)
+            rows = self.dbCur.fetchall()
+        finally:
+            self.end_read()
+
+        return rows
+
+    def end_read(self):
+        """
+        End the (read-only) transaction opened by a query
+         - otherwise a sweep would run inside a single transaction, leaving the connection
+           "idle in transaction" (holding back vacuum) & freezing now() at the sweep's start
+         - a failed query leaves the transaction aborted: this also makes the connection usable again
+        """
+        self.dbConn.rollback()
+
+    def db_close(self):
+        """ Return the connection to the shared pool """
+        self.dbCur.close()
+        db_pool.putconn(self.dbConn)
+
     def deal_with_error(self , error_message):
         """ Once development is complete, when deployed may want to send emails, log, ..."""
         print('Some kind of error occurred ...')
@@ -98,6 +145,456 @@ class QueryOrbfitResults():
         return self.execute_query(query)[0]['quality_json']
         
 
+    def has_orbfit_results(self, unpacked_primary_desigs):
+        """
+        Batch version of has_orbfit_result: a single query for a list of desigs
+        
+        returns : dictionary
+         - {unpacked_primary_desig : Boolean} for every supplied desig
+        """
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = """
+        SELECT
+            unpacked_primary_provisional_designation
+        FROM
+            orbfit_results
+        WHERE
+             unpacked_primary_provisional_designation = ANY(%s)
+        ;
+        """
+
+        # execute query and return data
+        present = set(self.execute_query(query, (unpacked_primary_desigs,)))
+        return { desig : desig in present for desig in unpacked_primary_desigs }
+
+
+    def get_element_jsons(self, unpacked_primary_desigs, column='standard_epoch_json'):
+        """
+        Element-dictionaries (as written by to_db.dict_to_insert) for a list of desigs: a single query
+
+        column : one of 'mid_epoch_json', 'standard_epoch_json', ...
+
+        returns : dictionary
+         - {unpacked_primary_desig : element-json}
+         - desigs that are not in orbfit_results are absent from the returned dictionary
+        """
+        assert column in ['mid_epoch_json','standard_epoch_json','standard_epoch_closest_to_pericenter_json','standard_epoch_closest_to_next_passage_json'] , 'The supplied column is not an element-json column ...'
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = f"""
+        SELECT to_json(t)
+        FROM (
+        SELECT
+            unpacked_primary_provisional_designation,
+            {column} AS element_json
+        FROM
+            orbfit_results
+        WHERE
+             unpacked_primary_provisional_designation = ANY(%s)
+        ) as t
+        ;
+        """
+
+        # execute query and return data
+        return { r['unpacked_primary_provisional_designation'] : r['element_json'] for r in self.execute_query(query, (unpacked_primary_desigs,)) }
+
+
+    def get_rwo_jsons(self, unpacked_primary_desigs):
+        """
+        Stored residuals (rwo_json) for a list of desigs: a single query
+
+        returns : dictionary
+         - {unpacked_primary_desig : rwo_json}
+         - desigs that are not in orbfit_results are absent from the returned dictionary
+        """
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = """
+        SELECT to_json(t)
+        FROM (
+        SELECT
+            unpacked_primary_provisional_designation,
+            rwo_json
+        FROM
+            orbfit_results
+        WHERE
+             unpacked_primary_provisional_designation = ANY(%s)
+        ) as t
+        ;
+        """
+
+        # execute query and return data
+        return { r['unpacked_primary_provisional_designation'] : r['rwo_json'] for r in self.execute_query(query, (unpacked_primary_desigs,)) }
+
+
+    def get_db_time(self):
+        """
+        Current time according to the database (a timezone-aware datetime)
+         - clock_timestamp(), not now(): now() is the start of the current transaction
+        """
+        return self.execute_query("SELECT clock_timestamp() ;")[0]
+
+
+    def get_designations_changed_since(self, observations_since, orbfit_results_since, own_writes_until=None):
+        """
+        Primary designations that have changed since the supplied times
+
+        (i)  any observation (in obs_sbn) created/updated after observations_since
+             (observations are mapped to primaries via current_identifications)
+        (ii) any orbfit_results row updated after orbfit_results_since
+             - rows updated before own_writes_until (i.e. during the previous monitoring pass) whose
+               stored observation-fingerprint matches the current observations are the checker's
+               own refits, so they are excluded (unless their observations have also changed)
+
+        observations_since, orbfit_results_since, own_writes_until : datetime or ISO-format string
+
+        returns : list
+         - unpacked primary designations
+        """
+        params = {'observations_since' : observations_since, 'orbfit_results_since' : orbfit_results_since, 'own_writes_until' : own_writes_until}
+        query = """
+        SELECT
+            DISTINCT ci.unpacked_primary_provisional_designation
+        FROM
+            obs_sbn o
+        JOIN
+            current_identifications ci
+        ON
+            ci.unpacked_secondary_provisional_designation = o.provid
+        WHERE
+            o.updated_at > %(observations_since)s::timestamptz
+        ;
+        """
+        changed = set(self.execute_query(query, params))
+
+        query = """
+        SELECT
+            unpacked_primary_provisional_designation,
+            %(own_writes_until)s::timestamptz IS NOT NULL AND updated_at <= %(own_writes_until)s::timestamptz AS during_pass
+        FROM
+            orbfit_results
+        WHERE
+            updated_at > %(orbfit_results_since)s::timestamptz
+        ;
+        """
+        refitted = []
+        for desig, during_pass in self.execute_query_rows(query, params):
+            if during_pass and desig not in changed:
+                refitted.append(desig)
+            else:
+                changed.add(desig)
+
+        # Anything written during the previous pass that was *not* fitted to the current observations
+        # (without stored fingerprints, own refits cannot be told apart from anyone else's writes)
+        if refitted and not self.has_observation_fingerprint_column():
+            changed.update(refitted)
+        elif refitted:
+            fingerprints = self.get_observation_fingerprints(refitted)
+            stored       = self.get_stored_observation_fingerprints(refitted)
+            changed.update( desig for desig in refitted if fingerprints.get(desig) is None or fingerprints.get(desig) != stored.get(desig) )
+
+        return sorted(changed)
+
+
+    def get_quality_classes(self,
+                            unpacked_primary_desigs = None,
+                            epoch_keys              = ("mid_epoch","std_epoch"),
+                            bad_problems            = ("no orbit",),
+                            intermediate_problems   = ("no CAR covariance", "no COM covariance") ):
+        """
+        Classify the quality_json of each orbit *inside* postgres
+         - 'bad'          : any of bad_problems appears in any of the epoch_keys messages
+         - 'intermediate' : otherwise, any of intermediate_problems appears
+         - 'good'         : otherwise
+        (The same substring-matching as orbit_checker.classify_quality_dict)
+
+        unpacked_primary_desigs : list or None
+         - if None, the whole of orbfit_results is classified in a single scan
+
+        returns : list
+         - compact (unpacked_primary_desig, class) tuples
+        """
+        def matches(problems):
+            return ' OR '.join( f"((quality_json::jsonb)->>'{k}') LIKE ANY(%({problems})s)" for k in epoch_keys )
+
+        params = {
+            'bad'           : [ f'%{_}%' for _ in bad_problems ],
+            'intermediate'  : [ f'%{_}%' for _ in intermediate_problems ],
+        }
+        where = ""
+        if unpacked_primary_desigs is not None:
+            params['desigs'] = [str(_) for _ in unpacked_primary_desigs]
+            where = "WHERE unpacked_primary_provisional_designation = ANY(%(desigs)s)"
+
+        query = f"""
+        SELECT
+            unpacked_primary_provisional_designation,
+            CASE
+                WHEN {matches('bad')}           THEN 'bad'
+                WHEN {matches('intermediate')}  THEN 'intermediate'
+                ELSE 'good'
+            END
+        FROM
+            orbfit_results
+        {where}
+        ;
+        """
+
+        # execute query and return data
+        return self.execute_query_rows(query, params)
+
+
+    def get_valid_unpacked_primary_desigs(self):
+        """
+        Every primary designation in primary_objects
+         - a single scan: used to build a designation_index.DesignationIndex snapshot
+        """
+        query = """
+        SELECT
+            unpacked_primary_provisional_designation
+        FROM
+            primary_objects
+        ;
+        """
+        return self.execute_query(query)
+
+
+    def get_random_unpacked_primary_desigs(self, size, seed, designation_type=None, skip_desigs=()):
+        """
+        A reproducible random sample of primary designations, drawn inside postgres
+         - the designations are ordered by md5(seed || designation) & the first *size* are returned,
+           so the same seed always gives the same sample (& a larger size extends a smaller one)
+         - only *size* rows are returned to the client (postgres keeps a top-N heap, not a full sort)
+
+        designation_type: str or None
+         - one of DESIGNATION_TYPE_CONDITIONS ('asteroid', 'comet', 'satellite'), or None for any
+
+        skip_desigs: list
+         - as well as these, designations starting with "A" or ending in " PL" are never returned
+           (as in orbit_checker.keep_designation, which also drops comets)
+        """
+        condition = DESIGNATION_TYPE_CONDITIONS[designation_type] if designation_type is not None else "TRUE"
+        query = f"""
+        SELECT
+            d
+        FROM (
+            SELECT
+                unpacked_primary_provisional_designation AS d
+            FROM
+                primary_objects
+        ) p
+        WHERE
+            left(d, 1) <> 'A'
+        AND
+            right(d, 3) <> ' PL'
+        AND
+            d <> ALL(%(skip)s)
+        AND
+            {condition}
+        ORDER BY
+            md5(%(seed)s || d)
+        LIMIT
+            %(size)s
+        ;
+        """
+        return self.execute_query(query, {'seed' : str(seed), 'size' : int(size), 'skip' : list(skip_desigs)})
+
+
+    def iterate_unpacked_primary_desigs(self, chunk_size=10000, cursor_name='stream_primary_desigs'):
+        """
+        Generator: stream every primary designation in primary_objects, chunk-by-chunk
+         - uses a named (server-side) cursor, so only chunk_size rows are ever held client-side
+           and the first chunk is available as soon as postgres starts returning rows
+         - the cursor lives inside this connection's transaction: the connection should
+           not be committed / rolled-back while the generator is being consumed
+           (so use a QueryOrbfitResults that is dedicated to the stream)
+
+        yields : list
+         - up to chunk_size unpacked primary designations
+        """
+        query = """
+        SELECT
+            unpacked_primary_provisional_designation
+        FROM
+            primary_objects
+        ;
+        """
+        with self.dbConn.cursor(name=cursor_name) as cur:
+            cur.itersize = chunk_size
+            cur.execute(query)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [ row[0] for row in rows ]
+        self.dbConn.rollback()
+
+
+    def has_table_column(self, table_name, column_name='unpacked_primary_provisional_designation'):
+        """ Whether the table exists (in the search-path) & has the supplied column """
+        query = """
+        SELECT EXISTS (
+            SELECT 1
+            FROM
+                information_schema.columns
+            WHERE
+                table_schema = ANY(current_schemas(false)) AND
+                table_name   = %s AND
+                column_name  = %s
+        )
+        ;
+        """
+        return bool(self.execute_query(query, (table_name, column_name))[0])
+
+
+    def has_observation_fingerprint_column(self):
+        """
+        Whether orbfit_results has the observation_fingerprint column (checked once per connection-object)
+         - without it, fingerprints are neither fetched nor stored, so refits of unchanged observations are not skipped
+
+        NB: the column is added with ...
+        ALTER TABLE orbfit_results ADD COLUMN observation_fingerprint text;
+        """
+        if getattr(self, '_has_observation_fingerprint_column', None) is None:
+            self._has_observation_fingerprint_column = self.has_table_column('orbfit_results', 'observation_fingerprint')
+            if not self._has_observation_fingerprint_column:
+                print('WARNING: orbfit_results has no observation_fingerprint column: unchanged observations will be refit')
+        return self._has_observation_fingerprint_column
+
+
+    def get_designations_in_table(self, table_name):
+        """
+        Every (unpacked primary) designation with an orbit in the supplied results-table
+         - a single scan: used to build a designation_index.DesignationIndex snapshot
+
+        returns : list, or None if the table (or its unpacked_primary_provisional_designation column) does not exist
+        """
+        if not self.has_table_column(table_name):
+            return None
+        query = sql.SQL("""
+        SELECT DISTINCT
+            unpacked_primary_provisional_designation
+        FROM
+            {}
+        ;
+        """).format(sql.Identifier(table_name))
+        return self.execute_query(query)
+
+
+    def get_observation_fingerprints(self, unpacked_primary_desigs):
+        """
+        Content fingerprint of the current observations of each supplied desig
+         - md5 of the (obsid, ra, dec, stn, obstime) of every observation, ordered by obsid
+         - computed server-side: only the 32-character hashes are returned
+         - observations are mapped to primaries via current_identifications
+
+        returns : dictionary
+         - {unpacked_primary_desig : fingerprint}
+         - desigs without any observations are absent from the returned dictionary
+        """
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = """
+        SELECT to_json(t)
+        FROM (
+        SELECT
+            ci.unpacked_primary_provisional_designation,
+            md5( string_agg( concat_ws(':', o.obsid, o.ra, o.dec, o.stn, o.obstime) , ',' ORDER BY o.obsid ) ) AS observation_fingerprint
+        FROM
+            obs_sbn o
+        JOIN
+            current_identifications ci
+        ON
+            ci.unpacked_secondary_provisional_designation = o.provid
+        WHERE
+            ci.unpacked_primary_provisional_designation = ANY(%s)
+        GROUP BY
+            ci.unpacked_primary_provisional_designation
+        ) as t
+        ;
+        """
+
+        # execute query and return data
+        return { r['unpacked_primary_provisional_designation'] : r['observation_fingerprint'] for r in self.execute_query(query, (unpacked_primary_desigs,)) }
+
+
+    def get_observation_statistics(self, unpacked_primary_desigs):
+        """
+        Observation count, arc-length & C51 count/fraction of each supplied desig
+         - a single aggregate query over the observations: only one row per desig is returned
+         - observations are mapped to primaries via current_identifications
+
+        returns : numpy structured array (dtype OBSERVATION_STATISTICS_DTYPE)
+         - one element per supplied desig, in the supplied order
+         - desigs without any observations have n_obs = 0
+        """
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = """
+        SELECT
+            ci.unpacked_primary_provisional_designation,
+            count(*),
+            extract(epoch FROM max(o.obstime) - min(o.obstime)) / 86400.0,
+            count(*) FILTER (WHERE o.stn = 'C51')
+        FROM
+            obs_sbn o
+        JOIN
+            current_identifications ci
+        ON
+            ci.unpacked_secondary_provisional_designation = o.provid
+        WHERE
+            ci.unpacked_primary_provisional_designation = ANY(%s)
+        GROUP BY
+            ci.unpacked_primary_provisional_designation
+        ;
+        """
+        rows = { r[0] : r[1:] for r in self.execute_query_rows(query, (unpacked_primary_desigs,)) }
+
+        stats = np.zeros(len(unpacked_primary_desigs), dtype=OBSERVATION_STATISTICS_DTYPE)
+        stats['unpacked_primary_provisional_designation'] = unpacked_primary_desigs
+        for k, desig in enumerate(unpacked_primary_desigs):
+            if desig in rows:
+                n_obs, arc_days, n_c51 = rows[desig]
+                stats['n_obs'][k], stats['arc_days'][k], stats['n_c51'][k] = n_obs, float(arc_days or 0.0), n_c51
+        stats['frac_c51'] = np.where(stats['n_obs'] > 0, stats['n_c51'] / np.maximum(stats['n_obs'], 1), 0.0)
+        return stats
+
+
+    def get_stored_observation_fingerprints(self, unpacked_primary_desigs):
+        """
+        Fingerprint of the observations used for the orbit stored in orbfit_results
+         - written in the same upsert as the orbit (the extra_columns of to_orbfit_db_tables_dev.main)
+
+        returns : dictionary
+         - {unpacked_primary_desig : fingerprint}
+         - desigs without a stored fingerprint are absent from the returned dictionary
+         - empty if orbfit_results has no observation_fingerprint column (see has_observation_fingerprint_column)
+        """
+        if not self.has_observation_fingerprint_column():
+            return {}
+        unpacked_primary_desigs = [str(_) for _ in unpacked_primary_desigs]
+
+        query = """
+        SELECT to_json(t)
+        FROM (
+        SELECT
+            unpacked_primary_provisional_designation,
+            observation_fingerprint
+        FROM
+            orbfit_results
+        WHERE
+             unpacked_primary_provisional_designation = ANY(%s)
+        AND
+             observation_fingerprint IS NOT NULL
+        ) as t
+        ;
+        """
+
+        # execute query and return data
+        return { r['unpacked_primary_provisional_designation'] : r['observation_fingerprint'] for r in self.execute_query(query, (unpacked_primary_desigs,)) }
+
+
     def get_orbit_row(self, unpacked_primary_desig):
         """
         Get entire row for supplied desig
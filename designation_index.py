@@ -0,0 +1,104 @@
+"""
+In-memory snapshot of which designations are valid & where their orbits are stored
+
+Checking a designation used to cost separate per-object queries (is_valid_unpacked_primary_desig,
+has_orbfit_result, ...). A DesignationIndex loads the whole picture in a handful of
+table-scans, once per sweep, so that the membership checks become local (O(1)) set lookups.
+
+ - The snapshot is refreshed when it is older than refresh_interval seconds (see maybe_refresh)
+ - Designations are stored as frozensets of interned strings: one copy of each designation
+   is shared by all of the sets it appears in
+"""
+
+# --------- Third-Party imports -----
+import sys
+import time
+
+
+# Tables scanned for each of the index's sets (the default: override per-index with DesignationIndex(snapshot_tables=...))
+# - a table that does not exist (or has no unpacked_primary_provisional_designation column) is skipped with a warning
+SNAPSHOT_TABLES = {
+    'orbfit_results'    : ['orbfit_results'],
+    'comet'             : ['primary_comet_orbfit_results', 'multiple_comet_orbfit_results'],
+    'satellite'         : ['satellite_orbfit_results'],
+}
+
+
+class DesignationIndex():
+    '''
+    Snapshot index of valid primary designations & of the designations in each results-table
+    '''
+
+    def __init__(self, dbConnOrbs=None, refresh_interval=3600, snapshot_tables=None):
+        """
+        dbConnOrbs: QueryOrbfitResults or None
+         - If supplied, the snapshot is loaded immediately
+
+        refresh_interval: float
+         - Age (in seconds) after which maybe_refresh reloads the snapshot
+         - None => never reload
+
+        snapshot_tables: dict or None
+         - {set-name : [tables]} for the 'orbfit_results', 'comet' & 'satellite' sets
+         - None => SNAPSHOT_TABLES
+        """
+        self.snapshot_tables    = { name : list(tables) for name, tables in (SNAPSHOT_TABLES if snapshot_tables is None else snapshot_tables).items() }
+        self.missing_tables     = []
+        self.refresh_interval   = refresh_interval
+        self.loaded_at          = None
+        self.valid_primaries    = frozenset()
+        self.orbfit_results     = frozenset()
+        self.comet              = frozenset()
+        self.satellite          = frozenset()
+        if dbConnOrbs is not None:
+            self.refresh(dbConnOrbs)
+
+
+    def refresh(self, dbConnOrbs):
+        """ (Re)load the snapshot from the database """
+        start = time.time()
+        def intern(desigs):
+            return frozenset( sys.intern(d) for d in desigs )
+
+        self.valid_primaries = intern( dbConnOrbs.get_valid_unpacked_primary_desigs() )
+        self.missing_tables  = []
+        for name in ['orbfit_results', 'comet', 'satellite']:
+            desigs = []
+            for table in self.snapshot_tables.get(name, []):
+                in_table = dbConnOrbs.get_designations_in_table(table)
+                if in_table is None:
+                    print(f'WARNING: Designation index: table {table} (or its unpacked_primary_provisional_designation column) does not exist: skipping it')
+                    self.missing_tables.append(table)
+                    continue
+                desigs.extend(in_table)
+            setattr(self, name, intern(desigs))
+
+        self.loaded_at = time.time()
+        print(f'Designation index loaded in {self.loaded_at - start:.1f}s : {len(self.valid_primaries)} primaries, ' + \
+              ', '.join( f'{len(getattr(self, name))} in {name}' for name in ['orbfit_results', 'comet', 'satellite'] ) )
+
+
+    def is_stale(self):
+        """ Whether the snapshot is older than refresh_interval (or was never loaded) """
+        if self.loaded_at is None:
+            return True
+        return self.refresh_interval is not None and time.time() - self.loaded_at > self.refresh_interval
+
+
+    def maybe_refresh(self, dbConnOrbs):
+        """ Reload the snapshot if it is stale """
+        if self.is_stale():
+            self.refresh(dbConnOrbs)
+
+
+    def is_valid_primary(self, unpacked_provisional_designation):
+        return unpacked_provisional_designation in self.valid_primaries
+
+    def in_orbfit_results(self, unpacked_provisional_designation):
+        return unpacked_provisional_designation in self.orbfit_results
+
+    def in_comet_results(self, unpacked_provisional_designation):
+        return unpacked_provisional_designation in self.comet
+
+    def in_satellite_results(self, unpacked_provisional_designation):
+        return unpacked_provisional_designation in self.satellite
@@ -0,0 +1,54 @@
+"""
+Deferred imports for heavy / optional dependencies
+
+lazy_module(name, *paths) returns a stand-in that only imports the real module
+(after inserting paths at the front of sys.path, in order) the first time one of its attributes is used.
+Code that never reaches e.g. the IOD or comet branches therefore never pays for importing them.
+
+The time taken by each deferred import is recorded in LOAD_TIMES.
+"""
+
+# --------- Third-Party imports -----
+import sys
+import time
+import importlib
+
+
+# module-name -> seconds taken to import it (on first use)
+LOAD_TIMES = {}
+
+
+class LazyModule():
+    '''
+    Stand-in for a module that is imported on first attribute access
+    '''
+
+    def __init__(self, name, *paths):
+        self.__dict__['_name']   = name
+        self.__dict__['_paths']  = paths
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            for path in self._paths:
+                if path not in sys.path:
+                    sys.path.insert(0, path)
+            self.__dict__['_module'] = importlib.import_module(self._name)
+            LOAD_TIMES[self._name] = time.perf_counter() - start
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not yet loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_module(name, *paths):
+    """ Deferred import of module *name* (any paths are added to sys.path before importing) """
+    return LazyModule(name, *paths)
@@ -0,0 +1,583 @@
+"""
+Array-backed representations of orbfit output files
+
+The dictionaries produced by orbfit_to_dict (e.g. rwo_to_dict) are the storage format
+(rwo_json, ... are always written from them), but are slow to work with for objects with
+many observations. The routines here give numpy structured arrays (one column per field)
+for the vectorized checks below.
+
+(1) RWO residual files
+    read_rwo            : .rwo file -> (header-dict, structured array)
+    rwo_dict_to_array   : rwo-dictionary (e.g. a stored rwo_json) -> structured array
+
+(2) Element files (the o2d.fel_to_dict dictionaries)
+    fel_dicts_to_arrays : N element-dictionaries -> (N,6) elements & (N,6,6) covariances (per coordinate-type)
+    check_covariances   : vectorized presence / finiteness / symmetry / positive-definiteness checks
+    fel_quality_messages: to_db.check_fel_quality messages for N element-dictionaries at once (+ optional covariance checks)
+    write_fel_file      : element-dictionaries -> orbfit (OEF2.0) element file (e.g. an initial orbit for a refit)
+
+(3) Tracklet outliers (from the RWO residuals)
+    normalized_residuals: per-observation normalized residual (chi)
+    group_tracklets     : tracklet-ids (same object & station, close in time)
+    screen_tracklets    : per-object outlying-tracklet summary for many objects in one vectorized pass
+"""
+
+# --------- Third-Party imports -----
+import json
+import numpy as np
+
+
+# --------- RWO layout --------------
+# Fixed-width layout of an optical observation record in an orbfit .rwo file
+# (name, start-column, end-column, dtype) : columns are 0-based & end-exclusive
+# The line below the "! Object   Obser ..." banner in a .rwo file labels the columns
+# (values are right-aligned to the end of their label, except the left-aligned designation):
+# ! Design   K T N YYYY MM DD.dddddddddd   Accuracy HH MM SS.sss  Accuracy      RMS  F     Bias    Resid sDD MM SS.ss  Accuracy      RMS  F     Bias    Resid Val  B   RMS  Resid Cat Cod       Chi A M
+RWO_COLUMNS = [
+    ('design',      1,  11, 'U10'),     # object designation (orbfit format, left-aligned)
+    ('obs_type',   11,  12, 'U1'),      # K : observation type (O, A, S, ...)
+    ('tech',       13,  14, 'U1'),      # T : technology
+    ('note',       15,  16, 'U1'),      # N : note
+    ('year',       17,  21, 'i2'),
+    ('month',      22,  24, 'i1'),
+    ('day',        25,  38, 'f8'),      # fractional day (UTC)
+    ('time_acc',   38,  49, 'f8'),
+    ('ra_h',       49,  52, 'i1'),
+    ('ra_m',       52,  55, 'i1'),
+    ('ra_s',       55,  62, 'f8'),
+    ('ra_acc',     62,  72, 'f8'),
+    ('ra_rms',     72,  81, 'f8'),      # a-priori RA RMS (arcsec)
+    ('ra_flag',    81,  84, 'U1'),
+    ('ra_bias',    84,  93, 'f8'),
+    ('ra_resid',   93, 102, 'f8'),      # RA residual (arcsec)
+    ('dec_sign',  103, 104, 'U1'),      # s
+    ('dec_d',     104, 106, 'i1'),
+    ('dec_m',     106, 109, 'i1'),
+    ('dec_s',     109, 115, 'f8'),
+    ('dec_acc',   115, 125, 'f8'),
+    ('dec_rms',   125, 134, 'f8'),      # a-priori Dec RMS (arcsec)
+    ('dec_flag',  134, 137, 'U1'),
+    ('dec_bias',  137, 146, 'f8'),
+    ('dec_resid', 146, 155, 'f8'),      # Dec residual (arcsec)
+    ('mag',       155, 159, 'f8'),      # NaN if no magnitude
+    ('mag_band',  159, 162, 'U1'),
+    ('mag_rms',   162, 168, 'f8'),
+    ('mag_resid', 168, 175, 'f8'),
+    ('catalog',   175, 179, 'U1'),
+    ('station',   179, 183, 'U3'),      # observatory code
+    ('chi',       183, 193, 'f8'),      # normalized residual
+    ('sel_astrom',193, 195, 'i1'),      # A : 1 if the astrometry was used in the fit
+    ('sel_mag',   195, 197, 'i1'),      # M : 1 if the magnitude was used in the fit
+]
+RWO_LINE_LENGTH = RWO_COLUMNS[-1][2]
+
+# Columns derived from the parsed fields
+RWO_DERIVED_COLUMNS = [
+    ('mjd',       'f8'),                # UTC epoch of the observation
+    ('ra_deg',    'f8'),
+    ('dec_deg',   'f8'),
+]
+
+RWO_DTYPE = np.dtype( [(name, dtype) for name, start, stop, dtype in RWO_COLUMNS] + RWO_DERIVED_COLUMNS )
+
+# Observation types that are written in a different (radar) layout & are not parsed here
+RWO_RADAR_TYPES = ('R','V')
+_OBS_TYPE_START = [ start for name, start, stop, dtype in RWO_COLUMNS if name == 'obs_type' ][0]
+
+
+def _rwo_raw_dtype():
+    ''' dtype that views each fixed-width line as a record of byte-string fields '''
+    return np.dtype({
+        'names'     : [name for name, start, stop, dtype in RWO_COLUMNS],
+        'formats'   : [f'S{stop-start}' for name, start, stop, dtype in RWO_COLUMNS],
+        'offsets'   : [start for name, start, stop, dtype in RWO_COLUMNS],
+        'itemsize'  : RWO_LINE_LENGTH,
+    })
+
+
+def _bytes_to_numbers(col, dtype):
+    ''' Convert a (stripped) byte-string column to numbers: blanks -> NaN (floats) or 0 (integers) '''
+    blank = (col == b'')
+    if np.dtype(dtype).kind == 'f':
+        return np.where(blank, b'nan', col).astype(dtype)
+    return np.where(blank, b'0', col).astype(dtype)
+
+
+def calendar_to_mjd(year, month, day):
+    '''
+    Vectorized (proleptic Gregorian) calendar date -> MJD
+     - day may be fractional
+    '''
+    year  = np.asarray(year,  dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    a     = (14 - month) // 12
+    y     = year + 4800 - a
+    m     = month + 12*a - 3
+    # Julian day number of the first of the month
+    jdn   = 1 + (153*m + 2)//5 + 365*y + y//4 - y//100 + y//400 - 32045
+    return (jdn - 2400001) + (np.asarray(day, dtype=np.float64) - 1.0)
+
+
+def rwo_lines_to_array(lines, skip_bad=True):
+    '''
+    Parse optical observation records from an rwo file into a structured array (dtype RWO_DTYPE)
+     - every line is padded/truncated to RWO_LINE_LENGTH and the whole block is
+       re-interpreted as fixed-width fields in one go, so the conversion is per-column, not per-line
+     - skip_bad: if any line cannot be parsed, the lines are re-tried one at a time and
+       the unparseable ones are dropped (otherwise the ValueError is raised)
+    '''
+    try:
+        return _rwo_lines_to_array(lines)
+    except (ValueError, OverflowError):
+        if not skip_bad:
+            raise
+    return _rwo_lines_to_array([ line for line in lines if _rwo_line_parses(line) ])
+
+
+def _rwo_line_parses(line):
+    try:
+        _rwo_lines_to_array([line])
+        return True
+    except (ValueError, OverflowError):
+        return False
+
+
+def _rwo_lines_to_array(lines):
+    arr = np.zeros(len(lines), dtype=RWO_DTYPE)
+    if not lines:
+        return arr
+
+    raw = np.array([line.ljust(RWO_LINE_LENGTH)[:RWO_LINE_LENGTH].encode('ascii', 'replace') for line in lines], dtype=f'S{RWO_LINE_LENGTH}')
+    fields = raw.view(_rwo_raw_dtype())
+
+    for name, start, stop, dtype in RWO_COLUMNS:
+        col = np.char.strip(fields[name])
+        if np.dtype(dtype).kind == 'U':
+            arr[name] = np.char.decode(col, 'ascii')
+        else:
+            arr[name] = _bytes_to_numbers(col, dtype)
+
+    # Derived columns
+    arr['mjd']     = calendar_to_mjd(arr['year'], arr['month'], arr['day'])
+    arr['ra_deg']  = 15.0 * ( arr['ra_h'] + arr['ra_m']/60.0 + arr['ra_s']/3600.0 )
+    arr['dec_deg'] = np.where(arr['dec_sign'] == '-', -1.0, 1.0) * ( arr['dec_d'] + arr['dec_m']/60.0 + arr['dec_s']/3600.0 )
+    return arr
+
+
+def read_rwo(filepath):
+    '''
+    Read an orbfit .rwo file in a single pass
+
+    returns:
+    --------
+    header : dict
+     - the "key = value" lines before END_OF_HEADER
+    arr    : numpy structured array (dtype RWO_DTYPE)
+     - one element per optical observation
+     - radar observations & unparseable lines are skipped (the latter with a warning)
+    '''
+    header, lines = {}, []
+    with open(filepath) as fh:
+        in_header = True
+        for line in fh:
+            if in_header:
+                if line.startswith('END_OF_HEADER'):
+                    in_header = False
+                elif '=' in line:
+                    k, v = line.split('=', 1)
+                    header[k.strip()] = v.split('!')[0].strip().strip("'")
+                continue
+            if line.startswith('!') or not line.strip() or line[_OBS_TYPE_START:_OBS_TYPE_START+1] in RWO_RADAR_TYPES:
+                continue
+            lines.append(line.rstrip('\n'))
+
+    arr = rwo_lines_to_array(lines)
+    if len(arr) < len(lines):
+        print(f'WARNING: {filepath} : skipped {len(lines) - len(arr)} unparseable line(s)')
+    return header, arr
+
+
+# Keys (lower-case, alphanumerics only) under which a per-observation dictionary may hold each RWO field
+# - the RWO_DTYPE names themselves (e.g. 'ra_resid' or 'RA_resid') & the unambiguous labels of the .rwo banner
+# - single-letter banner labels (K, T, N, A, M, B) & bare 'ra' / 'dec' (units unknown) are deliberately not matched
+RWO_KEY_ALIASES = {
+    'design'     : ['designation'],
+    'obs_type'   : ['obstype'],
+    'mag_band'   : ['magband'],
+    'station'    : ['cod', 'obscode'],
+    'sel_astrom' : ['selastrom'],
+    'sel_mag'    : ['selmag'],
+}
+_RWO_KEY_TO_FIELD = { alias : field for field, aliases in RWO_KEY_ALIASES.items() for alias in aliases }
+_RWO_KEY_TO_FIELD.update( { ''.join(c for c in name if c.isalnum()) : name for name in RWO_DTYPE.names } )
+
+# Keys under which a dictionary may hold its list of observations
+_RWO_RECORD_KEYS = ['observations', 'optical', 'records']
+
+# Fields from which a normalized residual can be formed (see normalized_residuals): one of these sets must be present
+_RWO_RESIDUAL_FIELDS = [ ['chi'], ['ra_resid', 'ra_rms', 'dec_resid', 'dec_rms'] ]
+
+
+def _normalize_key(key):
+    return ''.join( c for c in str(key).lower() if c.isalnum() )
+
+
+def _rwo_records(rwodict):
+    '''
+    The per-observation records of an rwo-dictionary: a list of dicts (field -> value) and/or raw .rwo lines
+     - a list of records
+     - {'observations' (or 'optical', 'records') : records, ...}
+     - { key : record, ... } (e.g. keyed by observation number; a 'header' & any other non-record values are ignored)
+     - column-oriented { field : [values], ... }
+    '''
+    if isinstance(rwodict, list):
+        return rwodict
+    if not isinstance(rwodict, dict) or not rwodict:
+        return []
+
+    for key in rwodict:
+        if _normalize_key(key) in _RWO_RECORD_KEYS and isinstance(rwodict[key], (list, dict)):
+            records = rwodict[key]
+            return _rwo_records(records) if isinstance(records, dict) else records
+
+    records = [ v for k, v in rwodict.items() if (isinstance(v, dict) and _normalize_key(k) != 'header') or (isinstance(v, str) and len(v) > _OBS_TYPE_START) ]
+    if records:
+        return records
+
+    columns = { k : v for k, v in rwodict.items() if isinstance(v, list) and _normalize_key(k) in _RWO_KEY_TO_FIELD }
+    if columns and len(set(len(v) for v in columns.values())) == 1:
+        n = len(next(iter(columns.values())))
+        return [ { k : v[i] for k, v in columns.items() } for i in range(n) ]
+
+    for v in rwodict.values():
+        if isinstance(v, list) and v and isinstance(v[0], (dict, str)):
+            return v
+    return []
+
+
+def _as_number(v, kind):
+    try:
+        return (float if kind == 'f' else int)(v) if v is not None and str(v).strip() != '' else (np.nan if kind == 'f' else 0)
+    except (TypeError, ValueError):
+        return np.nan if kind == 'f' else 0
+
+
+def rwo_dict_to_array(rwodict):
+    '''
+    Convert an rwo-dictionary (e.g. a stored rwo_json or the 'rwodict' of an update_wrapper result) to a structured array
+     - see _rwo_records for the shapes recognized
+     - the keys of each observation are matched to the RWO fields by name (see RWO_KEY_ALIASES)
+     - records that are raw .rwo lines are parsed with rwo_lines_to_array
+     - fields absent from the dictionary are left as zero / empty (NaN for floats);
+       mjd, ra_deg & dec_deg are derived from the calendar / sexagesimal fields if not supplied
+     - radar observations are dropped
+     - raises ValueError if no observations can be found in a non-empty rwodict, or if there are
+       observation-dictionaries but no residual fields (chi, or the RA & Dec residuals & RMS) are recognized:
+       screening them would otherwise silently find no outliers
+    '''
+    records = _rwo_records(rwodict)
+    if rwodict and not records:
+        raise ValueError(f'rwo-dictionary: no observation records recognized (keys {sorted(map(str, rwodict))[:10]})')
+    lines   = [ r for r in records if isinstance(r, str) ]
+    dicts   = [ r for r in records if isinstance(r, dict) ]
+
+    arr = np.zeros(len(dicts), dtype=RWO_DTYPE)
+    for name in RWO_DTYPE.names:
+        if RWO_DTYPE[name].kind == 'f':
+            arr[name] = np.nan
+    if dicts:
+        present = {}
+        for k in set().union(*dicts):
+            field = _RWO_KEY_TO_FIELD.get(_normalize_key(k))
+            if field is not None and field not in present:
+                present[field] = k
+        if not any( all( f in present for f in fields ) for fields in _RWO_RESIDUAL_FIELDS ):
+            raise ValueError(f'rwo-dictionary: no residual fields recognized among the observation keys {sorted(set().union(*dicts))}')
+        for field, k in present.items():
+            kind   = RWO_DTYPE[field].kind
+            values = [ obs.get(k) for obs in dicts ]
+            arr[field] = [ _as_number(v, kind) for v in values ] if kind in 'fi' else [ '' if v is None else str(v).strip() for v in values ]
+
+        if 'mjd' not in present and all( f in present for f in ['year', 'month', 'day'] ):
+            arr['mjd'] = calendar_to_mjd(arr['year'], arr['month'], arr['day'])
+        if 'ra_deg' not in present and all( f in present for f in ['ra_h', 'ra_m', 'ra_s'] ):
+            arr['ra_deg'] = 15.0 * ( arr['ra_h'] + arr['ra_m']/60.0 + arr['ra_s']/3600.0 )
+        if 'dec_deg' not in present and all( f in present for f in ['dec_d', 'dec_m', 'dec_s'] ):
+            arr['dec_deg'] = np.where(arr['dec_sign'] == '-', -1.0, 1.0) * ( arr['dec_d'] + arr['dec_m']/60.0 + arr['dec_s']/3600.0 )
+        if 'sel_astrom' not in present:
+            arr['sel_astrom'] = 1
+
+    if lines:
+        lines = [ l for l in lines if not l.startswith('!') and l[_OBS_TYPE_START:_OBS_TYPE_START+1] not in RWO_RADAR_TYPES ]
+        arr   = np.concatenate([ arr , rwo_lines_to_array(lines) ])
+
+    return arr[ ~np.isin(arr['obs_type'], RWO_RADAR_TYPES) ]
+
+
+# --------- Element-file layout -----
+# Coordinate-types in an o2d.fel_to_dict dictionary (each a dict of 'element0'..'element5' & 'cov00'..'cov55')
+FEL_COORD_TYPES = ['EQU','KEP','CAR','COM','COT']
+
+
+def fel_dicts_to_arrays(feldicts, coordtype):
+    '''
+    Pack the elements & covariances of one coordinate-type from N element-dictionaries
+
+    returns:
+    --------
+    elements    : (N,6) float array  (NaN where absent)
+    covariances : (N,6,6) float array (NaN where absent)
+     - a covariance stored as only one triangle (covij with i<=j) is mirrored into the other
+    '''
+    n           = len(feldicts)
+    elements    = np.full((n,6),   np.nan)
+    covariances = np.full((n,6,6), np.nan)
+    for k, feldict in enumerate(feldicts):
+        d = feldict.get(coordtype) if feldict else None
+        if not d:
+            continue
+        for i in range(6):
+            v = d.get(f'element{i}')
+            if v is not None:
+                elements[k,i] = v
+        if 'cov00' in d:
+            for i in range(6):
+                for j in range(6):
+                    v = d.get(f'cov{i}{j}', d.get(f'cov{j}{i}'))
+                    if v is not None:
+                        covariances[k,i,j] = v
+    return elements, covariances
+
+
+def check_covariances(elements, covariances, rtol=1e-8):
+    '''
+    Vectorized checks on N orbits (see fel_dicts_to_arrays)
+
+    returns : dict of (N,) boolean arrays
+     - 'has_elements'       : all 6 elements present
+     - 'has_covariance'     : any covariance present
+     - 'finite'             : elements & covariance all finite
+     - 'symmetric'          : |R - R^T| <= rtol for the correlation matrix R (see below)
+     - 'positive_definite'  : positive variances & smallest eigenvalue of R > rtol * largest
+                              (only evaluated for finite, symmetric matrices)
+     - 'usable'             : has_covariance & finite & symmetric & positive_definite
+
+    The elements have mixed units (e.g. AU & degrees), so the variances can differ by many orders of magnitude:
+    the symmetry & definiteness tests are made on the correlation matrix R = D C D, with D = diag(1/sqrt(C_ii)),
+    rather than on the raw covariance
+    '''
+    has_elements    = np.all(np.isfinite(elements), axis=1)
+    has_covariance  = np.any(np.isfinite(covariances), axis=(1,2))
+    finite          = has_elements & np.all(np.isfinite(covariances), axis=(1,2))
+
+    filled          = np.where(np.isfinite(covariances), covariances, 0.0)
+    variances       = np.diagonal(filled, axis1=1, axis2=2)
+    positive_var    = finite & np.all(variances > 0, axis=1)
+    inv_sigma       = np.where(variances > 0, 1.0 / np.sqrt(np.where(variances > 0, variances, 1.0)), 0.0)
+    correlations    = filled * inv_sigma[:, :, None] * inv_sigma[:, None, :]
+    asymmetry       = np.max(np.abs(correlations - np.swapaxes(correlations, 1, 2)), axis=(1,2))
+    symmetric       = finite & (asymmetry <= rtol)
+
+    positive_definite = np.zeros(len(covariances), dtype=bool)
+    testable          = symmetric & positive_var
+    if np.any(testable):
+        eig = np.linalg.eigvalsh(correlations[testable])
+        positive_definite[testable] = eig[:,0] > rtol * eig[:,-1]
+
+    return {
+        'has_elements'      : has_elements,
+        'has_covariance'    : has_covariance,
+        'finite'            : finite,
+        'symmetric'         : symmetric,
+        'positive_definite' : positive_definite,
+        'usable'            : has_covariance & finite & symmetric & positive_definite,
+    }
+
+
+def fel_quality_messages(feldicts, coordtypes=FEL_COORD_TYPES, check_usable=False):
+    '''
+    Quality messages for N element-dictionaries
+     - by default, exactly the messages of the original to_db.check_fel_quality (i.e. those stored in quality_json):
+       'ok', 'no orbit', 'no CAR' (no entries), 'no CAR covariance' (element0 but no cov00), ...
+     - check_usable=True also appends 'unusable CAR covariance' (etc) for a covariance that is present but
+       non-finite, asymmetric or not positive-definite (see check_covariances: one vectorized pass per coordinate-type)
+
+    returns : list of N strings
+    '''
+    problems = [ [] for _ in feldicts ]
+    for coordtype in coordtypes:
+        for k, feldict in enumerate(feldicts):
+            d = feldict.get(coordtype) if feldict else None
+            if not d:
+                problems[k].append('no '+coordtype)
+            elif 'element0' in d and 'cov00' not in d:
+                problems[k].append('no '+coordtype+' covariance')
+        if check_usable:
+            checks = check_covariances(*fel_dicts_to_arrays(feldicts, coordtype))
+            for k in np.flatnonzero(checks['has_covariance'] & ~checks['usable']):
+                problems[k].append('unusable '+coordtype+' covariance')
+
+    return [ 'no orbit' if not feldict else (', '.join(p) if p else 'ok') for feldict, p in zip(feldicts, problems) ]
+
+
+# Coordinate-types orbfit accepts as an initial orbit, in order of preference
+INITIAL_ORBIT_COORD_TYPES = ['EQU','KEP','CAR','COM']
+
+
+def _fel_epoch(feldict, coordtype):
+    ''' The MJD epoch of a coordinate-type (its own 'epoch', else the dictionary's), or None if missing / not a number '''
+    try:
+        epoch = float(feldict[coordtype].get('epoch', feldict.get('epoch')))
+    except (TypeError, ValueError):
+        return None
+    return epoch if np.isfinite(epoch) else None
+
+
+def write_fel_file(filepath, feldicts, coordtypes=FEL_COORD_TYPES, first_only=False):
+    '''
+    Write element-dictionaries as a single orbfit multi-line (OEF2.0) element file
+     - feldicts: {orbfit-name : element-dictionary}
+     - the epoch is taken from the coordinate-type's own 'epoch' (if any), else the dictionary's 'epoch'
+     - a coordinate-type without a usable epoch is not written (objects left with none are skipped with a warning)
+     - the covariance (upper triangle) is only written where present
+     - first_only=True writes only the first of coordtypes present for each object
+       (e.g. coordtypes=INITIAL_ORBIT_COORD_TYPES for an initial-orbit file)
+
+    returns : list of the names written (objects without any of coordtypes are skipped)
+    '''
+    lines = [
+        "format  = 'OEF2.0'       ! file format",
+        "rectype = 'ML'           ! record type (1L/ML)",
+        "refsys  = ECLM J2000     ! default reference system",
+        "END_OF_HEADER",
+    ]
+    written = []
+    for name, feldict in feldicts.items():
+        present = [ c for c in coordtypes if feldict and feldict.get(c) and all( f'element{i}' in feldict[c] for i in range(6) ) ]
+        epochs  = { c : _fel_epoch(feldict, c) for c in present }
+        if present and not any( epoch is not None for epoch in epochs.values() ):
+            print(f'WARNING: {name} : no usable epoch: not written to {filepath}')
+        present = [ c for c in present if epochs[c] is not None ]
+        if first_only:
+            present = present[:1]
+        if not present:
+            continue
+        written.append(name)
+        lines.append(name)
+        for coordtype in present:
+            d     = feldict[coordtype]
+            lines.append(f"! {coordtype} elements")
+            lines.append(f" {coordtype} " + ' '.join( f"{d[f'element{i}']:22.15E}" for i in range(6) ))
+            lines.append(f" MJD     {epochs[coordtype]:15.9f} TDT")
+            if 'cov00' in d:
+                upper = [ d.get(f'cov{i}{j}', d.get(f'cov{j}{i}')) for i in range(6) for j in range(i, 6) ]
+                for k in range(0, len(upper), 3):
+                    lines.append(" COV " + ' '.join( f"{_:24.16E}" for _ in upper[k:k+3] ))
+    with open(filepath, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    return written
+
+
+# --------- Tracklet outliers -------
+# Observations of an object from the same station are in the same tracklet unless separated by more than this
+TRACKLET_MAX_GAP_DAYS   = 0.5
+
+# A tracklet is an outlier if the RMS of its normalized residuals exceeds this
+TRACKLET_CHI_THRESHOLD  = 3.0
+
+# If more than this fraction of an object's observations are in outlying tracklets,
+# removing them may leave too little to fit (=> status 101 rather than 201)
+TRACKLET_SIGNIFICANT_FRACTION = 0.25
+
+
+def normalized_residuals(arr):
+    '''
+    Per-observation normalized residual
+     - the orbfit 'chi' column where available,
+     - otherwise sqrt( (ra_resid/ra_rms)^2 + (dec_resid/dec_rms)^2 ) / sqrt(2)
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        computed = np.sqrt( ( (arr['ra_resid']/arr['ra_rms'])**2 + (arr['dec_resid']/arr['dec_rms'])**2 ) / 2.0 )
+    return np.where(np.isfinite(arr['chi']) & (arr['chi'] > 0), arr['chi'], computed)
+
+
+def group_tracklets(object_ids, stations, mjd, max_gap_days=TRACKLET_MAX_GAP_DAYS):
+    '''
+    Assign a tracklet-id to every observation (vectorized: one sort)
+     - a new tracklet starts whenever the object or station changes, or the time since the
+       previous observation (of that object from that station) exceeds max_gap_days
+
+    returns : (N,) int array of tracklet-ids (0 .. n_tracklets-1), in the input order
+    '''
+    n = len(mjd)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    order  = np.lexsort((mjd, stations, object_ids))
+    o, s, t = object_ids[order], stations[order], mjd[order]
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = (o[1:] != o[:-1]) | (s[1:] != s[:-1]) | (np.diff(t) > max_gap_days)
+    ids = np.empty(n, dtype=np.int64)
+    ids[order] = np.cumsum(starts) - 1
+    return ids
+
+
+def screen_tracklets(arrays,
+                     chi_threshold          = TRACKLET_CHI_THRESHOLD,
+                     max_gap_days           = TRACKLET_MAX_GAP_DAYS,
+                     significant_fraction   = TRACKLET_SIGNIFICANT_FRACTION):
+    '''
+    Find outlying tracklets for many objects at once
+     - arrays: list of RWO structured arrays (one per object, e.g. from read_rwo or rwo_dict_to_array)
+     - all observations are concatenated & grouped into tracklets in one pass;
+       per-tracklet & per-object statistics are accumulated with bincount
+
+    returns : dict of (n_objects,) arrays
+     - 'n_obs', 'n_tracklets', 'n_bad_tracklets', 'n_obs_in_bad_tracklets', 'frac_obs_in_bad_tracklets'
+     - 'max_tracklet_chi'    : the largest tracklet RMS normalized residual
+     - 'has_bad_tracklets'   : any outlying tracklet
+     - 'significant'         : frac_obs_in_bad_tracklets > significant_fraction
+    '''
+    n_objects  = len(arrays)
+    lengths    = np.array([ len(a) for a in arrays ], dtype=np.int64)
+    if lengths.sum() == 0:
+        zeros = np.zeros(n_objects)
+        return { 'n_obs' : lengths , 'n_tracklets' : zeros.astype(np.int64) , 'n_bad_tracklets' : zeros.astype(np.int64) ,
+                 'n_obs_in_bad_tracklets' : zeros.astype(np.int64) , 'frac_obs_in_bad_tracklets' : zeros , 'max_tracklet_chi' : zeros ,
+                 'has_bad_tracklets' : zeros.astype(bool) , 'significant' : zeros.astype(bool) }
+
+    obs        = np.concatenate([ a for a in arrays if len(a) ])
+    object_ids = np.repeat(np.arange(n_objects), lengths)
+    chi        = normalized_residuals(obs)
+    valid      = np.isfinite(chi)
+
+    tracklet   = group_tracklets(object_ids, obs['station'], obs['mjd'], max_gap_days=max_gap_days)
+    n_tracklet = tracklet.max() + 1
+    t_nobs     = np.bincount(tracklet, minlength=n_tracklet)
+    t_nvalid   = np.bincount(tracklet, weights=valid, minlength=n_tracklet)
+    t_chi2     = np.bincount(tracklet, weights=np.where(valid, chi**2, 0.0), minlength=n_tracklet)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_rms  = np.where(t_nvalid > 0, np.sqrt(t_chi2 / t_nvalid), 0.0)
+    t_bad      = t_rms > chi_threshold
+
+    # Object owning each tracklet
+    t_object   = np.zeros(n_tracklet, dtype=np.int64)
+    t_object[tracklet] = object_ids
+
+    n_bad      = np.bincount(t_object, weights=t_bad,               minlength=n_objects).astype(np.int64)
+    n_in_bad   = np.bincount(t_object, weights=t_bad * t_nobs,      minlength=n_objects).astype(np.int64)
+    n_trk      = np.bincount(t_object,                              minlength=n_objects)
+    max_chi    = np.zeros(n_objects)
+    np.maximum.at(max_chi, t_object, t_rms)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac   = np.where(lengths > 0, n_in_bad / lengths, 0.0)
+
+    return {
+        'n_obs'                     : lengths,
+        'n_tracklets'               : n_trk,
+        'n_bad_tracklets'           : n_bad,
+        'n_obs_in_bad_tracklets'    : n_in_bad,
+        'frac_obs_in_bad_tracklets' : frac,
+        'max_tracklet_chi'          : max_chi,
+        'has_bad_tracklets'         : n_bad > 0,
+        'significant'               : frac > significant_fraction,
+    }
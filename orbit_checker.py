@@ -15,12 +15,19 @@ MJP 2021-02-24
 """
         
 # --------- Third-Party imports -----
+import time
+_IMPORT_STARTED = time.perf_counter()
 import sys
 import os
 import numpy as np
 import subprocess
 import json
 import glob
+import itertools
+import shutil
+import multiprocessing.util
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 # --------- Local imports -----------
 import mpc_convert as mc
@@ -29,18 +36,48 @@ sys.path.insert(0,'/share/apps/identifications_pipeline/dbchecks/')
 import query_ids
 import db_query_orbits_dev as query_orbs
 
-sys.path.insert(0,'/sa/orbit_pipeline/')
-import update_wrapper
-import update_existing_orbits
-import orbfit_to_dict as o2d
+import sweep_journal
+import checker_metrics
+import sweep_profiler
+import designation_index
+import orbfit_arrays as oa
+from lazy_imports import lazy_module
 
-sys.path.insert(0,'/sa/orbit_utils/')
-import iod_wrapper_mjp as iod
-import comet_orbits_mjp as comet
+# Heavy dependencies: only imported when a code-path first uses them (see lazy_imports)
+update_wrapper          = lazy_module('update_wrapper',                     '/sa/orbit_pipeline/')
+update_existing_orbits  = lazy_module('update_existing_orbits',             '/sa/orbit_pipeline/')
+o2d                     = lazy_module('orbfit_to_dict',                     '/sa/orbit_pipeline/')
+iod                     = lazy_module('iod_wrapper_mjp',                    '/sa/orbit_utils/')
+comet                   = lazy_module('comet_orbits_mjp',                   '/sa/orbit_utils/')
+to_db                   = lazy_module('to_orbfit_db_tables_dev',            '/sa/orbit_pipeline/')
+newsub                  = lazy_module('mpc_new_processing_sub_directory',   '/sa/orbit_pipeline/', '/sa/orbit_utils/')
 
-import to_orbfit_db_tables_dev as to_db
+# Time taken to import this module (c.f. STARTUP_BUDGET_SECONDS, checked by benchmark_orbit_checker)
+STARTUP_BUDGET_SECONDS  = 0.5
+STARTUP_SECONDS         = time.perf_counter() - _IMPORT_STARTED
 
-import mpc_new_processing_sub_directory as newsub
+
+# Substrings in the quality_json messages (see to_db.check_fel_quality) that define the quality of an orbit
+QUALITY_EPOCH_KEYS              = ["mid_epoch","std_epoch"]
+QUALITY_PROBLEMS_BAD            = ["no orbit"]
+QUALITY_PROBLEMS_INTERMEDIATE   = ["no CAR covariance", "no COM covariance"]
+
+
+# Designations that are excluded from ALL / RANDOM sweeps (see keep_designation)
+SKIP_DESIGNATIONS = ['2014 QT388','2019 FH14']
+
+
+# Pre-fit triage settings (see triage_designation): change them via configure_triage(...)
+TRIAGE_CONFIG = {
+    'enabled'               : True,
+    'max_nobs_no_fit'       : 3,        # objects with n_obs <= this are not fitted
+    'min_arc_days_for_fit'  : 1.0,      # objects with an arc shorter than this (days) are not fitted
+    'route_no_orbit'        : 'fit',    # objects without a stored orbit: 'fit' (extension first) or 'iod' (straight to IOD: NB the IOD path is still WIP)
+}
+
+
+# Stored element-json columns used (in order of preference) as the initial orbit of a warm-started refit (see write_initial_orbits)
+WARM_START_COLUMNS = ['standard_epoch_json', 'mid_epoch_json']
 
 
 # Codes to define possible orbit/designation "status"
@@ -73,7 +110,16 @@ def generate_status_code(assessment_dict):
     # If we have STANDARD ASTEROID results ...
     if assessment_dict['IS_IN_ORBFIT_RESULTS']:
         
-        if assessment_dict['HAS_GOOD_QUALITY_DICT']:
+        if assessment_dict.get('HAS_NOBS_LTE_10') or assessment_dict.get('HAS_ARC_LTE_2_DAY'):
+            status = '100'  # "Orbit Poor:   Short-Arc / Few observations",
+
+        elif assessment_dict.get('HAS_BAD_TRACKLETS') and assessment_dict.get('HAS_SIGNIFICANT_BAD_TRACKLETS'):
+            status = '101'  # "Orbit Poor:   Significant fraction of observations in outlying tracklet: ...",
+
+        elif assessment_dict['HAS_GOOD_QUALITY_DICT'] and assessment_dict.get('HAS_BAD_TRACKLETS'):
+            status = '201'  # "Good Orbit Exists: Orbit consistent with most observations (one or more tracklets to be dealt with)",
+
+        elif assessment_dict['HAS_GOOD_QUALITY_DICT']:
             status = '299'  # "Good Orbit Exists: As yet unclassified",
 
         elif assessment_dict['HAS_BAD_QUALITY_DICT'] or assessment_dict['HAS_INTERMEDIATE_QUALITY_DICT']:
@@ -90,6 +136,12 @@ def generate_status_code(assessment_dict):
         status = '099'  #  "Orbit Absent: Reason for absence has not been established",
 
     # --- --- --- If we have NO results at all --- --- ---
+    elif assessment_dict['HAS_NO_RESULTS'] and assessment_dict.get('HAS_NO_OBS'):
+        status = '001'  #  "Orbit Absent: No known observations",
+
+    elif assessment_dict['HAS_NO_RESULTS'] and assessment_dict.get('HAS_NOBS_LTE_3'):
+        status = '002'  #  "Orbit Absent: Orbfit IOD Failed: N_obs <= 3",
+
     elif assessment_dict['HAS_NO_RESULTS']:
         status = '099'  #  "Orbit Absent: Reason for absence has not been established",
 
@@ -101,77 +153,730 @@ def generate_status_code(assessment_dict):
     
 
 
-def check_multiple_designations( method = None , size=0 ):
+def open_db_connections(read_only=False):
     """
-    Outer loop-function to allow us to check a long list of designations
-     - Most of the code in here is just to create some lists of designations to check
-     
-    
+    Open the set of connection objects that check_single_designation needs
+    (i)   to PP's ID-Query routines ...
+    (ii)  to MJP's Orb-Query routines ...
+    (iii) to the orbit-update (upsert) routines
+    NB: (ii) & (iii) draw their connections from the shared pool (see db_pool)
+    read_only=True => (iii) is not opened (None)
     """
-    
-    # Setting up connection objects...
-    # (i)to PP's ID-Query routines ...
-    # (ii) to MJP's Orb-Query routines ...
     dbConnQueryIDs   = query_ids.QueryCurrentID()
     dbConnQueryOrbs  = query_orbs.QueryOrbfitResults()
-    dbConnUpdateOrbs = to_db.DBConnect()
+    dbConnUpdateOrbs = to_db.DBConnect() if not read_only else None
+    return dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs
 
 
+def close_db_connections(*connection_objects):
+    """
+    Return the pooled connections of some connection objects (e.g. those of open_db_connections) to the pool
+     - None & objects without a pooled connection (e.g. the ID-Query routines) are skipped
+    """
+    for connection_object in connection_objects:
+        if connection_object is not None and hasattr(connection_object, 'db_close'):
+            connection_object.db_close()
 
-    # Get a list of primary designations from the current_identifications table in the database
-    if method in ['ALL' ,'RANDOM']:
 
-        # --------- SOME ONE-OFF DESIGNATIONS WITH VARIOUS ISSUES. USEFUL WHILE TESTING ---------
-        #primary_designations_array =  np.array(['2015 XX229'])###, "2015 KX97" cauused some error ...
-        # primary_designations_array =  np.array(['2008 WJ19'] )###, "2008 WJ19"  was not in the db & went to IOD & IOD worked & dict inserted !
-        # primary_designations_array =  np.array(['2016 QW66'] )###, "2016 QW66"  is not in the db & will go to IOD & IOD will fail
-        primary_designations_array =  np.array(['2006 WU224'])###, "2006 WU224" is already in the db: Fit selects 52/57 obs: May be useful for understanding bad-tracklets
-        # primary_designations_array =  np.array(['2015 XX229'])###, "2015 XX229" has only 7 obs & no orbit ...
-        # primary_designations_array =  np.array(['2007 FA'])###
+def check_multiple_designations( method = None , size=0 , workers=1 , chunk_size=1000 , journal_path=None , watermark_path='orbit_checker_watermark.json' , batch_size=1 , index_refresh_interval=3600 , index_tables=None , seed=None , strata=None , metrics_path=None , metrics_interval=60 , profile_dir=None , profile_every=1 , profile_cpu=True , profile_memory=False , status_only=False , status_report_path='orbit_checker_status_report.tsv' , screen_tracklets=False , observation_statistics=False , warm_start=False ):
+    """
+    Outer loop-function to allow us to check a long list of designations
+     - Most of the code in here is just to create some lists of designations to check
 
+    method: string
+     - 'ALL', 'RANDOM', 'COMET' or
+     - 'MONITOR' : only check designations that have new/updated observations, or an
+                   updated orbfit_results row, since the previous MONITOR pass
+                   (the high-water marks are persisted in watermark_path)
+     
+    size: int
+     - number of designations to check for the 'RANDOM' and 'COMET' methods
+
+    seed: str/int or None
+     - 'RANDOM' draws its sample inside the database, ordered by a hash keyed on the seed:
+       the same seed reproduces the same sample (if None, a seed is generated & printed)
+
+    strata: dict or None
+     - 'RANDOM' sample sizes per designation type, e.g. {'asteroid' : 90, 'comet' : 5, 'satellite' : 5}
+     - If None, *size* designations are drawn irrespective of type
+
+    workers: int
+     - If workers == 1 (default), designations are checked one-at-a-time in this process
+     - If workers  > 1, designations are spread over a pool of worker processes
+       (each with its own db-connections & orbfit proc_subdir)
+       and the status codes are reported in the order in which the checks complete
+
+    chunk_size: int
+     - designations are processed in chunks: the existence & quality of any
+       database-orbit is fetched for a whole chunk in a single query
+
+    batch_size: int
+     - the standard-asteroid extension fits for up to batch_size designations are
+       run in a single update_wrapper call (amortizing its per-run set-up costs)
+       and the multi-object result is then split back into per-designation assessments
+
+    index_refresh_interval: float or None
+     - the validity & existence of each designation are looked-up in a DesignationIndex snapshot
+       (loaded once per sweep), rather than queried per object
+     - the snapshot is reloaded when it is older than index_refresh_interval seconds (None => never)
+     - index_tables: {set-name : [tables]} scanned for the snapshot (None => designation_index.SNAPSHOT_TABLES);
+       missing tables are skipped with a warning
+
+    journal_path: string or None
+     - If supplied, progress is checkpointed to this (SQLite) journal (see sweep_journal)
+     - Re-running with the same journal skips the designations that were finished,
+       and re-checks any that were in-flight (e.g. when a crash happened) first
+
+    metrics_path: string or None
+     - per-stage timings, outcomes & status-codes are aggregated for the whole sweep (see checker_metrics)
+       and a summary is printed at the end
+     - If supplied, the metrics are also rewritten to this file every metrics_interval seconds
+       (Prometheus text format if the path ends in '.prom', otherwise json)
+
+    profile_dir: string or None
+     - If supplied, every profile_every'th check_single_designation call (in each process)
+       is run under cProfile (profile_cpu) and/or tracemalloc (profile_memory)
+     - At the end, the profiles of all processes are merged into profile_dir/combined.prof
+       and the top allocation sites are written to profile_dir/top_allocations.txt (see sweep_profiler)
+
+    status_only: Boolean
+     - If True, orbfit is never run & nothing is written to the db: the status of each designation
+       is generated from the database assessment alone (see report_database_statuses)
+       and written to status_report_path (the journal, metrics & profiling options are ignored)
+     - For method='ALL' this needs a single pass over orbfit_results
+     - screen_tracklets=True also screens the stored residuals for outlying tracklets (status 101/201 candidates)
+     - observation_statistics=True also aggregates the observations of each chunk (obs_sbn) for the
+       observation-count / arc flags (status 002 / 100); this is off by default, as it is a second
+       large scan per chunk
+
+    warm_start: Boolean
+     - If True, the stored orbit (see WARM_START_COLUMNS) is written out as the initial orbit
+       of each extension refit, so that orbfit starts from the stored solution (see initial_orbits_file)
+     - IOD is only attempted for objects without a stored orbit, so it always starts from scratch
+
+    returns:
+    --------
+    statuses: dict
+     - status-code for each checked designation (None if the check crashed in a worker)
+    """
+    
+    # Setting up connection objects...
+    # (every pooled connection is returned to the pool when the sweep ends, however it ends)
+    dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs = open_db_connections(read_only=status_only)
+    dbConnStream = None
+    try:
+
+        # --------- SOME ONE-OFF DESIGNATIONS WITH VARIOUS ISSUES. USEFUL WHILE TESTING ---------
+        # "2015 XX229" : 7 obs & no orbit ... ; "2015 KX97" caused some error ...
+        # "2008 WJ19"  : was not in the db & went to IOD & IOD worked & dict inserted !
+        # "2016 QW66"  : is not in the db & will go to IOD & IOD will fail
+        # "2006 WU224" : is already in the db: Fit selects 52/57 obs: May be useful for understanding bad-tracklets
+
+        # Stream the primary designations from the primary_objects table in the database
+        # NB: A dedicated connection, as its server-side cursor must outlive the commits made while checking
+        if method == 'ALL':
+            print("\n... Streaming all primary designations from db ... ")
+            dbConnStream = query_orbs.QueryOrbfitResults()
+            primary_designations_array = stream_primary_designations( dbConnStream , chunk_size=chunk_size )
         
-        '''
-        print("\n... Searching db for all primary designations ... ")
-        primary_designations_list_of_dicts = dbConnQueryIDs.get_unpacked_primary_desigs_list()
-        
-        # make into an array
-        # filter-out "A" at the start of the designation, as this currently causes packed_to_unpacked_desig to crash
-        primary_designations_array         = np.array( [ d['unpacked_primary_provisional_designation'] for d in primary_designations_list_of_dicts if \
-            "A" != d['unpacked_primary_provisional_designation'][0] and \
-            d['unpacked_primary_provisional_designation'] not in ['2014 QT388','2019 FH14'] and \
-            d['unpacked_primary_provisional_designation'][-3:] != " PL" ] )
-        '''
+        # Choose a random subset (sampled inside the database)
+        if method == 'RANDOM':
+            if seed is None:
+                seed = np.random.randint(2**31)
+            print(f"\n... Sampling random primary designations from db (seed={seed}) ... ")
+            primary_designations_array = np.array( sample_primary_designations( dbConnQueryOrbs , size , seed , strata=strata ) )
         
-    # Choose a random subset
-    if method == 'RANDOM':
-        primary_designations_array = np.random.choice(primary_designations_array, size=size, replace=False)
+        # Select only comets (for now, while developing, using only C/) s...
+        if method == 'COMET':
+            #primary_designations_list_of_dicts = dbConnQueryIDs.get_unpacked_primary_desigs_list()
+            #primary_designations_array = np.array( [ _ for _ in primary_designations_array if "C/" in _ ] )
+            primary_designations_array = np.random.choice( ['C/2020 K2', 'C/2006 M8', 'C/2010 X6', 'C/2006 Y16', 'C/2000 Y5'] , size=size, replace=False)
+
+        # Select only the designations that have changed since the last monitoring pass
+        if method == 'MONITOR':
+            watermarks   = load_watermarks(watermark_path)
+            pass_started = dbConnQueryOrbs.get_db_time()
+            print(f"\n... Searching db for designations changed since {watermarks} ... ")
+            changed_designations       = dbConnQueryOrbs.get_designations_changed_since( watermarks['observations'] , watermarks['orbfit_results'] , own_writes_until=watermarks['own_writes_until'] )
+            primary_designations_array = np.array( list(filter(keep_designation, changed_designations)) )
+            if len(primary_designations_array) == 0:
+                print('Nothing has changed since the last monitoring pass')
+                if not status_only:
+                    save_watermarks(watermark_path, pass_started, pass_started)
+                return {}
+
+        # Check that there is some data to work with
+        # (a stream of designations cannot be counted in advance)
+        if method != 'ALL':
+            assert len(primary_designations_array) > 0 , 'You probably did not supply *n*, so it defaulted to zero'
+            print(f'Checking N={len(primary_designations_array)} designations')
+
+        # Read-only status census: no orbfit, no journal, no watermarks
+        if status_only:
+            statuses = report_database_statuses( primary_designations_array , dbConnQueryOrbs , status_report_path ,
+                                                 chunk_size=chunk_size , whole_table=(method == 'ALL') ,
+                                                 index=designation_index.DesignationIndex(refresh_interval=index_refresh_interval, snapshot_tables=index_tables) ,
+                                                 screen_tracklets=screen_tracklets , observation_statistics=observation_statistics )
+            return statuses
+
+        # Resume from any checkpoint journal
+        if journal_path is not None:
+            journal   = sweep_journal.SweepJournal(journal_path)
+            completed = journal.completed()
+            in_flight = journal.in_flight()
+            print(f'Journal {journal_path} : skipping {len(completed)} completed & resuming {len(in_flight)} in-flight designation(s)')
+            if method == 'ALL':
+                # Lazily: the in-flight designations first, then the rest of the stream
+                primary_designations_array = itertools.chain( list(in_flight) ,
+                                                              ( _ for _ in primary_designations_array if _ not in in_flight and _ not in completed ) )
+            else:
+                primary_designations_array = [ _ for _ in primary_designations_array if _ in in_flight ] + \
+                                             [ _ for _ in primary_designations_array if _ not in in_flight and _ not in completed ]
+        else:
+            journal = None
+    
+        # Cycle through each of the designations and run a check on each designation
+        # - The database-orbit info is prefetched for each chunk of designations
+        # - The designations are checked in batches (sharing a single orbfit run)
+        statuses = {}
+        index    = designation_index.DesignationIndex(refresh_interval=index_refresh_interval, snapshot_tables=index_tables)
+        metrics  = checker_metrics.SweepMetrics(metrics_path, interval=metrics_interval)
+        timer    = checker_metrics.StageTimer()
+        profiler_kwargs = { 'profile_dir' : profile_dir , 'every' : profile_every , 'cpu' : profile_cpu , 'memory' : profile_memory } if profile_dir is not None else None
+        if profiler_kwargs is not None:
+            sweep_profiler.clear(profile_dir)
+        profiler = sweep_profiler.SweepProfiler(**profiler_kwargs) if profiler_kwargs is not None else None
+        prefetched_designations = iterate_prefetched_designations( primary_designations_array , dbConnQueryOrbs , chunk_size=chunk_size , index=index)
+        if workers > 1 :
+            checked = check_designations_in_pool( prefetched_designations , workers , journal_path=journal_path , batch_size=batch_size , metrics=metrics , profiler_kwargs=profiler_kwargs , warm_start=warm_start )
+        else:
+            checked = itertools.chain.from_iterable(
+                check_designation_batch( batch , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs, journal=checker_metrics.RecorderGroup(journal, timer), profiler=profiler, warm_start=warm_start)
+                for batch in batched( prefetched_designations , batch_size )
+            )
+
+        for desig, status in checked:
+            statuses[desig] = status
         
-    # Select only comets (for now, while developing, using only C/) s...
-    if method == 'COMET':
-        #primary_designations_list_of_dicts = dbConnQueryIDs.get_unpacked_primary_desigs_list()
-        #primary_designations_array = np.array( [ _ for _ in primary_designations_array if "C/" in _ ] )
-        primary_designations_array = np.random.choice( ['C/2020 K2', 'C/2006 M8', 'C/2010 X6', 'C/2006 Y16', 'C/2000 Y5'] , size=size, replace=False)
+            # Write the status values to the database
+            print('\t', desig, ' : status=', status)
 
-    # Check that there is some data to work with
-    assert len(primary_designations_array) > 0 , 'You probably did not supply *n*, so it defaulted to zero'
-    print(f'Checking N={len(primary_designations_array)} designations')
-    
-    # Cycle through each of the designations and run a check on each designation
-    for desig in primary_designations_array:
+            # Accumulate the timings
+            metrics.add( timer.pop_finished() )
+            if status is None:
+                metrics.add_crashed(desig)
+            metrics.maybe_write()
+
+        if journal is not None:
+            journal.close()
+        metrics.write()
+        print(metrics.summary())
+        if profiler is not None:
+            profiler.dump()
+            sweep_profiler.combine(profile_dir)
+
+        # Only advance the monitoring watermarks once the whole pass has completed
+        # NB: both marks are taken from the *start* of the pass, so changes made by other writers
+        #     during the pass are picked-up next time; our own refits are recognised by their
+        #     observation-fingerprint (see QueryOrbfitResults.get_designations_changed_since)
+        if method == 'MONITOR':
+            save_watermarks(watermark_path, pass_started, dbConnQueryOrbs.get_db_time())
+
+        return statuses
+
+    finally:
+        close_db_connections(dbConnQueryOrbs, dbConnUpdateOrbs, dbConnStream)
+
+
+# ------------------ MONITORING WATERMARKS -------------------------------------------
+
+def load_watermarks(watermark_path):
+    """
+    Read the high-water marks left by the previous monitoring pass
+     - If there is no previous pass, everything is considered changed
     
-        status = check_single_designation( desig , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs)
-        
-        # Write the status values to the database
-        print('\t', desig, ' : status=', status)
+    returns:
+    --------
+    watermarks: dict
+     - {'observations' : ISO-time, 'orbfit_results' : ISO-time, 'own_writes_until' : ISO-time or None}
+    """
+    watermarks = {'observations' : '1970-01-01T00:00:00+00:00', 'orbfit_results' : '1970-01-01T00:00:00+00:00', 'own_writes_until' : None}
+    if os.path.isfile(watermark_path):
+        with open(watermark_path) as fh:
+            watermarks.update(json.load(fh))
+    return watermarks
+
+
+def save_watermarks(watermark_path, pass_started, pass_finished):
+    """
+    Persist the high-water marks for the next monitoring pass
+     - observations & orbfit_results are both marked from the start of the pass
+     - own_writes_until marks the end of the pass: orbfit_results rows updated before it may be our own refits
+     - written to a temporary file & then renamed, so a crash cannot leave a half-written file
+    """
+    pass_started  = pass_started.isoformat() if hasattr(pass_started, 'isoformat') else pass_started
+    pass_finished = pass_finished.isoformat() if hasattr(pass_finished, 'isoformat') else pass_finished
+    watermarks = {
+        'observations'     : pass_started,
+        'orbfit_results'   : pass_started,
+        'own_writes_until' : pass_finished,
+    }
+    with open(watermark_path + '.tmp', 'w') as fh:
+        json.dump(watermarks, fh, indent=4)
+    os.replace(watermark_path + '.tmp', watermark_path)
+
+
+# ------------------ STATUS-ONLY (READ-ONLY) CENSUS -----------------------------------
+
+def database_assessment(unpacked_provisional_designation, quality_class, index):
+    """
+    The (database-only) parts of a check_single_designation assessment_dict
+     - quality_class: 'good', 'intermediate', 'bad', or None if not in orbfit_results
+     - index: a loaded DesignationIndex (for validity & comet/satellite existence)
+    """
+    assessment_dict = {
+        'IS_PRIMARY_UNPACKED_DESIGNATION'   : index.is_valid_primary(unpacked_provisional_designation),
+        'IS_IN_ORBFIT_RESULTS'              : quality_class is not None,
+        'IS_IN_COMET_RESULTS'               : index.in_comet_results(unpacked_provisional_designation),
+        'IS_IN_SATELLITE_RESULTS'           : index.in_satellite_results(unpacked_provisional_designation),
+    }
+    assessment_dict['HAS_NO_RESULTS'] = not ( assessment_dict['IS_IN_ORBFIT_RESULTS'] or assessment_dict['IS_IN_COMET_RESULTS'] or assessment_dict['IS_IN_SATELLITE_RESULTS'] )
+    set_quality_flags(assessment_dict, quality_class)
+    return assessment_dict
+
+
+def report_database_statuses( unpacked_provisional_designations , dbConnOrbs , report_path , chunk_size=1000 , whole_table=False , index=None , screen_tracklets=False , observation_statistics=False ):
+    """
+    Read-only status census: generate_status_code from the database assessment alone (orbfit is never run)
+     - observation_statistics=True : the observation-statistics flags (=> status 002 / 100) are filled
+                                     by one aggregate query (over obs_sbn) per chunk
+     - whole_table=True : the quality of every orbit is classified in a single pass over orbfit_results
+                          (best when reporting on the whole catalogue)
+     - otherwise        : the quality is classified chunk_size designations at a time
+     - writes a tab-separated report (designation, status, quality-class, existence flags) to report_path
+     - screen_tracklets=True : the stored residuals are also screened for outlying tracklets
+                               (=> status 101/201 candidates: see screen_database_tracklets)
+
+    returns:
+    --------
+    statuses: dict
+     - status-code for each designation
+    """
+    index = index if index is not None else designation_index.DesignationIndex()
+    index.maybe_refresh(dbConnOrbs)
+    quality = dict( get_quality_classes(None , dbConnOrbs) ) if whole_table else None
+
+    statuses, counts = {}, {}
+    designations = iter(unpacked_provisional_designations)
+    with open(report_path + '.tmp', 'w') as fh:
+        fh.write('designation\tstatus\tquality_class\tis_primary\tin_orbfit_results\tin_comet_results\tin_satellite_results\n')
+        while True:
+            chunk = [str(_) for _ in itertools.islice(designations, chunk_size)]
+            if not chunk:
+                break
+            chunk_quality = quality if whole_table else dict( get_quality_classes(chunk , dbConnOrbs) )
+            tracklets     = dict( screen_database_tracklets(chunk , dbConnOrbs , chunk_size=chunk_size) ) if screen_tracklets else {}
+            statistics    = dbConnOrbs.get_observation_statistics(chunk) if observation_statistics else None
+            lines = []
+            for k, desig in enumerate(chunk):
+                quality_class   = chunk_quality.get(desig)
+                assessment_dict = database_assessment(desig, quality_class, index)
+                if statistics is not None:
+                    set_observation_flags(assessment_dict, statistics[k])
+                if desig in tracklets:
+                    assessment_dict.update(tracklets[desig])
+                status          = generate_status_code(assessment_dict)
+                statuses[desig] = status
+                counts[status]  = counts.get(status, 0) + 1
+                lines.append( '\t'.join( [desig, status, str(quality_class)] + \
+                    [ str(int(assessment_dict[k])) for k in ['IS_PRIMARY_UNPACKED_DESIGNATION','IS_IN_ORBFIT_RESULTS','IS_IN_COMET_RESULTS','IS_IN_SATELLITE_RESULTS'] ] ) + '\n' )
+            fh.writelines(lines)
+    os.replace(report_path + '.tmp', report_path)
+
+    print(f'Status report for N={len(statuses)} designations written to {report_path}')
+    for status in sorted(counts):
+        print(f'\t{status} : {counts[status]}')
+    return statuses
+
+
+# ------------------ OBSERVATION STATISTICS ------------------------------------------
+
+def set_observation_flags(assessment_dict, observation_statistics):
+    """
+    Set the observation-count / arc-length / C51 flags of an assessment_dict
+     - observation_statistics: an element of QueryOrbfitResults.get_observation_statistics
+       (or any mapping with 'n_obs', 'arc_days', 'n_c51' & 'frac_c51')
+     - n_obs = 0 (no observations found via current_identifications) only sets HAS_NO_OBS:
+       the count / arc flags are left False, as nothing is known about them
+    """
+    n_obs, arc_days = observation_statistics['n_obs'], observation_statistics['arc_days']
+    assessment_dict['HAS_NO_OBS']           = bool( n_obs == 0 )
+    if n_obs == 0:
+        return
+    assessment_dict['HAS_NOBS_LTE_3']       = bool( n_obs <= 3 )
+    assessment_dict['HAS_NOBS_LTE_10']      = bool( n_obs <= 10 )
+    assessment_dict['HAS_ARC_LTE_1_DAY']    = bool( arc_days <= 1.0 )
+    assessment_dict['HAS_ARC_LTE_2_DAY']    = bool( arc_days <= 2.0 )
+    assessment_dict['HAS_NOBS_C51_GTE_5']   = bool( observation_statistics['n_c51'] >= 5 )
+    assessment_dict['HAS_FRAC_C51_GTE_0.5'] = bool( observation_statistics['frac_c51'] >= 0.5 )
+
+
+# ------------------ PRE-FIT TRIAGE ---------------------------------------------------
+
+def configure_triage(**kwargs):
+    """ Change the triage settings (see TRIAGE_CONFIG for the allowed keys) """
+    unknown = set(kwargs) - set(TRIAGE_CONFIG)
+    assert not unknown, f'Unknown triage setting(s): {unknown}'
+    TRIAGE_CONFIG.update(kwargs)
+
+
+def triage_designation( unpacked_provisional_designation , is_in_orbfit_results , observation_statistics ):
+    """
+    Decide, from cheap precomputed observation statistics, which path a designation should take
+     - 'skip' : no fit can succeed (too few observations / too short an arc): a status is assigned directly
+                ('002' if there is no stored orbit, '100' if there is)
+     - 'iod'  : a standard asteroid without a stored orbit: the extension fit cannot succeed, so go straight to IOD
+                (only if TRIAGE_CONFIG['route_no_orbit'] == 'iod')
+     - 'fit'  : the usual path (extension fit of a stored orbit, comet wrapper, ...)
+     - no observations found (n_obs = 0, e.g. a designation missing from current_identifications)
+       tells us nothing, so such designations are not triaged ('fit')
+
+    returns:
+    --------
+    route  : 'skip', 'iod' or 'fit'
+    status : status-code for 'skip', else None
+    """
+    if not TRIAGE_CONFIG['enabled'] or observation_statistics is None or observation_statistics['n_obs'] == 0:
+        return 'fit', None
+
+    if  observation_statistics['n_obs']    <= TRIAGE_CONFIG['max_nobs_no_fit'] or \
+        observation_statistics['arc_days'] <  TRIAGE_CONFIG['min_arc_days_for_fit']:
+        return 'skip', '100' if is_in_orbfit_results else '002'
+
+    if not is_in_orbfit_results and "/" not in unpacked_provisional_designation and TRIAGE_CONFIG['route_no_orbit'] == 'iod':
+        return 'iod', None
+
+    return 'fit', None
+
+
+def wants_observation_statistics( force_refit=False ):
+    """
+    Whether to aggregate the observation statistics (obs_sbn) before fitting
+     - only if they can change the outcome: i.e. triage is enabled & the fit is not forced
+     - (when not fetched, the observation-count / arc flags of the status are left unset)
+    """
+    return TRIAGE_CONFIG['enabled'] and not force_refit
+
+
+def wants_observation_fingerprints( dbConnOrbs , force_refit=False ):
+    """
+    Whether to fingerprint the observations (obs_sbn) before fitting
+     - only if the refit may be skipped: i.e. the fit is not forced & orbfit_results
+       has the observation_fingerprint column (see QueryOrbfitResults.has_observation_fingerprint_column)
+    """
+    return not force_refit and dbConnOrbs.has_observation_fingerprint_column()
+
+
+# ------------------ TRACKLET OUTLIERS -----------------------------------------------
+
+def rwo_array_of_filedict(filedict):
+    """
+    RWO structured array from a result/file dictionary (its 'rwodict'), or None
+     - None (with a warning) if the residuals cannot be read from the dictionary (see oa.rwo_dict_to_array),
+       so that the tracklet flags are left unset rather than reporting "no bad tracklets"
+    """
+    if filedict.get('rwodict'):
+        try:
+            return oa.rwo_dict_to_array(filedict['rwodict'])
+        except ValueError as error:
+            print('WARNING: tracklets not screened:', error)
+    return None
+
+
+def set_tracklet_flags(assessment_dict, screen, k):
+    """ Set HAS_BAD_TRACKLETS & HAS_SIGNIFICANT_BAD_TRACKLETS from the k-th object of a screen_tracklets result """
+    assessment_dict['HAS_BAD_TRACKLETS']                = bool(screen['has_bad_tracklets'][k])
+    assessment_dict['HAS_SIGNIFICANT_BAD_TRACKLETS']    = bool(screen['significant'][k])
 
 
-def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs, FIX=False):
+def screen_database_tracklets(unpacked_provisional_designations , dbConnOrbs , chunk_size=1000):
+    """
+    Generator: screen the stored residuals (rwo_json) of many orbits for outlying tracklets, without running orbfit
+     - each chunk is fetched in one query & screened in one vectorized call (see orbfit_arrays.screen_tracklets)
+     - yields (desig, {'HAS_BAD_TRACKLETS' : Boolean, 'HAS_SIGNIFICANT_BAD_TRACKLETS' : Boolean})
+       for each desig in orbfit_results whose rwo_json could be read (the others are skipped with a warning)
+    """
+    designations = iter(unpacked_provisional_designations)
+    while True:
+        chunk = [str(_) for _ in itertools.islice(designations, chunk_size)]
+        if not chunk:
+            return
+        rwo_jsons = dbConnOrbs.get_rwo_jsons(chunk)
+        found, arrays = [], []
+        for desig in chunk:
+            if desig not in rwo_jsons:
+                continue
+            try:
+                arrays.append( oa.rwo_dict_to_array( json.loads(rwo_jsons[desig]) if isinstance(rwo_jsons[desig], str) else rwo_jsons[desig] ) )
+                found.append(desig)
+            except ValueError as error:
+                print(f'WARNING: {desig} : tracklets not screened:', error)
+        screen    = oa.screen_tracklets(arrays)
+        for k, desig in enumerate(found):
+            flags = {}
+            set_tracklet_flags(flags, screen, k)
+            yield desig, flags
+
+
+# ------------------ PROCESS-POOL EXECUTION -------------------------------------------
+
+# Per-process state for the pool workers: populated by _init_worker
+_worker_state = {}
+
+def _init_worker(journal_path=None, profiler_kwargs=None, warm_start=False):
+    """
+    Runs once in each pool worker
+     - Each worker needs its own db-connections (they cannot be shared across processes):
+       they are returned to the worker's pool when the worker exits
+     - Each worker needs its own orbfit proc_subdir (so that concurrent fits do not overwrite each other's files)
+     - Each worker opens its own connection to any checkpoint journal
+     - Each worker times its own stages: the timings are returned with each batch's results
+     - Each worker has its own (optional) SweepProfiler: its files are re-dumped after each batch
+     - warm_start is passed on to every check_designation_batch call
+    """
+    _worker_state['connections'] = open_db_connections()
+    multiprocessing.util.Finalize(None, close_db_connections, args=_worker_state['connections'], exitpriority=10)
+    _worker_state['proc_subdir'] = f'check_obj_{os.getpid()}'
+    _worker_state['timer']       = checker_metrics.StageTimer()
+    _worker_state['profiler']    = sweep_profiler.SweepProfiler(**profiler_kwargs) if profiler_kwargs is not None else None
+    _worker_state['journal']     = checker_metrics.RecorderGroup( sweep_journal.SweepJournal(journal_path) if journal_path is not None else None , _worker_state['timer'] )
+    _worker_state['warm_start']  = warm_start
+
+
+def _check_batch_in_worker(batch):
+    """
+    Run check_designation_batch inside a pool worker
+     - A crash (including sys.exit) is reported back rather than killing the sweep:
+       designations in the batch that had not been checked get a status of None
+
+    returns:
+    --------
+    results : list of (desig, status) pairs
+    timings : list of StageTimer records for the designations that were checked
+    """
+    results = []
+    try:
+        for desig, status in check_designation_batch( batch , *_worker_state['connections'] , proc_subdir=_worker_state['proc_subdir'], journal=_worker_state['journal'], profiler=_worker_state['profiler'], warm_start=_worker_state['warm_start']):
+            results.append( (desig, status) )
+    except (Exception, SystemExit) as e:
+        print(f'Exception while checking batch in worker {os.getpid()} ...\n\t', repr(e))
+        checked = set( desig for desig, status in results )
+        results.extend( (desig, None) for desig, prefetched in batch if desig not in checked )
+        _worker_state['timer'].open.clear()
+    if _worker_state['profiler'] is not None:
+        _worker_state['profiler'].dump()
+    return results, _worker_state['timer'].pop_finished()
+
+
+def check_designations_in_pool( prefetched_designations , workers , max_in_flight = None , journal_path = None , batch_size = 1 , metrics = None , profiler_kwargs = None , warm_start = False ):
+    """
+    Generator: check designations using a pool of worker processes
+     - prefetched_designations: iterable of (desig, prefetched) pairs (see iterate_prefetched_designations)
+     - each worker checks batch_size designations at a time (see check_designation_batch)
+     - yields (desig, status) in the order in which the checks *complete*
+     - only max_in_flight batches are submitted at any one time
+       (default 4*workers) so that a catalogue-length list does not
+       generate millions of pending futures
+     - journal_path: optional checkpoint journal shared by all of the workers
+     - metrics: optional SweepMetrics, to which the workers' stage-timings are added
+     - profiler_kwargs: optional SweepProfiler arguments, to profile the checks in each worker
+     - warm_start: refit from the stored orbits (see check_designation_batch)
+    """
+    max_in_flight = 4*workers if max_in_flight is None else max_in_flight
+    batches       = batched( prefetched_designations , batch_size )
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(journal_path, profiler_kwargs, warm_start)) as executor:
+
+        # Prime the pool
+        pending = set()
+        for batch in batches:
+            pending.add( executor.submit(_check_batch_in_worker, batch) )
+            if len(pending) >= max_in_flight:
+                break
+
+        # Drain completed checks & top-up the pool
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, timings = future.result()
+                if metrics is not None:
+                    metrics.add(timings)
+                yield from results
+                for batch in batches:
+                    pending.add( executor.submit(_check_batch_in_worker, batch) )
+                    break
+
+
+def keep_designation( unpacked_provisional_designation ):
+    """
+    Whether a primary designation should be included in an ALL / MONITOR sweep
+     - filter-out "A" at the start of the designation, as this currently causes packed_to_unpacked_desig to crash
+     - filter-out " PL" (Palomar-Leiden survey) designations & the explicit SKIP_DESIGNATIONS
+     - filter-out "C/" comets, as direct_call_orbfit_comet_wrapper is not yet working
+    """
+    return  unpacked_provisional_designation[0] != "A" and \
+            unpacked_provisional_designation not in SKIP_DESIGNATIONS and \
+            unpacked_provisional_designation[-3:] != " PL" and \
+            "C/" not in unpacked_provisional_designation
+
+
+def stream_primary_designations( dbConnOrbs , chunk_size=10000 ):
+    """
+    Generator: yields every primary designation that passes keep_designation
+     - designations are read chunk-by-chunk from a server-side cursor (see QueryOrbfitResults.iterate_unpacked_primary_desigs)
+       & filtered as they arrive, so checking can start straight-away & memory use stays flat
+    """
+    for chunk in dbConnOrbs.iterate_unpacked_primary_desigs(chunk_size=chunk_size):
+        yield from filter(keep_designation, chunk)
+
+
+def sample_primary_designations( dbConnOrbs , size , seed , strata=None ):
+    """
+    Reproducible random sample of primary designations, drawn in the database (see QueryOrbfitResults.get_random_unpacked_primary_desigs)
+     - strata: None (=> *size* designations of any type) or a dict of sample-size per designation type
+     - the same exclusions as keep_designation are applied, except for comets (which a 'comet' stratum samples on purpose)
+    """
+    if strata is None:
+        strata = {None : size}
+    sample = []
+    for designation_type, n in strata.items():
+        sample.extend( dbConnOrbs.get_random_unpacked_primary_desigs( n , seed , designation_type=designation_type , skip_desigs=SKIP_DESIGNATIONS ) )
+    return sample
+
+
+def batched( iterable , n ):
+    """ Generator: lists of (up to) n consecutive items from iterable """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, n))
+        if not batch:
+            return
+        yield batch
+
+
+# ------------------ BATCHED CHECKING -------------------------------------------
+
+def observations_unchanged( is_in_orbfit_results , observation_fingerprint , stored_observation_fingerprint ):
+    """ Was the stored orbit fitted to exactly the observations now in the db ? """
+    return bool(is_in_orbfit_results) and \
+           observation_fingerprint is not None and \
+           observation_fingerprint == stored_observation_fingerprint
+
+
+def needs_extension_fit( unpacked_provisional_designation , prefetched , force_refit=False ):
+    """
+    Will check_single_designation run the standard-asteroid extension fit for this designation ?
+     - only standard asteroid designations go through update_wrapper
+     - the fit is skipped if the observations are unchanged since the stored fit
+     - the fit is skipped if triage routes the designation elsewhere (see triage_designation)
+     - force_refit=True bypasses both checks
+    """
+    if "/" in unpacked_provisional_designation:
+        return False
+    if force_refit or prefetched is None:
+        return True
+    if 'observation_statistics' in prefetched:
+        route, status = triage_designation( unpacked_provisional_designation , prefetched['IS_IN_ORBFIT_RESULTS'] , prefetched['observation_statistics'] )
+        if route != 'fit':
+            return False
+    return not observations_unchanged( prefetched['IS_IN_ORBFIT_RESULTS'] , prefetched['observation_fingerprint'] , prefetched['stored_observation_fingerprint'] )
+
+
+def split_update_wrapper_result( result_dict , packed , batch_packed ):
+    """
+    Extract the single-object view of a multi-object update_wrapper result dict
+     - per-object entries are keyed by packed designation: only the entry for `packed` is kept
+     - the other top-level entries (e.g. 'batch', 'obs_summary', 'time', 'top_level') are shared & kept as-is
+     - 'failedfits' is shared by the batch: update_wrapper returns it as a dict keyed by packed designation,
+       of which only the entry for `packed` (if any) is kept
+       (so that one failed object does not mark the whole batch as failed)
+
+    batch_packed: list
+     - packed designations of every object in the update_wrapper call
+    """
+    others = set(batch_packed) - set([packed])
+    single = { k : v for k, v in result_dict.items() if k not in others }
+
+    if 'failedfits' in result_dict:
+        single['failedfits'] = { k : v for k, v in result_dict['failedfits'].items() if k == packed }
+
+    return single
+
+
+def check_designation_batch( batch , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs, proc_subdir='check_obj', journal=None, profiler=None, warm_start=False):
+    """
+    Generator: check a batch of designations, yielding (desig, status)
+     - batch: list of (desig, prefetched) pairs (see iterate_prefetched_designations)
+     - the extension fits for every designation in the batch that needs one
+       are run in a single update_wrapper call, then split back into
+       per-designation results for check_single_designation
+     - (so the ORBFIT stage-timing of each designation is that of the whole batch's fit)
+     - profiler: optional SweepProfiler, wrapped around the batch's update_wrapper call
+       (sampled with the batch's first designation) & around each check_single_designation call
+     - warm_start: the stored orbits of the whole batch are written to a single initial-orbit file
+       (one query, see initial_orbits_file) for the batch's update_wrapper call
+    """
+    to_fit = [ desig for desig, prefetched in batch if needs_extension_fit(desig, prefetched) ]
+
+    batch_result_dict, batch_packed = {}, []
+    if to_fit:
+        print("\t*"*3,f"Standard Orbit Fit for batch of N={len(to_fit)} ...")
+        for desig in to_fit:
+            sweep_journal.record_stage(journal, desig, 'ORBFIT')
+        with sweep_profiler.profile(profiler, advance=False), initial_orbits_file(to_fit, dbConnQueryOrbs, warm_start) as els_ext:
+            batch_result_dict = direct_call_orbfit_update_wrapper(to_fit, proc_subdir=proc_subdir, els_ext=els_ext)
+        for desig in to_fit:
+            checker_metrics.pause_stage(journal, desig)
+        batch_packed      = [ mc.unpacked_to_packed_desig(desig) for desig in to_fit ]
+
+    for desig, prefetched in batch:
+        extension_result_dict = split_update_wrapper_result( batch_result_dict , mc.unpacked_to_packed_desig(desig) , batch_packed ) if desig in to_fit else None
+        with sweep_profiler.profile(profiler):
+            status = check_single_designation( desig , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs, proc_subdir=proc_subdir, prefetched=prefetched, journal=journal, extension_result_dict=extension_result_dict, warm_start=warm_start)
+        yield desig, status
+
+
+def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs, dbConnQueryOrbs, dbConnUpdateOrbs, FIX=False, proc_subdir='check_obj', prefetched=None, journal=None, force_refit=False, extension_result_dict=None, warm_start=False):
     '''
     Do a bunch of checks on a single designation
     WIP Code:
     (i) does not yet perform all required checks
     (ii) does not yet do many/any db updates
     
+    proc_subdir: string
+     - orbfit processing sub-directory: must be unique per-process if running in parallel
+
+    prefetched: dict or None
+     - database-orbit info for this designation from prefetch_database_orbit_info
+     - only used for the initial assessment: the re-assessment after a fit always queries the db
+
+    journal: SweepJournal (or checker_metrics.RecorderGroup) or None
+     - If supplied, each stage (see sweep_journal.STAGES) is recorded as it is reached
+
+    force_refit: Boolean
+     - By default the orbit is only refit if the observations have changed since the
+       stored orbit was fitted (according to the stored observation-fingerprint)
+     - force_refit=True always refits (no triage either), so the observations are not
+       aggregated for the fingerprint / statistics unless they were prefetched
+
+    extension_result_dict: dict or None
+     - the (single-object) result of an extension fit that has already been run for this
+       designation as part of a batch (see check_designation_batch)
+     - if None, the extension fit is run here (if required)
+
+    warm_start: Boolean
+     - If True, any stored orbit is passed to the extension fit (els_ext) as the initial orbit
+       (see initial_orbits_file)
     '''
 
     # Define an assessment-dict to flag the condition of the orbit
@@ -181,7 +886,12 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
         # Overall designation status: Check whether actually a primary unpacked_provisional_designation
         # - If being called from a list pulled from the identifications tables, then this step is unnecessary
         # - But I provide it for safety
-        'IS_PRIMARY_UNPACKED_DESIGNATION'   : dbConnQueryIDs.is_valid_unpacked_primary_desig(unpacked_provisional_designation),
+        # - If prefetched from a DesignationIndex, this is a local lookup rather than a query
+        'IS_PRIMARY_UNPACKED_DESIGNATION'   : prefetched['IS_PRIMARY_UNPACKED_DESIGNATION'] if prefetched is not None and 'IS_PRIMARY_UNPACKED_DESIGNATION' in prefetched else \
+                                              dbConnQueryIDs.is_valid_unpacked_primary_desig(unpacked_provisional_designation),
+
+        # Whether the stored orbit was fitted to exactly the current observations (=> no need to refit)
+        'HAS_UNCHANGED_OBSERVATIONS'        : False,
 
         # Whether an orbit exists anywhere
         'IS_IN_ORBFIT_RESULTS'              : False,
@@ -204,10 +914,14 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
         # Are there any obvious outlier tracklets when we run fit (bad tracklet dict)
         'HAS_BAD_TRACKLETS'                 : False,
 
+        # Are a significant fraction of the observations in outlier tracklets (see orbfit_arrays.screen_tracklets)
+        'HAS_SIGNIFICANT_BAD_TRACKLETS'     : False,
+
         # Are there any obvious outlier tracklets when we run fit (bad tracklet dict)
         'HAS_WEAK_ORBIT_FIT'                : False,
         
         # IF THE IOD FAILED, TRY TO UNDERSTAND WHY ...
+        'HAS_NO_OBS'                        : False,
         'HAS_NOBS_LTE_3'                    : False,
         'HAS_NOBS_LTE_10'                   : False,
         'HAS_ARC_LTE_1_DAY'                 : False,
@@ -225,35 +939,91 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
     }
     
     # (1) Assess any extant database-orbit & set flags in assessment_dict
-    assess_quality_of_any_database_orbit(designation_dict, assessment_dict, dbConnQueryOrbs)
+    sweep_journal.record_stage(journal, unpacked_provisional_designation, 'DB_ASSESSMENT')
+    assess_quality_of_any_database_orbit(designation_dict, assessment_dict, dbConnQueryOrbs, prefetched=prefetched)
+    if prefetched is not None and 'observation_statistics' in prefetched:
+        observation_statistics = prefetched['observation_statistics']
+    elif wants_observation_statistics(force_refit):
+        observation_statistics = dbConnQueryOrbs.get_observation_statistics([unpacked_provisional_designation])[0]
+    else:
+        observation_statistics = None
+    if observation_statistics is not None:
+        set_observation_flags(assessment_dict, observation_statistics)
+
+    # Compare the observations now in the db with those used for the stored orbit
+    if prefetched is not None:
+        observation_fingerprint        = prefetched['observation_fingerprint']
+        stored_observation_fingerprint = prefetched['stored_observation_fingerprint']
+    elif wants_observation_fingerprints(dbConnQueryOrbs, force_refit):
+        observation_fingerprint        = dbConnQueryOrbs.get_observation_fingerprints([unpacked_provisional_designation]).get(unpacked_provisional_designation)
+        stored_observation_fingerprint = dbConnQueryOrbs.get_stored_observation_fingerprints([unpacked_provisional_designation]).get(unpacked_provisional_designation)
+    else:
+        observation_fingerprint, stored_observation_fingerprint = None, None
+    assessment_dict['HAS_UNCHANGED_OBSERVATIONS'] = observations_unchanged( assessment_dict['IS_IN_ORBFIT_RESULTS'] , observation_fingerprint , stored_observation_fingerprint )
 
+    # Pre-fit triage: hopeless objects get a status without any fit
+    if force_refit:
+        route, triage_status = 'fit', None
+    else:
+        route, triage_status = triage_designation( unpacked_provisional_designation , assessment_dict['IS_IN_ORBFIT_RESULTS'] , observation_statistics )
 
-    # (2) If no orbit at all, do orbit fit
-    if True : # assessment_dict['HAS_NO_RESULTS'] :
-        print('\n'*3,'HAS_NO_RESULTS', unpacked_provisional_designation)
+    # (2) If no orbit at all, or the observations have changed, do orbit fit
+    if assessment_dict['HAS_UNCHANGED_OBSERVATIONS'] and not force_refit :
+        print('\t', unpacked_provisional_designation, ': observations unchanged since the stored fit: skipping refit')
+
+    elif route == 'skip' :
+        print('\t', unpacked_provisional_designation, f': triage: too few observations / too short an arc to fit: status={triage_status}')
+
+    else : # assessment_dict['HAS_NO_RESULTS'] :
 
-        
         # Standard asteroid ...
         if   "/" not in unpacked_provisional_designation:
             orbit_type        = 'asteroid' ;
             destination_table = 'orbfit_results'
 
-            # (a) Orbfit & Dictionary conversion in one
-            print("\t*"*3,"Standard Orbit Fit ...")
-            result_dict = direct_call_orbfit_update_wrapper(unpacked_provisional_designation)
+            # Triage may route an object with no stored orbit straight to IOD (the extension fit cannot succeed without one)
+            if route == 'iod':
+                print("\t*"*3,"Triage: no stored orbit: going straight to IOD ...")
+                assessment_dict.update({ 'SUCCESSFUL_ORBFIT_EXECUTION' : False , 'INPUT_GENERATION_SUCCESS' : False , 'enough_obs' : True , 'existing_orbit' : False })
+
+            else:
+                # (a) Orbfit & Dictionary conversion in one (unless already run as part of a batch)
+                if extension_result_dict is None:
+                    print("\t*"*3,"Standard Orbit Fit ...")
+                    sweep_journal.record_stage(journal, unpacked_provisional_designation, 'ORBFIT')
+                    with initial_orbits_file([unpacked_provisional_designation], dbConnQueryOrbs, warm_start) as els_ext:
+                        result_dict = direct_call_orbfit_update_wrapper(unpacked_provisional_designation, proc_subdir=proc_subdir, els_ext=els_ext)
+                else:
+                    result_dict = extension_result_dict
             
-            # (b) Evaluate the result from the orbfit run & assign a status
-            assess_result_dict(designation_dict , result_dict , assessment_dict , RESULT_DICT_ORIGIN = 'EXTENSION' )
+                # (b) Evaluate the result from the orbfit run & assign a status
+                sweep_journal.record_stage(journal, unpacked_provisional_designation, 'RESULT_ASSESSMENT')
+                assess_result_dict(designation_dict , result_dict , assessment_dict , RESULT_DICT_ORIGIN = 'EXTENSION' )
         
-            # (c) Save results to the database (only done if we have a useable result ... )
-            if assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] :
-                # NB: Extracting the single-object part of the dictionary Margaret's code returns ...
-                #SUCCESS = to_db.save_result_dict_to_db( result_dict[designation_dict['packed_provisional_designation']], destination_table, db=dbConnUpdateOrbs)
-                #print('writing ... SUCCESS = ', SUCCESS)
-                print('...')
-                for k,v in result_dict.items(): print(k,v)
-                print('...')
-                to_db.main( [designation_dict['packed_provisional_designation']] , filedictlist=[result_dict[designation_dict['packed_provisional_designation']]] )
+                # (c) Save results to the database (only done if we have a useable result ... )
+                if assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] :
+                    # NB: Extracting the single-object part of the dictionary Margaret's code returns ...
+                    #SUCCESS = to_db.save_result_dict_to_db( result_dict[designation_dict['packed_provisional_designation']], destination_table, db=dbConnUpdateOrbs)
+                    #print('writing ... SUCCESS = ', SUCCESS)
+                    sweep_journal.record_stage(journal, unpacked_provisional_designation, 'DB_WRITE')
+                    print('...')
+                    for k,v in result_dict.items(): print(k,v)
+                    print('...')
+                    # The fingerprint of the observations this orbit was fitted to is written in the same upsert,
+                    # so it can only be stored if the orbit is
+                    # (taken before the fit: if observations arrived during the fit, the next sweep will refit)
+                    packed                  = designation_dict['packed_provisional_designation']
+                    extra_columns           = { packed : { 'observation_fingerprint' : observation_fingerprint } } if observation_fingerprint is not None else None
+                    summarystr, count_dict  = to_db.main( [packed] , filedictlist=[result_dict[packed]] , db=dbConnUpdateOrbs , extra_columns=extra_columns , return_count_dict=True )
+                    written                 = count_dict['obj_count'] == 1 and packed not in count_dict['no_upsert']
+                    if not written:
+                        sweep_journal.record_stage(journal, unpacked_provisional_designation, 'DB_WRITE_FAILED')
+                        print('\t', unpacked_provisional_designation, ': the new orbit could not be written to the db')
+
+                    # Look for outlying tracklets in the residuals of the new fit (if it was written)
+                    rwo_array = rwo_array_of_filedict( result_dict[packed] ) if written else None
+                    if rwo_array is not None:
+                        set_tracklet_flags( assessment_dict , oa.screen_tracklets([rwo_array]) , 0 )
                 
             # (d) if the init orbit is missing, but there are obs, then might want to try IOD of some sort ...
             if  not assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] and \
@@ -262,7 +1032,7 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
                 not assessment_dict['existing_orbit']:
         
                 # Call IOD (results returned as  dictionaries)
-                assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] , result_dict   = direct_call_IOD(designation_dict, destination)
+                assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] , result_dict   = direct_call_IOD(designation_dict, orbit_type)
                 # Assess IOD results
                 assess_result_dict(designation_dict , result_dict , assessment_dict , RESULT_DICT_ORIGIN = 'IOD' )
                 # Save IOD results to db
@@ -271,6 +1041,7 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
                     
             # (e) (Re)Assess result written to db
             if assessment_dict['SUCCESSFUL_ORBFIT_EXECUTION'] :
+                sweep_journal.record_stage(journal, unpacked_provisional_designation, 'REASSESSMENT')
                 assess_quality_of_any_database_orbit(designation_dict, assessment_dict, dbConnQueryOrbs)
 
         # Comet
@@ -292,7 +1063,9 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
         
 
     # Generate status-code & return
-    return generate_status_code(assessment_dict)
+    status = triage_status if route == 'skip' and triage_status is not None else generate_status_code(assessment_dict)
+    sweep_journal.record_stage(journal, unpacked_provisional_designation, 'DONE', status=status)
+    return status
     
 
 
@@ -302,16 +1075,22 @@ def check_single_designation( unpacked_provisional_designation , dbConnQueryIDs,
 # ------------------ ORBIT EXTENSION -------------------------------------------
 
     
-def direct_call_orbfit_update_wrapper(unpacked_provisional_designation):
+def direct_call_orbfit_update_wrapper(unpacked_provisional_designations, proc_subdir='check_obj', els_ext=None):
     """
     # Attempt to fit the orbit using the "orbit_pipeline_wrapper"
+     - unpacked_provisional_designations: a single designation, or a list to be fitted in one call
+       (the returned dict then has one entry per packed designation, and a shared 'failedfits')
+     - els_ext: optional element file of initial orbits (see initial_orbits_file): None => orbfit starts from scratch
     """
+    if isinstance(unpacked_provisional_designations, str):
+        unpacked_provisional_designations = [unpacked_provisional_designations]
+
     arg_dict = {
         'obs80_filepath'        :       None,
         'psv_filepath'          :       None,
         'xml_filepath'          :       None,
-        'object_list'           :       [unpacked_provisional_designation],
-        'els_ext'               :       None,
+        'object_list'           :       list(unpacked_provisional_designations),
+        'els_ext'               :       els_ext,
         'primary_desig_file'    :       None,
         'usefindn'              :       True,
         'queue_name'            :       'mba/mopp',
@@ -321,10 +1100,60 @@ def direct_call_orbfit_update_wrapper(unpacked_provisional_designation):
         'cov_dir'               :       'cov/',
         'res_analysis_dir'      :       'badtrkfiles/',
         'findn_dir'             :       'findnfiles/',
-        'proc_subdir'           :       'check_obj',
+        'proc_subdir'           :       proc_subdir,
         'std_epoch'             :       '59200'
     }
     return update_wrapper.update_wrapper( arg_dict )
+
+
+@contextmanager
+def initial_orbits_file(unpacked_provisional_designations, dbConnQueryOrbs, warm_start=True):
+    """
+    Context-manager: yields the element file of the stored orbits of some designations (see write_initial_orbits),
+    or None if warm_start is False / none of them has a stored orbit
+     - the file is written to a new 'warm_start' subdirectory, which is removed on exit (i.e. once the refit has run)
+    """
+    if not warm_start:
+        yield None
+        return
+    directory = newsub.generate_subdirectory( 'warm_start' )
+    try:
+        yield write_initial_orbits(unpacked_provisional_designations, dbConnQueryOrbs, directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_initial_orbits(unpacked_provisional_designations, dbConnQueryOrbs, directory, columns=WARM_START_COLUMNS):
+    """
+    Write the stored orbits of some designations to a single element file (in directory), for use as the initial orbits of a refit
+     - one query per column in *columns* (standard-epoch first, then mid-epoch for any still missing)
+     - only the first usable coordinate-type of each orbit is written (see oa.INITIAL_ORBIT_COORD_TYPES)
+     - objects are named as orbfit names them (packeddes_to_orbfitdes)
+
+    returns:
+    --------
+    filepath: str or None
+     - None if none of the designations has a stored orbit (=> the refit starts from scratch)
+    """
+    feldicts = {}
+    missing  = list(unpacked_provisional_designations)
+    for column in columns:
+        if not missing:
+            break
+        for desig, element_json in dbConnQueryOrbs.get_element_jsons(missing, column=column).items():
+            feldict = json.loads(element_json) if isinstance(element_json, str) else element_json
+            if feldict:
+                feldicts[desig] = feldict
+        missing = [ _ for _ in missing if _ not in feldicts ]
+    if not feldicts:
+        return None
+
+    filepath = os.path.join( directory , 'initial_orbits.oel' )
+    written  = oa.write_fel_file( filepath ,
+                                  { update_existing_orbits.packeddes_to_orbfitdes(mc.unpacked_to_packed_desig(desig)) : feldict for desig, feldict in feldicts.items() } ,
+                                  coordtypes=oa.INITIAL_ORBIT_COORD_TYPES , first_only=True )
+    print(f'Warm start: initial orbits for N={len(written)} of {len(unpacked_provisional_designations)} designation(s) written to {filepath}')
+    return filepath if written else None
     
     
     
@@ -454,18 +1283,152 @@ def commandline_call_orbfit_comet_wrapper(designation_dict , FORCEOBS80=False):
 
 # ------------------ GENERIC RESULTS ASSESSMENT  -----------------------------------------------
 
-def assess_quality_of_any_database_orbit(designation_dict , assessment_dict, dbConnOrbs):
+def prefetch_database_orbit_info(unpacked_provisional_designations , dbConnOrbs , index=None , force_refit=False):
+    """
+    Fetch the existence, quality-class & observation-fingerprints of any database-orbit for a whole chunk of designations
+     - A fixed number of queries per chunk, rather than per designation
+     - Existence in orbfit_results is taken from the (live) quality-class rows, so it always agrees with quality_class
+     - If a designation_index.DesignationIndex is supplied, validity & comet/satellite-table existence
+       are looked-up in it (rather than queried)
+     - The observations (obs_sbn) are only aggregated if the result can be used:
+       the statistics if triage is enabled, the fingerprints if orbfit_results can store them,
+       & neither if force_refit (see wants_observation_statistics & wants_observation_fingerprints)
+     
+    returns:
+    --------
+    prefetched: dict
+     - { unpacked_provisional_designation : {
+            'IS_IN_ORBFIT_RESULTS'              : Boolean,
+            'IS_PRIMARY_UNPACKED_DESIGNATION'   : Boolean,  # (index only)
+            'IS_IN_COMET_RESULTS'               : Boolean,  # (index only)
+            'IS_IN_SATELLITE_RESULTS'           : Boolean,  # (index only)
+            'observation_statistics'            : element of QueryOrbfitResults.get_observation_statistics (n_obs, arc_days, ...), or None if not fetched,
+            'quality_class'                     : 'good', 'intermediate', 'bad' or None (see classify_quality_dict),
+            'observation_fingerprint'           : str or None,  # of the observations now in the db (None if not fetched)
+            'stored_observation_fingerprint'    : str or None,  # of the observations used for the stored orbit
+        } }
+    """
+    quality      = dict( get_quality_classes(unpacked_provisional_designations , dbConnOrbs) )
+    exists       = { desig : desig in quality for desig in unpacked_provisional_designations }
+    if wants_observation_fingerprints(dbConnOrbs, force_refit):
+        fingerprints = dbConnOrbs.get_observation_fingerprints(unpacked_provisional_designations)
+        stored       = dbConnOrbs.get_stored_observation_fingerprints(unpacked_provisional_designations)
+    else:
+        fingerprints, stored = {}, {}
+    if wants_observation_statistics(force_refit):
+        statistics   = dbConnOrbs.get_observation_statistics(unpacked_provisional_designations)
+        statistics   = { str(row['unpacked_primary_provisional_designation']) : row for row in statistics }
+    else:
+        statistics   = {}
+    prefetched   = { desig : {  'IS_IN_ORBFIT_RESULTS'              : exists[desig] ,
+                                'observation_statistics'            : statistics.get(desig) ,
+                                'quality_class'                     : quality.get(desig) ,
+                                'observation_fingerprint'           : fingerprints.get(desig) ,
+                                'stored_observation_fingerprint'    : stored.get(desig) } for desig in exists }
+    if index is not None:
+        for desig, p in prefetched.items():
+            p['IS_PRIMARY_UNPACKED_DESIGNATION'] = index.is_valid_primary(desig)
+            p['IS_IN_COMET_RESULTS']             = index.in_comet_results(desig)
+            p['IS_IN_SATELLITE_RESULTS']         = index.in_satellite_results(desig)
+    return prefetched
+
+
+def iterate_prefetched_designations(unpacked_provisional_designations , dbConnOrbs , chunk_size=1000 , index=None , force_refit=False):
+    """
+    Generator: yields (desig, prefetched) pairs
+     - designations are consumed in chunks of chunk_size
+     - the database-orbit info for each chunk is fetched with prefetch_database_orbit_info
+     - any supplied DesignationIndex is (re)loaded, if stale, before each chunk
+    """
+    designations = iter(unpacked_provisional_designations)
+    while True:
+        chunk = [str(_) for _ in itertools.islice(designations, chunk_size)]
+        if not chunk:
+            return
+        if index is not None:
+            index.maybe_refresh(dbConnOrbs)
+        prefetched = prefetch_database_orbit_info(chunk , dbConnOrbs , index=index , force_refit=force_refit)
+        for desig in chunk:
+            yield desig, prefetched[desig]
+
+
+def classify_quality_dict(quality_dict):
+    """
+    Classify a quality-json as 'bad', 'intermediate' or 'good'
+     - 'bad'          : a QUALITY_PROBLEMS_BAD message in any of the QUALITY_EPOCH_KEYS
+     - 'intermediate' : a QUALITY_PROBLEMS_INTERMEDIATE message in any of the QUALITY_EPOCH_KEYS
+     - 'good'         : otherwise (the default)
+    NB: QueryOrbfitResults.get_quality_classes does the same classification inside postgres
+    """
+    # Severe problems
+    for problem in QUALITY_PROBLEMS_BAD:
+        # Loop through the different epoch-keys, examining the message-string for each
+        for k in QUALITY_EPOCH_KEYS:
+            if problem in quality_dict[k]:
+                return 'bad'
+
+    # Intermediate problems
+    for problem in QUALITY_PROBLEMS_INTERMEDIATE:
+        for k in QUALITY_EPOCH_KEYS:
+            if problem in quality_dict[k]:
+                return 'intermediate'
+
+    return 'good'
+
+
+def get_quality_classes(unpacked_provisional_designations , dbConnOrbs):
+    """
+    Server-side classification of the orbits for a list of designations (or the whole table if None)
+     - returns a list of (desig, class) tuples: see QueryOrbfitResults.get_quality_classes
+    """
+    return dbConnOrbs.get_quality_classes(  unpacked_provisional_designations ,
+                                            epoch_keys              = QUALITY_EPOCH_KEYS ,
+                                            bad_problems            = QUALITY_PROBLEMS_BAD ,
+                                            intermediate_problems   = QUALITY_PROBLEMS_INTERMEDIATE )
+
+
+def set_quality_flags(assessment_dict, quality_class):
+    """ Set the HAS_*_QUALITY_DICT flags from a quality-class ('good', 'intermediate' or 'bad') """
+    assessment_dict['HAS_BAD_QUALITY_DICT']            = quality_class == 'bad'
+    assessment_dict['HAS_INTERMEDIATE_QUALITY_DICT']   = quality_class == 'intermediate'
+    assessment_dict['HAS_GOOD_QUALITY_DICT']           = quality_class == 'good'
+
+
+def audit_orbit_covariances(unpacked_provisional_designations , dbConnOrbs , chunk_size=5000 , column='standard_epoch_json'):
+    """
+    Generator: re-check the stored elements & covariances of many orbits, yielding (desig, quality-message)
+     - each chunk is fetched in one query & checked in one vectorized call (see orbfit_arrays.fel_quality_messages)
+     - stricter than the stored quality_json: covariances must also be finite, symmetric & positive-definite
+    """
+    designations = iter(unpacked_provisional_designations)
+    while True:
+        chunk = [str(_) for _ in itertools.islice(designations, chunk_size)]
+        if not chunk:
+            return
+        element_jsons = dbConnOrbs.get_element_jsons(chunk , column=column)
+        found    = [ desig for desig in chunk if desig in element_jsons ]
+        feldicts = [ json.loads(element_jsons[desig]) if isinstance(element_jsons[desig], str) else element_jsons[desig] for desig in found ]
+        yield from zip( found , oa.fel_quality_messages(feldicts , check_usable=True) )
+
+
+def assess_quality_of_any_database_orbit(designation_dict , assessment_dict, dbConnOrbs, prefetched=None):
     """
     At present this is just setting one booleans in the assessment_dict ...
+    
+    prefetched: dict or None
+     - If supplied (see prefetch_database_orbit_info), no db queries are made
     """
     unpacked_provisional_designation = designation_dict['unpacked_provisional_designation']
     
     # ----------- (1) Check the database for any extant orbfit results ---------------
     
     # NB(1) : If there is *no* match, then the returned value for orbfit_results_id == False
-    assessment_dict['IS_IN_ORBFIT_RESULTS']        = dbConnOrbs.has_orbfit_result(unpacked_provisional_designation)
-    assessment_dict['IS_IN_COMET_RESULTS']         = False
-    assessment_dict['IS_IN_SATELLITE_RESULTS']     = False
+    if prefetched is not None:
+        assessment_dict['IS_IN_ORBFIT_RESULTS']    = prefetched['IS_IN_ORBFIT_RESULTS']
+    else:
+        assessment_dict['IS_IN_ORBFIT_RESULTS']    = dbConnOrbs.has_orbfit_result(unpacked_provisional_designation)
+    assessment_dict['IS_IN_COMET_RESULTS']         = prefetched.get('IS_IN_COMET_RESULTS', False)      if prefetched is not None else False
+    assessment_dict['IS_IN_SATELLITE_RESULTS']     = prefetched.get('IS_IN_SATELLITE_RESULTS', False)  if prefetched is not None else False
     assessment_dict['HAS_NO_RESULTS']              = not ( assessment_dict['IS_IN_ORBFIT_RESULTS'] or assessment_dict['IS_IN_COMET_RESULTS'] or assessment_dict['IS_IN_SATELLITE_RESULTS'] )
     
     
@@ -473,47 +1436,21 @@ def assess_quality_of_any_database_orbit(designation_dict , assessment_dict, dbC
     # ------------- (2) Assess the quality of any results that exist in the database --
     if assessment_dict['IS_IN_ORBFIT_RESULTS'] :
     
-        quality_dict = dbConnOrbs.get_quality_json(unpacked_provisional_designation)
-        
-        # Things to loop through
-        expected_topline_keys = ["mid_epoch","std_epoch"]
-        problems_A  = ["no orbit"]
-        problems_B  = ["no CAR covariance", "no COM covariance"]
-
-        # Default is "good"
-        assessment_dict['HAS_BAD_QUALITY_DICT']            = False
-        assessment_dict['HAS_INTERMEDIATE_QUALITY_DICT']   = False
-        assessment_dict['HAS_GOOD_QUALITY_DICT']           = True
+        if prefetched is not None:
+            quality_class = prefetched['quality_class']
+        else:
+            quality_class = classify_quality_dict( dbConnOrbs.get_quality_json(unpacked_provisional_designation) )
 
-            
-        # Severe problems
-        for problem in problems_A:
-            # Loop through the different epoch-keys, examining the message-string for each
-            for k in expected_topline_keys:
-                message_string = quality_dict[k]
-                if problem in message_string:
-                    assessment_dict['HAS_BAD_QUALITY_DICT']            = True
-                    assessment_dict['HAS_INTERMEDIATE_QUALITY_DICT']   = False
-                    assessment_dict['HAS_GOOD_QUALITY_DICT']           = False
-                    return
-                    
-        # Intermediate problems
-        for problem in problems_B:
-            # Loop through the different epoch-keys, examining the message-string for each
-            for k in expected_topline_keys:
-                message_string = quality_dict[k]
-                if problem in message_string:
-                    assessment_dict['HAS_BAD_QUALITY_DICT']            = False
-                    assessment_dict['HAS_INTERMEDIATE_QUALITY_DICT']   = True
-                    assessment_dict['HAS_GOOD_QUALITY_DICT']           = False
-                    return
-        # return
+        set_quality_flags(assessment_dict, quality_class)
         return
   
+    # No quality-assessment is in place for comet / satellite results yet: their status is left as unestablished ('099')
     elif assessment_dict['IS_IN_COMET_RESULTS'] :
-        sys.exit('Assessment not in place for IS_IN_COMET_RESULTS ...')
+        print('\t', unpacked_provisional_designation, ': quality-assessment not yet in place for IS_IN_COMET_RESULTS')
+        return
     elif assessment_dict['IS_IN_SATELLITE_RESULTS'] :
-        sys.exit('Assessment not in place for IS_IN_SATELLITE_RESULTS ...')
+        print('\t', unpacked_provisional_designation, ': quality-assessment not yet in place for IS_IN_SATELLITE_RESULTS')
+        return
     elif assessment_dict['HAS_NO_RESULTS'] :
         return
     else:
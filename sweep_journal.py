@@ -0,0 +1,99 @@
+"""
+Append-only checkpoint journal for long orbit-checking sweeps
+
+Every designation that check_single_designation works on records the stage it
+has reached (and, finally, its status-code) in a local SQLite file.
+If a sweep crashes (or hits a sys.exit) it can be restarted with the same
+journal: finished designations are skipped & in-flight ones are re-checked first.
+
+ - SQLite in WAL mode: several worker processes can write to the same journal file concurrently
+ - Each record is committed as it is written, so nothing is lost on a crash
+ - Entries are only ever appended: the latest entry for a designation is its current state
+"""
+
+# --------- Third-Party imports -----
+import os
+import sqlite3
+
+
+# Stages recorded by check_single_designation (in the order in which they are reached)
+STAGES = [
+    'DB_ASSESSMENT',        # assessing any extant database-orbit
+    'ORBFIT',               # running orbfit
+    'RESULT_ASSESSMENT',    # assessing the orbfit result
+    'DB_WRITE',             # writing the result to the database
+    'DB_WRITE_FAILED',      # the result could not be written to the database
+    'REASSESSMENT',         # re-assessing the orbit now in the database
+    'DONE',                 # status-code generated
+]
+
+
+class SweepJournal():
+    '''
+    Checkpoint journal backed by a local SQLite file
+    '''
+
+    def __init__(self, filepath='orbit_checker_journal.sqlite', timeout=60):
+        """
+        Open (creating if necessary) the journal at filepath
+         - timeout: seconds to wait for a lock held by another writer
+        """
+        self.filepath = filepath
+        self.conn = sqlite3.connect(filepath, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            designation TEXT NOT NULL,
+            stage       TEXT NOT NULL,
+            status      TEXT,
+            pid         INTEGER,
+            recorded_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS journal_designation ON journal (designation)")
+
+
+    def record(self, designation, stage, status=None):
+        """ Append an entry: designation has reached stage (with status-code, if known) """
+        assert stage in STAGES, f'Unknown journal stage: {stage}'
+        self.conn.execute(
+            "INSERT INTO journal (designation, stage, status, pid) VALUES (?, ?, ?, ?)",
+            (str(designation), stage, status, os.getpid())
+        )
+
+
+    def latest(self):
+        """
+        The latest entry for every designation in the journal
+
+        returns : dictionary
+         - {designation : (stage, status)}
+        """
+        rows = self.conn.execute("""
+        SELECT designation, stage, status
+        FROM journal
+        WHERE id IN (SELECT MAX(id) FROM journal GROUP BY designation)
+        """).fetchall()
+        return { desig : (stage, status) for desig, stage, status in rows }
+
+
+    def completed(self):
+        """ {designation : status} for every designation that reached DONE """
+        return { desig : status for desig, (stage, status) in self.latest().items() if stage == 'DONE' }
+
+
+    def in_flight(self):
+        """ {designation : stage} for every designation that was started but did not reach DONE """
+        return { desig : stage for desig, (stage, status) in self.latest().items() if stage != 'DONE' }
+
+
+    def close(self):
+        self.conn.close()
+
+
+def record_stage(journal, designation, stage, status=None):
+    """ Record a stage if a journal is in use (journal may be None) """
+    if journal is not None:
+        journal.record(designation, stage, status=status)
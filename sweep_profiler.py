@@ -0,0 +1,157 @@
+"""
+Optional cProfile / tracemalloc profiling of orbit-checking sweeps
+
+A SweepProfiler wraps (every Nth) check_single_designation call in cProfile and/or tracemalloc.
+ - cProfile      : a single Profile per process is enabled around each sampled call,
+                   so the statistics accumulate across designations
+ - tracemalloc   : tracing is started at the beginning of each sampled call and the
+                   memory still allocated at its end is accumulated per allocation-site (file:line)
+
+Each process dumps its own cumulative files into profile_dir (see dump),
+and combine(profile_dir) merges the files from every process (e.g. pool workers)
+into a single profile & a table of the top allocation sites.
+"""
+
+# --------- Third-Party imports -----
+import os
+import glob
+import json
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+
+class SweepProfiler():
+    '''
+    Sampled cProfile / tracemalloc profiling of the designations checked in one process
+    '''
+
+    def __init__(self, profile_dir, every=1, cpu=True, memory=False, nframes=1):
+        """
+        profile_dir: str
+         - directory into which the per-process files are dumped
+
+        every: int
+         - only every Nth designation is profiled (keeping the overhead low in production)
+
+        cpu, memory: Boolean
+         - whether to run cProfile and/or tracemalloc on the sampled designations
+
+        nframes: int
+         - number of frames kept by tracemalloc for each allocation (1 => file:line of the allocation)
+        """
+        os.makedirs(profile_dir, exist_ok=True)
+        self.profile_dir = profile_dir
+        self.every       = max(1, int(every))
+        self.cpu         = cpu
+        self.memory      = memory
+        self.nframes     = nframes
+        self.calls       = 0
+        self.sampled     = 0
+        self.dirty       = False
+        self.profile     = cProfile.Profile() if cpu else None
+        self.allocations = {}   # 'file:line' -> [size (bytes), count]
+
+
+    @contextmanager
+    def sample(self, advance=True):
+        """
+        Context-manager: profile the enclosed call if it is one of the sampled (every Nth) calls
+         - advance=False: sample as the *next* call will be, without counting this one
+           (e.g. work shared by a batch, profiled with the batch's first designation)
+        """
+        if advance:
+            self.calls += 1
+        if (self.calls - (1 if advance else 0)) % self.every:
+            yield
+            return
+
+        self.sampled += 1
+        self.dirty    = True
+        if self.memory:
+            tracemalloc.start(self.nframes)
+        if self.cpu:
+            self.profile.enable()
+        try:
+            yield
+        finally:
+            if self.cpu:
+                self.profile.disable()
+            if self.memory:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                for stat in snapshot.statistics('lineno'):
+                    frame = stat.traceback[0]
+                    site  = self.allocations.setdefault(f'{frame.filename}:{frame.lineno}', [0, 0])
+                    site[0] += stat.size
+                    site[1] += stat.count
+
+
+    def dump(self):
+        """ (Re)write this process's cumulative files into profile_dir (if anything new has been sampled) """
+        if not self.dirty:
+            return
+        pid = os.getpid()
+        if self.cpu:
+            self.profile.dump_stats( os.path.join(self.profile_dir, f'profile_{pid}.prof') )
+        if self.memory:
+            with open( os.path.join(self.profile_dir, f'allocations_{pid}.json') , 'w') as fh:
+                json.dump({ 'sampled' : self.sampled , 'allocations' : self.allocations }, fh)
+        self.dirty = False
+
+
+def profile(profiler, advance=True):
+    """ Context-manager: profiler.sample(advance) if a profiler (may be None) is in use """
+    return profiler.sample(advance) if profiler is not None else _no_profile()
+
+
+@contextmanager
+def _no_profile():
+    yield
+
+
+def clear(profile_dir):
+    """ Remove the per-process files of any previous sweep from profile_dir """
+    for filepath in glob.glob(os.path.join(profile_dir, 'profile_*.prof')) + glob.glob(os.path.join(profile_dir, 'allocations_*.json')):
+        os.remove(filepath)
+
+
+def combine(profile_dir, top=25, sort='cumulative'):
+    """
+    Merge the per-process files in profile_dir
+     - writes combined.prof (load with pstats / snakeviz) & top_allocations.txt
+     - prints the top functions & the top allocation sites
+
+    returns:
+    --------
+    stats       : pstats.Stats or None
+    allocations : list of (site, size (bytes), count), largest first
+    """
+    stats = None
+    profiles = sorted(glob.glob(os.path.join(profile_dir, 'profile_*.prof')))
+    if profiles:
+        stats = pstats.Stats(*profiles)
+        stats.dump_stats( os.path.join(profile_dir, 'combined.prof') )
+        print(f'\nCombined cProfile of {len(profiles)} process(es) : {os.path.join(profile_dir, "combined.prof")}')
+        stats.sort_stats(sort).print_stats(top)
+
+    merged, sampled = {}, 0
+    for filepath in sorted(glob.glob(os.path.join(profile_dir, 'allocations_*.json'))):
+        with open(filepath) as fh:
+            d = json.load(fh)
+        sampled += d['sampled']
+        for site, (size, count) in d['allocations'].items():
+            m = merged.setdefault(site, [0, 0])
+            m[0] += size
+            m[1] += count
+    allocations = sorted( ( (site, size, count) for site, (size, count) in merged.items() ), key=lambda _: -_[1] )
+
+    if allocations:
+        lines = [ f'Top allocation sites (memory still allocated at the end of each of N={sampled} sampled designations)' ]
+        lines.extend( f'{size/1024:12.1f} KiB {count:10d} blocks  {site}' for site, size, count in allocations[:top] )
+        with open( os.path.join(profile_dir, 'top_allocations.txt') , 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        print('\n' + '\n'.join(lines))
+
+    return stats, allocations
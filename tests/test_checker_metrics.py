@@ -0,0 +1,73 @@
+"""
+checker_metrics timing & aggregation, driven by record_stage marks (no database or orbfit needed)
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import json
+import pytest
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import checker_metrics
+import sweep_journal
+
+
+def timed(*stages, status='000'):
+    """ The finished timing record of one designation that went through the supplied stages """
+    timer = checker_metrics.StageTimer()
+    for stage in stages:
+        sweep_journal.record_stage(timer, '2006 WU224', stage)
+    sweep_journal.record_stage(timer, '2006 WU224', 'DONE', status=status)
+    return timer.pop_finished()[0]
+
+
+def test_outcome_follows_the_write_result():
+    assert timed('DB_ASSESSMENT')['outcome'] == 'assessed'
+    assert timed('DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT')['outcome'] == 'fit_not_written'
+    assert timed('DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT', 'DB_WRITE', 'REASSESSMENT')['outcome'] == 'fit_written'
+    assert timed('DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT', 'DB_WRITE', 'DB_WRITE_FAILED', 'REASSESSMENT')['outcome'] == 'fit_not_written'
+
+
+def test_stage_durations_and_pause():
+    timer = checker_metrics.StageTimer()
+    sweep_journal.record_stage(timer, '2006 WU224', 'ORBFIT')
+    checker_metrics.pause_stage(timer, '2006 WU224')            # e.g. the rest of the batch is being fitted
+    sweep_journal.record_stage(timer, '2006 WU224', 'RESULT_ASSESSMENT')
+    sweep_journal.record_stage(timer, '2006 WU224', 'DONE', status='000')
+    record = timer.pop_finished()[0]
+    assert set(record['durations']) == {'ORBFIT', 'RESULT_ASSESSMENT'}
+    assert record['total'] == pytest.approx(sum(record['durations'].values()))
+    assert timer.pop_finished() == [] and timer.open == {}
+    checker_metrics.pause_stage(None, '2006 WU224')             # no timer: nothing to do
+
+
+def test_sweep_metrics_aggregates_records():
+    metrics = checker_metrics.SweepMetrics()
+    metrics.add([ timed('DB_ASSESSMENT') ,
+                  timed('DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT', 'DB_WRITE', status='100') ,
+                  timed('DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT', 'DB_WRITE', 'DB_WRITE_FAILED', status='100') ])
+    metrics.add_crashed('2020 AB1')
+    summary = metrics.as_dict()
+    assert summary['designations'] == 4
+    assert summary['outcomes'] == {'assessed' : 1, 'fit_written' : 1, 'fit_not_written' : 1, 'crashed' : 1}
+    assert summary['statuses'] == {'000' : 1, '100' : 2}
+    assert summary['stages']['DB_ASSESSMENT']['count'] == 3 and summary['stages']['DB_WRITE_FAILED']['count'] == 1
+    assert summary['stages']['REASSESSMENT'] == {'count' : 0, 'sum' : 0.0, 'p50' : None, 'p90' : None, 'p99' : None, 'max' : None}
+
+
+def test_sweep_metrics_files(tmp_path):
+    metrics = checker_metrics.SweepMetrics(str(tmp_path / 'metrics.prom'), interval=3600)
+    metrics.add([ timed('DB_ASSESSMENT', 'ORBFIT') ])
+    metrics.maybe_write()                                       # not yet due
+    assert not os.path.exists(tmp_path / 'metrics.prom')
+
+    metrics.write()
+    text = (tmp_path / 'metrics.prom').read_text()
+    assert 'orbit_checker_designations_total{outcome="fit_not_written"} 1' in text
+    assert 'orbit_checker_stage_seconds_count{stage="ORBFIT"} 1' in text
+
+    metrics.write(str(tmp_path / 'metrics.json'))
+    with open(tmp_path / 'metrics.json') as fh:
+        assert json.load(fh)['statuses'] == {'000' : 1}
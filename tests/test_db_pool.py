@@ -0,0 +1,101 @@
+"""
+db_pool checkout / return, dead-connection replacement & fork handling, against a fake psycopg2 pool (no database needed)
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import pytest
+
+pytest.importorskip('psycopg2')
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import db_pool
+
+
+class FakeCursor():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query):
+        pass
+
+
+class FakeConnection():
+    def __init__(self, closed=False):
+        self.closed = closed
+
+    def cursor(self):
+        return FakeCursor()
+
+    def rollback(self):
+        pass
+
+
+class FakePool():
+    """ Stand-in for ThreadedConnectionPool: hands out the queued connections, then new live ones """
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.queued, self.returned, self.closed = [], [], False
+
+    def getconn(self):
+        return self.queued.pop(0) if self.queued else FakeConnection()
+
+    def putconn(self, conn, close=False):
+        self.returned.append((conn, close))
+
+    def closeall(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def pools(monkeypatch):
+    """ Fresh (fake) pools for every test """
+    monkeypatch.setattr(db_pool, 'ThreadedConnectionPool', FakePool)
+    monkeypatch.setattr(db_pool, '_pools', {})
+    monkeypatch.setattr(db_pool, '_owners', {})
+    monkeypatch.setattr(db_pool, '_abandoned', [])
+    monkeypatch.setattr(db_pool, '_pid', os.getpid())
+    monkeypatch.setitem(db_pool.POOL_CONFIG, 'maxconn', 1)
+    monkeypatch.setitem(db_pool.POOL_CONFIG, 'timeout', 0.01)
+
+
+def pool_of(db_name='vmsops'):
+    return db_pool._pools[('localhost', 'postgres', db_name)][0]
+
+
+def test_returned_connection_frees_its_slot():
+    conn = db_pool.getconn('localhost', 'postgres', 'vmsops')
+    assert db_pool._owners[id(conn)] == ('localhost', 'postgres', 'vmsops')
+    with pytest.raises(db_pool.PoolError):
+        db_pool.getconn('localhost', 'postgres', 'vmsops')
+
+    db_pool.putconn(conn)
+    assert db_pool._owners == {} and pool_of().returned == [(conn, False)]
+    db_pool.putconn(db_pool.getconn('localhost', 'postgres', 'vmsops'))
+
+
+def test_dead_connections_are_replaced():
+    dead = FakeConnection(closed=True)
+    db_pool._get_pool('localhost', 'postgres', 'vmsops')
+    pool_of().queued.append(dead)
+    conn = db_pool.getconn('localhost', 'postgres', 'vmsops')
+    assert conn is not dead and pool_of().returned == [(dead, True)]
+
+
+def test_forked_child_never_touches_the_parent_pools(monkeypatch):
+    inherited = db_pool.getconn('localhost', 'postgres', 'vmsops')
+    parent    = pool_of()
+
+    monkeypatch.setattr(db_pool, '_pid', -1)    # as if this process were a forked child
+    db_pool.getconn('localhost', 'postgres', 'vmsops')
+    assert pool_of() is not parent and db_pool._abandoned[0][0] is parent
+
+    # the inherited connection is neither returned to (nor closed by) the child
+    db_pool.putconn(inherited)
+    db_pool.closeall()
+    assert parent.returned == [] and not parent.closed
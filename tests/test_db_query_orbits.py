@@ -0,0 +1,92 @@
+"""
+QueryOrbfitResults transaction handling, against a fake connection (no database needed)
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import pytest
+
+pytest.importorskip('psycopg2')
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import db_query_orbits_dev as query_orbs
+
+
+class FakeCursor():
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+        if self.conn.fail:
+            raise RuntimeError('query failed')
+
+    def fetchall(self):
+        if self.conn.responses:
+            return self.conn.responses.pop(0)
+        return [ (row,) for row in self.conn.rows ]
+
+
+class FakeConnection():
+    """ Every query returns *rows* (as single-column rows), unless a per-query list of *responses* is supplied """
+
+    def __init__(self, rows=(), fail=False, responses=()):
+        self.rows, self.fail, self.responses = list(rows), fail, list(responses)
+        self.queries, self.rollbacks = [], 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def query_orbfit_results(conn):
+    """ A QueryOrbfitResults on a fake connection (bypassing the pool) """
+    db        = query_orbs.QueryOrbfitResults.__new__(query_orbs.QueryOrbfitResults)
+    db.dbConn = conn
+    db.dbCur  = conn.cursor()
+    return db
+
+
+def test_execute_query_ends_the_transaction():
+    conn = FakeConnection(rows=['2006 WU224'])
+    assert query_orbfit_results(conn).execute_query('SELECT 1 ;') == ['2006 WU224']
+    assert conn.rollbacks == 1
+
+
+def test_failed_query_raises_and_ends_the_transaction():
+    conn = FakeConnection(fail=True)
+    with pytest.raises(RuntimeError):
+        query_orbfit_results(conn).execute_query_rows('SELECT 1 ;')
+    assert conn.rollbacks == 1
+
+
+def test_db_time_is_the_wall_clock():
+    conn = FakeConnection(rows=['2026-01-01T00:00:00+00:00'])
+    query_orbfit_results(conn).get_db_time()
+    assert 'clock_timestamp()' in conn.queries[-1] and 'now()' not in conn.queries[-1]
+
+
+def test_missing_fingerprint_column_is_probed_once():
+    conn = FakeConnection(rows=[False])
+    db   = query_orbfit_results(conn)
+    assert db.get_stored_observation_fingerprints(['2006 WU224']) == {}
+    assert db.get_stored_observation_fingerprints(['2006 WU224']) == {}
+    assert len(conn.queries) == 1 and 'information_schema' in conn.queries[0]
+
+
+def test_own_refits_are_not_changes():
+    fingerprint = lambda **fps : [ ({'unpacked_primary_provisional_designation' : d, 'observation_fingerprint' : fp},) for d, fp in fps.items() ]
+    conn = FakeConnection(responses=[
+        [ ('2021 CD2',) ] ,                                                         # new observations
+        [ ('2006 WU224', True), ('2020 AB1', True), ('2021 CD2', True), ('2022 EF3', False) ] ,   # orbfit_results updates
+        [ (True,) ] ,                                                               # observation_fingerprint column
+        fingerprint(**{'2006 WU224' : 'a', '2020 AB1' : 'b'}) ,                     # current fingerprints
+        fingerprint(**{'2006 WU224' : 'a', '2020 AB1' : 'old'}) ,                   # stored fingerprints
+    ])
+    changed = query_orbfit_results(conn).get_designations_changed_since('2026-01-01', '2026-01-01', own_writes_until='2026-01-02')
+    # 2006 WU224 was refit by the last pass to the observations still in the db
+    assert changed == ['2020 AB1', '2021 CD2', '2022 EF3']
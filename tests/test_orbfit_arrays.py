@@ -0,0 +1,154 @@
+"""
+orbfit_arrays.read_rwo against an .rwo file in the orbfit layout (tests/data/2006WU224.rwo)
+ - the fixture contains a radar record & a garbled line, both of which must be skipped
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import numpy as np
+import pytest
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import orbfit_arrays as oa
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'data', '2006WU224.rwo')
+
+
+def test_read_rwo_header():
+    header, arr = oa.read_rwo(FIXTURE)
+    assert header['version'] == '3'
+    assert header['errmod'] == 'vfcc17'
+
+
+def test_read_rwo_skips_radar_and_bad_lines():
+    header, arr = oa.read_rwo(FIXTURE)
+    assert len(arr) == 4
+    assert list(arr['obs_type']) == ['O', 'O', 'O', 'O']
+
+
+def test_read_rwo_columns():
+    header, arr = oa.read_rwo(FIXTURE)
+    first = arr[0]
+    assert first['design'] == '2006WU224'
+    assert (first['obs_type'], first['tech'], first['note']) == ('O', 'C', '')
+    assert (first['year'], first['month']) == (2006, 11)
+    assert np.isclose(first['day'], 20.341289)
+    assert (first['ra_h'], first['ra_m']) == (3, 12) and np.isclose(first['ra_s'], 45.123)
+    assert np.isclose(first['ra_rms'], 0.5) and first['ra_flag'] == 'F'
+    assert np.isclose(first['ra_resid'], 0.123)
+    assert first['dec_sign'] == '+' and (first['dec_d'], first['dec_m']) == (14, 22) and np.isclose(first['dec_s'], 33.45)
+    assert np.isclose(first['dec_resid'], -0.210)
+    assert np.isclose(first['mag'], 19.8) and first['mag_band'] == 'V'
+    assert first['catalog'] == 'c'
+    assert first['station'] == '691'
+    assert np.isclose(first['chi'], 0.35)
+    assert (first['sel_astrom'], first['sel_mag']) == (1, 1)
+
+    # Note, absent magnitude & de-selected observation
+    assert arr[2]['note'] == 'K' and np.isnan(arr[2]['mag']) and arr[2]['station'] == 'G96'
+    assert (arr[2]['sel_astrom'], arr[2]['sel_mag']) == (0, 0)
+
+    # Southern declination
+    assert arr[3]['dec_sign'] == '-' and arr[3]['dec_deg'] < 0 and arr[3]['station'] == 'F51'
+
+
+def test_read_rwo_derived_columns():
+    header, arr = oa.read_rwo(FIXTURE)
+    # 2006-11-20.341289 UTC
+    assert np.isclose(arr[0]['mjd'], 54059.341289)
+    assert np.isclose(arr[0]['ra_deg'], 15.0 * (3 + 12/60.0 + 45.123/3600.0))
+    assert np.isclose(arr[3]['dec_deg'], -(3 + 45/60.0 + 6.70/3600.0))
+
+
+def _fixture_lines():
+    with open(FIXTURE) as fh:
+        return [ line.rstrip('\n') for line in fh if line.startswith(' ') ]
+
+
+def test_rwo_dict_to_array_raw_lines():
+    # e.g. { observation-number : raw .rwo line }: the radar & garbled lines are dropped
+    arr = oa.rwo_dict_to_array({ str(k) : line for k, line in enumerate(_fixture_lines()) })
+    header, expected = oa.read_rwo(FIXTURE)
+    assert len(arr) == len(expected)
+    assert np.allclose(arr['mjd'], expected['mjd']) and list(arr['station']) == list(expected['station'])
+
+
+def test_rwo_dict_to_array_keyed_records():
+    # per-observation dictionaries, keyed by the RWO field names / unambiguous banner labels
+    header, expected = oa.read_rwo(FIXTURE)
+    rwodict = { 'header' : header ,
+                'observations' : [ { 'Design' : str(o['design']), 'obs_type' : str(o['obs_type']), 'MJD' : float(o['mjd']),
+                                     'Cod' : str(o['station']), 'Chi' : float(o['chi']),
+                                     'RA_resid' : float(o['ra_resid']), 'Dec_resid' : float(o['dec_resid']) } for o in expected ] }
+    arr = oa.rwo_dict_to_array(rwodict)
+    assert len(arr) == len(expected)
+    assert list(arr['station']) == list(expected['station'])
+    assert np.allclose(arr['mjd'], expected['mjd']) and np.allclose(arr['chi'], expected['chi'])
+    assert np.allclose(arr['ra_resid'], expected['ra_resid'])
+
+
+def test_rwo_dict_to_array_numbered_records_with_header():
+    # { observation-number : record } alongside a header: the header is not an observation
+    header, expected = oa.read_rwo(FIXTURE)
+    rwodict = { str(k) : { 'station' : str(o['station']), 'mjd' : float(o['mjd']), 'chi' : float(o['chi']) } for k, o in enumerate(expected) }
+    rwodict['header'] = header
+    arr = oa.rwo_dict_to_array(rwodict)
+    assert len(arr) == len(expected) and np.allclose(arr['chi'], expected['chi'])
+
+
+def test_rwo_dict_to_array_unrecognized_layouts_raise():
+    # no residual fields: screening would silently find nothing, so this is an error
+    with pytest.raises(ValueError):
+        oa.rwo_dict_to_array({ 'observations' : [ { 'K' : 'O', 'ra' : 10.0, 'dec' : 5.0, 'obs' : '691' } ] })
+    # nothing that looks like an observation at all
+    with pytest.raises(ValueError):
+        oa.rwo_dict_to_array({ 'version' : 3, 'errmod' : 'vfcc17' })
+    # (an empty dictionary simply has no observations)
+    assert len(oa.rwo_dict_to_array({})) == 0
+
+
+def test_rwo_dict_to_array_screens_tracklets():
+    # the outlying (chi=7.95) observation is found from the dictionary as from the file
+    header, expected = oa.read_rwo(FIXTURE)
+    arr    = oa.rwo_dict_to_array({ 'observations' : [ { 'design' : str(o['design']), 'station' : str(o['station']),
+                                                          'mjd' : float(o['mjd']), 'chi' : float(o['chi']) } for o in expected ] })
+    screen = oa.screen_tracklets([arr, expected])
+    assert list(screen['has_bad_tracklets']) == [True, True]
+
+
+def test_check_covariances_mixed_units():
+    # diagonal & positive-definite, but with variances spanning many orders of magnitude (AU vs degrees)
+    elements    = np.ones((3,6))
+    covariances = np.stack([ np.diag([4e-20, 1e-14, 1e-10, 1e-10, 1e-10, 1e-10]) ,
+                             np.diag([1.0, 1.0, 1.0, 1.0, 1.0, -1.0]) ,
+                             np.ones((6,6)) ])
+    checks = oa.check_covariances(elements, covariances)
+    assert list(checks['usable']) == [True, False, False]
+
+
+def test_write_fel_file_skips_orbits_without_an_epoch(tmp_path):
+    elements = { f'element{i}' : float(i + 1) for i in range(6) }
+    feldicts = { 'K06W24U' : { 'epoch' : 60000.5 , 'EQU' : dict(elements) } ,
+                 'K20A01B' : { 'EQU' : dict(elements) } ,
+                 'K21C02D' : { 'epoch' : None , 'EQU' : dict(elements) } ,
+                 'K22E03F' : { 'EQU' : dict(elements, epoch='') , 'KEP' : dict(elements, epoch=60100.0) } }
+    filepath = str(tmp_path / 'initial_orbits.oel')
+    written  = oa.write_fel_file(filepath, feldicts, coordtypes=oa.INITIAL_ORBIT_COORD_TYPES, first_only=True)
+    assert written == ['K06W24U', 'K22E03F']
+    with open(filepath) as fh:
+        text = fh.read()
+    assert '60000.500000000' in text and ' KEP ' in text and ' EQU ' in text and '60100.000000000' in text
+
+
+def test_fel_quality_messages_keep_the_stored_vocabulary():
+    elements = { f'element{i}' : float(i + 1) for i in range(6) }
+    bad_cov  = { f'cov{i}{j}' : -1.0 for i in range(6) for j in range(i, 6) }
+    full     = { c : dict(elements, **{ f'cov{i}{j}' : 1e-10 * (i == j) for i in range(6) for j in range(i, 6) }) for c in oa.FEL_COORD_TYPES }
+    feldicts = [ {} ,
+                 full ,
+                 dict(full, CAR={ 'element0' : 1.0 }, COT={}) ,
+                 dict(full, COM=dict(elements, **bad_cov)) ]
+    assert oa.fel_quality_messages(feldicts) == [ 'no orbit' , 'ok' , 'no CAR covariance, no COT' , 'ok' ]
+    assert oa.fel_quality_messages(feldicts, check_usable=True)[3] == 'unusable COM covariance'
@@ -0,0 +1,277 @@
+"""
+orbit_checker units that need no database or orbfit run
+ - the db-connections are replaced by small fakes (see FakeQueryOrbfitResults)
+ - skipped if the checker's own (non-lazy) dependencies are not installed
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import datetime
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('mpc_convert')
+pytest.importorskip('query_ids')
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import orbit_checker as oc
+
+
+class FakeQueryOrbfitResults():
+    """ Stand-in for QueryOrbfitResults: a clock that advances on every call (as clock_timestamp does) """
+
+    def __init__(self, changed=()):
+        self.changed = list(changed)
+        self.now     = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        self.closed  = False
+
+    def get_db_time(self):
+        self.now += datetime.timedelta(seconds=1)
+        return self.now
+
+    def get_designations_changed_since(self, observations_since, orbfit_results_since, own_writes_until=None):
+        return list(self.changed)
+
+    def db_close(self):
+        self.closed = True
+
+
+class FakeIndex():
+    """ Stand-in for a loaded DesignationIndex: every designation is a valid primary """
+
+    def __init__(self, orbfit_results=(), comet_results=(), satellite_results=()):
+        self.orbfit_results, self.comet_results, self.satellite_results = set(orbfit_results), set(comet_results), set(satellite_results)
+
+    def is_valid_primary(self, desig):
+        return True
+
+    def in_orbfit_results(self, desig):
+        return desig in self.orbfit_results
+
+    def in_comet_results(self, desig):
+        return desig in self.comet_results
+
+    def in_satellite_results(self, desig):
+        return desig in self.satellite_results
+
+
+class FakePrefetchOrbfitResults():
+    """ Stand-in for the QueryOrbfitResults methods used by prefetch_database_orbit_info: records the aggregates run """
+
+    def __init__(self, orbits=(), fingerprint_column=True):
+        self.orbits             = dict(orbits)
+        self.fingerprint_column = fingerprint_column
+        self.aggregates         = []
+
+    def has_orbfit_results(self, desigs):
+        return { desig : desig in self.orbits for desig in desigs }
+
+    def get_quality_classes(self, desigs, **kwargs):
+        return [ (desig, self.orbits[desig]) for desig in desigs if desig in self.orbits ]
+
+    def has_observation_fingerprint_column(self):
+        return self.fingerprint_column
+
+    def get_observation_fingerprints(self, desigs):
+        self.aggregates.append('fingerprints')
+        return { desig : 'current' for desig in desigs }
+
+    def get_stored_observation_fingerprints(self, desigs):
+        return { desig : 'current' for desig in desigs if desig in self.orbits }
+
+    def get_observation_statistics(self, desigs):
+        self.aggregates.append('statistics')
+        return [ {'unpacked_primary_provisional_designation' : desig, 'n_obs' : 2, 'arc_days' : 0.5, 'n_c51' : 0, 'frac_c51' : 0.0} for desig in desigs ]
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    """ A MONITOR pass over fakes: every designation is 'checked' without a fit """
+    db      = FakeQueryOrbfitResults(changed=['2006 WU224', 'A908 CA', 'C/2020 K2'])
+    checked = []
+    def check_designation_batch(batch, *args, **kwargs):
+        for desig, prefetched in batch:
+            checked.append(desig)
+            yield desig, '000'
+    monkeypatch.setattr(oc, 'open_db_connections', lambda read_only=False : (None, db, None))
+    monkeypatch.setattr(oc, 'iterate_prefetched_designations', lambda desigs, dbConnOrbs, chunk_size=1000, index=None : ( (str(_), {}) for _ in desigs ))
+    monkeypatch.setattr(oc, 'check_designation_batch', check_designation_batch)
+    return db, checked
+
+
+# ------------------ MONITORING WATERMARKS -------------------------------------------
+
+def test_load_watermarks_defaults(tmp_path):
+    watermarks = oc.load_watermarks(str(tmp_path / 'missing.json'))
+    assert watermarks['observations'] == watermarks['orbfit_results'] == '1970-01-01T00:00:00+00:00'
+    assert watermarks['own_writes_until'] is None
+
+
+def test_save_and_load_watermarks(tmp_path):
+    path     = str(tmp_path / 'watermark.json')
+    started  = datetime.datetime(2026, 1, 1, 0, 0, 0, tzinfo=datetime.timezone.utc)
+    finished = datetime.datetime(2026, 1, 2, 0, 0, 0, tzinfo=datetime.timezone.utc)
+    oc.save_watermarks(path, started, finished)
+    watermarks = oc.load_watermarks(path)
+    assert watermarks == { 'observations'     : started.isoformat() ,
+                           'orbfit_results'   : started.isoformat() ,
+                           'own_writes_until' : finished.isoformat() }
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_load_watermarks_from_an_older_pass(tmp_path):
+    # a watermark file written before own_writes_until existed: every orbfit_results update counts as a change
+    path = tmp_path / 'watermark.json'
+    path.write_text('{"observations" : "2026-01-01T00:00:00+00:00", "orbfit_results" : "2026-01-01T00:00:00+00:00"}')
+    watermarks = oc.load_watermarks(str(path))
+    assert watermarks['observations'] == '2026-01-01T00:00:00+00:00' and watermarks['own_writes_until'] is None
+
+
+def test_monitor_pass_marks_start_and_end(tmp_path, monitor):
+    db, checked = monitor
+    path        = str(tmp_path / 'watermark.json')
+    statuses    = oc.check_multiple_designations(method='MONITOR', watermark_path=path)
+
+    # 'A...' designations & comets are filtered out (keep_designation)
+    assert checked == ['2006 WU224'] and statuses == {'2006 WU224' : '000'}
+
+    # The end of the pass is a later db-time than its start
+    watermarks = oc.load_watermarks(path)
+    assert watermarks['observations'] == watermarks['orbfit_results']
+    assert watermarks['own_writes_until'] > watermarks['orbfit_results']
+
+
+def test_monitor_nothing_changed(tmp_path, monkeypatch):
+    db   = FakeQueryOrbfitResults()
+    monkeypatch.setattr(oc, 'open_db_connections', lambda read_only=False : (None, db, None))
+    path = str(tmp_path / 'watermark.json')
+    assert oc.check_multiple_designations(method='MONITOR', watermark_path=path) == {}
+    watermarks = oc.load_watermarks(path)
+    assert watermarks['own_writes_until'] == watermarks['orbfit_results']
+
+
+def test_monitor_resumes_from_the_journal(tmp_path, monitor):
+    db, checked = monitor
+    db.changed  = ['2006 WU224', '2020 AB1', '2021 CD2']
+    journal     = oc.sweep_journal.SweepJournal(str(tmp_path / 'journal.sqlite'))
+    journal.record('2006 WU224', 'DONE', status='000')
+    journal.record('2021 CD2', 'ORBFIT')
+    journal.close()
+    oc.check_multiple_designations(method='MONITOR', watermark_path=str(tmp_path / 'watermark.json'), journal_path=str(tmp_path / 'journal.sqlite'))
+    # completed designations are skipped & the in-flight ones checked first
+    assert checked == ['2021 CD2', '2020 AB1']
+
+
+# ------------------ CONNECTIONS ------------------------------------------------------
+
+def test_sweep_returns_its_connections(tmp_path, monitor):
+    db, checked = monitor
+    oc.check_multiple_designations(method='MONITOR', watermark_path=str(tmp_path / 'watermark.json'))
+    assert db.closed
+
+
+def test_failed_sweep_returns_its_connections(tmp_path, monitor, monkeypatch):
+    db, checked = monitor
+    def check_designation_batch(batch, *args, **kwargs):
+        raise RuntimeError('orbfit failed')
+        yield
+    monkeypatch.setattr(oc, 'check_designation_batch', check_designation_batch)
+    with pytest.raises(RuntimeError):
+        oc.check_multiple_designations(method='MONITOR', watermark_path=str(tmp_path / 'watermark.json'))
+    assert db.closed
+
+
+# ------------------ TRIAGE & STATUS-CODES --------------------------------------------
+
+def statistics(n_obs, arc_days, n_c51=0):
+    return {'n_obs' : n_obs, 'arc_days' : arc_days, 'n_c51' : n_c51, 'frac_c51' : n_c51 / n_obs if n_obs else 0.0}
+
+
+def test_triage_designation(monkeypatch):
+    assert oc.triage_designation('2006 WU224', False, statistics(3, 10.0)) == ('skip', '002')
+    assert oc.triage_designation('2006 WU224', True,  statistics(20, 0.5)) == ('skip', '100')
+    assert oc.triage_designation('2006 WU224', True,  statistics(20, 10.0)) == ('fit', None)
+    assert oc.triage_designation('2006 WU224', False, statistics(20, 10.0)) == ('fit', None)
+    # nothing known about the observations: no triage
+    assert oc.triage_designation('2006 WU224', False, statistics(0, 0.0)) == ('fit', None)
+    assert oc.triage_designation('2006 WU224', False, None) == ('fit', None)
+
+    monkeypatch.setitem(oc.TRIAGE_CONFIG, 'route_no_orbit', 'iod')
+    assert oc.triage_designation('2006 WU224', False, statistics(20, 10.0)) == ('iod', None)
+    assert oc.triage_designation('C/2020 K2', False, statistics(20, 10.0)) == ('fit', None)
+
+    monkeypatch.setitem(oc.TRIAGE_CONFIG, 'enabled', False)
+    assert oc.triage_designation('2006 WU224', False, statistics(3, 0.5)) == ('fit', None)
+
+
+def assessment(quality_class=None, statistics_=None, **flags):
+    """ The assessment_dict of a database-orbit (None => no orbit) with the observation statistics (if any) & extra flags """
+    assessment_dict = oc.database_assessment('2006 WU224', quality_class, FakeIndex())
+    if statistics_ is not None:
+        oc.set_observation_flags(assessment_dict, statistics_)
+    assessment_dict.update(flags)
+    return assessment_dict
+
+
+def test_generate_status_code():
+    assert oc.generate_status_code(assessment()) == '099'
+    assert oc.generate_status_code(assessment(statistics_=statistics(0, 0.0))) == '001'
+    assert oc.generate_status_code(assessment(statistics_=statistics(3, 10.0))) == '002'
+    assert oc.generate_status_code(assessment('good')) == '299'
+    assert oc.generate_status_code(assessment('good', HAS_BAD_TRACKLETS=True)) == '201'
+    assert oc.generate_status_code(assessment('good', HAS_BAD_TRACKLETS=True, HAS_SIGNIFICANT_BAD_TRACKLETS=True)) == '101'
+    assert oc.generate_status_code(assessment('good', statistics(10, 30.0))) == '100'
+    assert oc.generate_status_code(assessment('good', statistics(50, 1.5))) == '100'
+    assert oc.generate_status_code(assessment('intermediate', statistics(50, 300.0))) == '199'
+    assert oc.generate_status_code(assessment('bad')) == '199'
+
+
+# ------------------ PREFETCH ---------------------------------------------------------
+
+def test_prefetch_existence_follows_the_quality_rows():
+    # an index snapshot taken before '2020 AB1' was fitted & after '2006 WU224' was deleted
+    db         = FakePrefetchOrbfitResults(orbits={'2020 AB1' : 'intermediate'})
+    prefetched = oc.prefetch_database_orbit_info(['2006 WU224', '2020 AB1'], db, index=FakeIndex(orbfit_results=['2006 WU224']))
+    assert not prefetched['2006 WU224']['IS_IN_ORBFIT_RESULTS'] and prefetched['2006 WU224']['quality_class'] is None
+    assert prefetched['2020 AB1']['IS_IN_ORBFIT_RESULTS'] and prefetched['2020 AB1']['quality_class'] == 'intermediate'
+    assert prefetched['2020 AB1']['IS_PRIMARY_UNPACKED_DESIGNATION']
+
+
+def test_prefetch_aggregates_observations_once_per_chunk():
+    db         = FakePrefetchOrbfitResults(orbits={'2006 WU224' : 'good'})
+    prefetched = oc.prefetch_database_orbit_info(['2006 WU224', '2020 AB1'], db)
+    assert sorted(db.aggregates) == ['fingerprints', 'statistics']
+    assert prefetched['2006 WU224']['observation_statistics']['n_obs'] == 2
+    assert not oc.needs_extension_fit('2006 WU224', prefetched['2006 WU224'])
+
+
+def test_prefetch_skips_aggregates_that_cannot_be_used(monkeypatch):
+    monkeypatch.setitem(oc.TRIAGE_CONFIG, 'enabled', False)
+    db         = FakePrefetchOrbfitResults(orbits={'2006 WU224' : 'good'}, fingerprint_column=False)
+    prefetched = oc.prefetch_database_orbit_info(['2006 WU224'], db)
+    assert db.aggregates == []
+    assert prefetched['2006 WU224']['observation_statistics'] is None
+    assert prefetched['2006 WU224']['observation_fingerprint'] is None
+    assert oc.needs_extension_fit('2006 WU224', prefetched['2006 WU224'])
+
+
+def test_forced_refit_skips_aggregates():
+    db         = FakePrefetchOrbfitResults(orbits={'2006 WU224' : 'good'})
+    prefetched = oc.prefetch_database_orbit_info(['2006 WU224'], db, force_refit=True)
+    assert db.aggregates == []
+    assert oc.needs_extension_fit('2006 WU224', prefetched['2006 WU224'], force_refit=True)
+
+
+# ------------------ BATCHED EXTENSION FITS -------------------------------------------
+
+def test_split_update_wrapper_result_keeps_only_its_own_failure():
+    result = { 'K06W24U'    : {'eq0dict' : {}} ,
+               'K20A01B'    : {'eq0dict' : {}} ,
+               'time'       : 12.5 ,
+               'failedfits' : {'K20A01B' : 'orbfit did not converge'} }
+    ok     = oc.split_update_wrapper_result(result, 'K06W24U', ['K06W24U', 'K20A01B'])
+    failed = oc.split_update_wrapper_result(result, 'K20A01B', ['K06W24U', 'K20A01B'])
+    assert ok     == { 'K06W24U' : {'eq0dict' : {}} , 'time' : 12.5 , 'failedfits' : {} }
+    assert failed == { 'K20A01B' : {'eq0dict' : {}} , 'time' : 12.5 , 'failedfits' : {'K20A01B' : 'orbfit did not converge'} }
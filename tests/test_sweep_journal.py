@@ -0,0 +1,44 @@
+"""
+sweep_journal checkpointing & resume state, on a temporary SQLite journal
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import pytest
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import sweep_journal
+
+
+def test_resume_state_survives_reopening(tmp_path):
+    path    = str(tmp_path / 'journal.sqlite')
+    journal = sweep_journal.SweepJournal(path)
+    for stage in ['DB_ASSESSMENT', 'ORBFIT', 'RESULT_ASSESSMENT', 'DB_WRITE', 'REASSESSMENT']:
+        journal.record('2006 WU224', stage)
+    journal.record('2006 WU224', 'DONE', status='000')
+    journal.record('2020 AB1', 'DB_ASSESSMENT')
+    journal.record('2020 AB1', 'ORBFIT')
+    journal.close()
+
+    journal = sweep_journal.SweepJournal(path)
+    assert journal.completed() == {'2006 WU224' : '000'}
+    assert journal.in_flight() == {'2020 AB1' : 'ORBFIT'}
+    journal.close()
+
+
+def test_latest_entry_wins(tmp_path):
+    journal = sweep_journal.SweepJournal(str(tmp_path / 'journal.sqlite'))
+    journal.record('2006 WU224', 'DONE', status='000')
+    journal.record('2006 WU224', 'DB_ASSESSMENT')       # re-checked (e.g. by a later sweep)
+    assert journal.completed() == {} and journal.in_flight() == {'2006 WU224' : 'DB_ASSESSMENT'}
+    journal.record('2006 WU224', 'DONE', status='100')
+    assert journal.completed() == {'2006 WU224' : '100'}
+    journal.close()
+
+
+def test_record_stage():
+    sweep_journal.record_stage(None, '2006 WU224', 'DONE')     # no journal: nothing to do
+    with pytest.raises(AssertionError):
+        sweep_journal.SweepJournal(':memory:').record('2006 WU224', 'FINISHED')
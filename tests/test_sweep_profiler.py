@@ -0,0 +1,61 @@
+"""
+sweep_profiler sampling, dumping & combining (profiling a trivial workload)
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import sweep_profiler
+
+
+def sampled_calls(profiler, n, advance=True):
+    """ Indices of the n calls that were profiled """
+    sampled = []
+    for k in range(n):
+        before = profiler.sampled
+        with sweep_profiler.profile(profiler, advance=advance):
+            pass
+        if profiler.sampled > before:
+            sampled.append(k)
+    return sampled
+
+
+def test_every_nth_call_is_sampled(tmp_path):
+    profiler = sweep_profiler.SweepProfiler(str(tmp_path), every=3, cpu=False)
+    assert sampled_calls(profiler, 7) == [0, 3, 6]
+
+
+def test_shared_work_is_sampled_with_the_next_call(tmp_path):
+    profiler = sweep_profiler.SweepProfiler(str(tmp_path), every=3, cpu=False)
+
+    # advance=False is sampled iff the next (advancing) call will be, & is not counted
+    assert sampled_calls(profiler, 1, advance=False) == [0]
+    assert sampled_calls(profiler, 1) == [0]
+    assert sampled_calls(profiler, 2, advance=False) == []
+    assert sampled_calls(profiler, 2) == []
+    assert sampled_calls(profiler, 1, advance=False) == [0]
+    assert profiler.calls == 3
+
+
+def test_no_profiler():
+    with sweep_profiler.profile(None):
+        pass
+
+
+def test_dump_and_combine(tmp_path):
+    profile_dir = str(tmp_path)
+    profiler    = sweep_profiler.SweepProfiler(profile_dir, every=2, cpu=True, memory=True)
+    for k in range(4):
+        with profiler.sample():
+            blocks = [ bytearray(1024) for _ in range(10) ]
+    profiler.dump()
+    assert sorted(os.listdir(profile_dir)) == [f'allocations_{os.getpid()}.json', f'profile_{os.getpid()}.prof']
+
+    stats, allocations = sweep_profiler.combine(profile_dir, top=5)
+    assert stats is not None and allocations and os.path.isfile(os.path.join(profile_dir, 'top_allocations.txt'))
+
+    sweep_profiler.clear(profile_dir)
+    assert sorted(os.listdir(profile_dir)) == ['combined.prof', 'top_allocations.txt']
@@ -0,0 +1,85 @@
+"""
+to_orbfit_db_tables_dev COPY serialization & upsert accounting, against fake connections (no database needed)
+"""
+
+# --------- Third-Party imports -----
+import os
+import sys
+import pytest
+
+pytest.importorskip('psycopg2')
+
+# --------- Local imports -----------
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import to_orbfit_db_tables_dev as to_db
+
+
+class FakeDBConnect():
+    """ Stand-in for DBConnect: copy_upsert reads *fail_after* rows (if not None) & then fails """
+
+    def __init__(self, fail_after=None, failed=()):
+        self.fail_after, self.failed = fail_after, list(failed)
+        self.copied = []
+
+    def copy_upsert(self, data_dictionaries, db_table_name, columns=None):
+        for row in data_dictionaries:
+            if self.fail_after is not None and len(self.copied) == self.fail_after:
+                raise RuntimeError('merge failed')
+            self.copied.append(row['packed_primary_provisional_designation'])
+        return len(self.copied)
+
+    def bulk_upsert(self, data_dictionaries, db_table_name, batch_size=500, commit=True):
+        return [ row['packed_primary_provisional_designation'] for row in data_dictionaries if row['packed_primary_provisional_designation'] in self.failed ]
+
+
+def count_dict():
+    return {'obj_count' : 0, 'no_upsert' : []}
+
+
+def pairs(*desigs):
+    """ (desig, row) pairs: a desig without a result is given as a (desig, None) tuple """
+    return iter([ d if isinstance(d, tuple) else (d, {'packed_primary_provisional_designation' : d}) for d in desigs ])
+
+
+# ------------------ COPY TEXT FORMAT -------------------------------------------------
+
+def test_copy_escape():
+    assert to_db.CopyStream.escape(None) == '\\N'
+    assert to_db.CopyStream.escape('a\\b\tc\nd\re') == 'a\\\\b\\tc\\nd\\re'
+    assert to_db.CopyStream.escape(12.5) == '12.5'
+
+
+def test_copy_stream_reads_in_chunks():
+    rows    = [ {'a' : 'x\ty', 'b' : None} , {'a' : 'é', 'b' : 2} , {'a' : 'z'} ]
+    stream  = to_db.CopyStream(iter(rows), ['a', 'b'])
+    chunks  = []
+    while True:
+        chunk = stream.read(3)
+        if not chunk:
+            break
+        assert len(chunk) <= 3
+        chunks.append(chunk)
+    assert b''.join(chunks).decode('utf-8') == 'x\\ty\t\\N\né\t2\nz\t\\N\n'
+
+
+# ------------------ UPSERT ACCOUNTING ------------------------------------------------
+
+def test_copy_upsert_counts_rows_and_missing_results():
+    db     = FakeDBConnect()
+    counts = to_db._record_copy_upsert(db, pairs('K06W24U', ('K20A01B', None), 'K21C02D'), 'orbfit_results', count_dict())
+    assert counts == {'obj_count' : 2, 'no_upsert' : ['K20A01B']}
+
+
+def test_failed_copy_upsert_marks_every_row_failed():
+    db     = FakeDBConnect(fail_after=1)
+    counts = to_db._record_copy_upsert(db, pairs('K06W24U', 'K20A01B', ('K21C02D', None), 'K22E03F'), 'orbfit_results', count_dict())
+    # the rows already copied, the row COPY failed on & those it never read (drained)
+    assert counts['obj_count'] == 0
+    assert sorted(counts['no_upsert']) == ['K06W24U', 'K20A01B', 'K21C02D', 'K22E03F']
+
+
+def test_bulk_upsert_counts_failed_rows():
+    db     = FakeDBConnect(failed=['K20A01B'])
+    rows   = [ {'packed_primary_provisional_designation' : d} for d in ['K06W24U', 'K20A01B', 'K21C02D'] ]
+    counts = to_db._record_bulk_upsert(db, rows, 'orbfit_results', 500, count_dict())
+    assert counts == {'obj_count' : 2, 'no_upsert' : ['K20A01B']}
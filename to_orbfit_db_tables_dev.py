@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
 
 import json
-import mpc_convert as mc
-import orbfit_to_dict as o2d
+import orbfit_arrays as oa
 import psycopg2
 from psycopg2.extensions import AsIs
+from psycopg2.extras import execute_values
 import sys
+import multiprocessing
+import threading
+
+import db_pool
+from lazy_imports import lazy_module
+
+# Only imported when first used: loading the element / residual dictionaries or converting designations
+# (so e.g. the upsert & COPY paths, & benchmark_orbit_checker, do not need them)
+mc  = lazy_module('mpc_convert')
+o2d = lazy_module('orbfit_to_dict')
 
 
 wriDBcols= False    # change this flag depending whether to write a file for database headers
@@ -16,15 +26,18 @@ class DBConnect():
     Class to allow 
     (a) connection to the database 
     (b) table inserts & upserts
+
+    The connection is checked-out from the shared pool (see db_pool)
+    and returned to it by db_close
     '''
     def __init__(self, db_host='marsden.cfa.harvard.edu', db_user ='postgres', db_name='vmsops'):
 
-        try:
-            self.dbConn = psycopg2.connect(host=db_host,user=db_user, database=db_name)
-            self.dbCur = self.dbConn.cursor()
-            
-        except (Exception, psycopg2.Error) as error :
-            print ("Error while connecting to PostgreSQL", error)
+        # cache of bulk-upsert statements: keyed on (table, columns)
+        self._upsert_statements = {}
+
+        # NB: a failed checkout (e.g. a pool timeout) is raised here, rather than leaving an object without a connection
+        self.dbConn = db_pool.getconn(db_host, db_user, db_name)
+        self.dbCur = self.dbConn.cursor()
 
     
             
@@ -95,13 +108,208 @@ class DBConnect():
         insert_statement+=("        ;")
         
         # Do the database insert 
-        self.dbCur.execute(insert_statement, (AsIs(','.join(columns)), tuple(values)))
-        self.dbConn.commit()
+        # - on failure, roll back before re-raising: the connection may be shared (e.g. for a whole sweep),
+        #   and an aborted transaction would make every later write on it fail
+        try:
+            self.dbCur.execute(insert_statement, (AsIs(','.join(columns)), tuple(values)))
+            self.dbConn.commit()
+        except (Exception, psycopg2.Error):
+            self.dbConn.rollback()
+            raise
+
+
+    def upsert_statement(self, db_table_name, columns):
+        '''
+        Multi-row "INSERT ... ON CONFLICT ... DO UPDATE" statement for the supplied table & columns
+
+        The statement only depends on (table, columns), so it is built once and cached
+        The single VALUES placeholder (%s) is expanded by psycopg2.extras.execute_values
+        '''
+        key = (db_table_name, tuple(columns))
+        if key not in self._upsert_statements:
+            update_list = ',\n'.join( "     "+str(k)+"=EXCLUDED."+str(k) for k in columns )
+            self._upsert_statements[key] = f"""
+        INSERT INTO 
+             {db_table_name} ({','.join(columns)}) VALUES %s
+        ON CONFLICT 
+             (packed_primary_provisional_designation)
+        DO UPDATE SET
+        {update_list}
+        ;"""
+        return self._upsert_statements[key]
+
+
+    def bulk_upsert(self, data_dictionaries, db_table_name, batch_size=500, commit=True):
+        ''' 
+        Multi-row version of upsert: writes many result dicts using multi-row statements
+
+        - rows are grouped by their set of columns (not every fit has e.g. eq2/eq3 dictionaries)
+        - each group is written in statements of up to batch_size rows
+        - everything happens in one transaction (a single commit at the end, if commit=True)
+        - if a batch fails it is rolled-back to a savepoint and retried row-by-row,
+          so that the failing designations can be identified and the rest still written
+
+        returns:
+        --------
+        failed: list
+         - packed_primary_provisional_designation of each row that could not be upserted
+        '''
+        
+        # Restrict the passed table to a list of pre-approved values
+        # N.B. "upsert" is *NOT* allowed for archive tables ...!
+        assert db_table_name in ['orbfit_results','primary_comet_orbfit_results','multiple_comet_orbfit_results'] , 'The supplied table name is not on the preapproved list for upsert ...'
+
+        # Group the rows by their columns
+        groups = {}
+        for data_dictionary in data_dictionaries:
+            groups.setdefault( tuple(data_dictionary.keys()) , [] ).append(data_dictionary)
+
+        failed = []
+        for columns, rows in groups.items():
+            insert_statement = self.upsert_statement(db_table_name, columns)
+
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i+batch_size]
+                try:
+                    self.dbCur.execute("SAVEPOINT bulk_upsert")
+                    execute_values(self.dbCur, insert_statement, [tuple(row[k] for k in columns) for row in batch], page_size=batch_size)
+                    self.dbCur.execute("RELEASE SAVEPOINT bulk_upsert")
+
+                except (Exception, psycopg2.Error) as error :
+                    print ("Error during bulk upsert, retrying batch row-by-row ...", error)
+                    self.dbCur.execute("ROLLBACK TO SAVEPOINT bulk_upsert")
+
+                    for row in batch:
+                        try:
+                            self.dbCur.execute("SAVEPOINT bulk_upsert_row")
+                            execute_values(self.dbCur, insert_statement, [tuple(row[k] for k in columns)])
+                            self.dbCur.execute("RELEASE SAVEPOINT bulk_upsert_row")
+                        except (Exception, psycopg2.Error) as error :
+                            self.dbCur.execute("ROLLBACK TO SAVEPOINT bulk_upsert_row")
+                            failed.append(row['packed_primary_provisional_designation'])
+
+        if commit:
+            self.dbConn.commit()
+
+        return failed
+
+
+    def copy_upsert(self, data_dictionaries, db_table_name, columns=None):
+        ''' 
+        Set-based upsert for very large reloads
+
+        (1) rows are streamed into a temporary staging table using COPY
+            (data_dictionaries can be a generator: rows are serialized lazily as COPY reads them)
+        (2) the staging table is merged into db_table_name with a single
+            "INSERT ... SELECT ... ON CONFLICT ... DO UPDATE" statement
+            (if a designation appears more than once, the last row copied is the one merged, as with upsert)
+        (3) one commit: either every row is written or none are
+
+        columns: list or None
+         - the columns to load (default: ORBFIT_RESULTS_COLUMNS)
+         - a column that is absent from a given row is NULL in the staging table
+           and the merge keeps any existing value for it (as upsert would)
+
+        returns:
+        --------
+        n_rows: int
+         - number of rows merged into db_table_name
+        '''
+        
+        # Restrict the passed table to a list of pre-approved values
+        # N.B. "upsert" is *NOT* allowed for archive tables ...!
+        assert db_table_name in ['orbfit_results','primary_comet_orbfit_results','multiple_comet_orbfit_results'] , 'The supplied table name is not on the preapproved list for upsert ...'
+
+        columns       = ORBFIT_RESULTS_COLUMNS if columns is None else columns
+        staging_table = db_table_name + '_staging'
+        column_list   = ','.join(columns)
+        update_list   = ',\n'.join( "     "+str(k)+"=COALESCE(EXCLUDED."+str(k)+", "+db_table_name+"."+str(k)+")" for k in columns )
+
+        try:
+            # Staging table with the same column-types as the destination (no constraints)
+            self.dbCur.execute(f"""
+            CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS
+            SELECT {column_list} FROM {db_table_name} WITH NO DATA
+            ;""")
+            # ... numbered in the order in which the rows are copied
+            self.dbCur.execute(f"ALTER TABLE {staging_table} ADD COLUMN staging_row bigserial ;")
+
+            # Stream the rows in
+            self.dbCur.copy_expert(f"COPY {staging_table} ({column_list}) FROM STDIN", CopyStream(data_dictionaries, columns))
+
+            # Merge: DISTINCT ON ensures each designation only appears once in the upsert (keeping its last row)
+            self.dbCur.execute(f"""
+            INSERT INTO 
+                 {db_table_name} ({column_list})
+            SELECT DISTINCT ON (packed_primary_provisional_designation)
+                 {column_list}
+            FROM 
+                 {staging_table}
+            ORDER BY 
+                 packed_primary_provisional_designation, staging_row DESC
+            ON CONFLICT 
+                 (packed_primary_provisional_designation)
+            DO UPDATE SET
+            {update_list}
+            ;""")
+            n_rows = self.dbCur.rowcount
+            self.dbConn.commit()
+
+        except (Exception, psycopg2.Error) :
+            self.dbConn.rollback()
+            raise
+
+        return n_rows
 
 
     def db_close(self):
         self.dbCur.close()
-        self.dbConn.close()
+        db_pool.putconn(self.dbConn)
+
+        
+# Every column that dict_to_insert can populate
+ORBFIT_RESULTS_COLUMNS = [
+    'packed_primary_provisional_designation',
+    'unpacked_primary_provisional_designation',
+    'rwo_json',
+    'quality_json',
+    'mid_epoch_json',
+    'standard_epoch_json',
+    'standard_epoch_closest_to_pericenter_json',
+    'standard_epoch_closest_to_next_passage_json',
+    'additional_parameter_json',
+]
+
+
+class CopyStream():
+    '''
+    Minimal file-like object that serializes dictionaries to the COPY text format
+    as cursor.copy_expert reads from it
+     - only one row is held in memory at a time (plus the unread part of the buffer)
+    '''
+    def __init__(self, data_dictionaries, columns):
+        self.rows    = iter(data_dictionaries)
+        self.columns = columns
+        self.buffer  = b''
+
+    @staticmethod
+    def escape(value):
+        ''' COPY text-format field: NULL -> \\N, and escape backslash / tab / newline / carriage-return '''
+        if value is None:
+            return '\\N'
+        return str(value).replace('\\','\\\\').replace('\t','\\t').replace('\n','\\n').replace('\r','\\r')
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += ( '\t'.join( self.escape(row.get(k)) for k in self.columns ) + '\n' ).encode('utf-8')
+
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
 
         
 def packeddes_to_orbfitdes(desig):
@@ -165,7 +373,7 @@ def load_orbfit_files(desig,file_list,count_dict,feldir='neofitels/',obsdir='res
             filedict['rwodict'] = o2d.rwo_to_dict(obsdir+objname+'.rwo')
         except:
             filedict['rwodict'] = {}
-            cdkey = [key for key,val in count_dict.keys() if 'rwo' in key][0]
+            cdkey = [key for key in count_dict.keys() if 'rwo' in key][0]
             count_dict[cdkey].append(desig)
 
     return filedict,count_dict
@@ -217,8 +425,8 @@ def dict_to_insert(packed,filedict,qualitydict,addpardict=None):
     result = {}
 
     result['packed_primary_provisional_designation']    = packed
-    result['unpacked_primary_provisional_designation']  = mc.packed_to_unpacked_desig(desig)
-    result['rwo_json']                                  = json.dumps(filedict['rwodict'])
+    result['unpacked_primary_provisional_designation']  = mc.packed_to_unpacked_desig(packed)
+    result['rwo_json']                                  = json.dumps(filedict.get('rwodict', {}))
     result['quality_json']                              = json.dumps(qualitydict)
 
     if 'eq0dict' in filedict.keys():
@@ -256,24 +464,10 @@ def check_quality(filedict,file_list):
 def check_fel_quality(feldict):
 
     # check contents of elements file
+    # - the same messages as ever (see orbfit_arrays.fel_quality_messages): the stricter
+    #   covariance checks are only made by orbit_checker.audit_orbit_covariances
 
-    result = ''
-    
-    if not feldict:
-        result = 'no orbit'
-    else:
-        for coordtype in ['EQU','KEP','CAR','COM','COT']:
-            orbparams = feldict[coordtype].keys()
-            if not orbparams:
-                result += ', no '+coordtype
-            elif 'element0' in orbparams and 'cov00' not in orbparams:
-                result += ', no '+coordtype+' covariance'
-        if result:
-            result = result[2:]
-        else:
-            result = 'ok'
-
-    return result
+    return oa.fel_quality_messages([feldict])[0]
 
 
 
@@ -352,6 +546,7 @@ def orbfit_ff_to_dict( orbfitname , processing_directory):
     
 
 def save_result_dict_to_db(result_dict_to_upsert, orbit_type, db=None):
+    close_db = db is None
     try:
         # Establish connection to the database if not passed-in
         db = DBConnect() if db is None else db
@@ -364,7 +559,11 @@ def save_result_dict_to_db(result_dict_to_upsert, orbit_type, db=None):
     except Exception as e:
         SUCCESS = False
         print('Exception....\n', e)
-        
+
+    finally:
+        # Return a connection that was checked-out for this call to the pool
+        if close_db and isinstance(db, DBConnect):
+            db.db_close()
         
     return SUCCESS,
   
@@ -414,6 +613,210 @@ def single_orbfit_directory_to_database(
 ######################
 
 
+def _record_bulk_upsert(db, rows, table_name, batch_size, count_dict, commit=True):
+    '''
+    Bulk-upsert rows & update the summary dictionary
+    (per-designation successes -> obj_count, failures -> no_upsert)
+    '''
+    failed = db.bulk_upsert(rows, table_name, batch_size=batch_size, commit=commit)
+    for desig in failed:
+        print(desig+' : problem with upsert')
+    count_dict['obj_count'] += len(rows) - len(failed)
+    count_dict['no_upsert'].extend(failed)
+    return count_dict
+
+
+def _record_copy_upsert(db, desig_row_pairs, table_name, count_dict, columns=None):
+    '''
+    COPY rows into a staging table & merge into table_name, updating the summary dictionary
+     - The merge is a single statement, so it either succeeds or fails for every designation
+     - If it fails, any pairs that COPY had not yet read are drained into no_upsert too
+       (so the count is complete, and a parallel pipeline is not left blocked on its queues)
+    '''
+    copied = []
+    def rows():
+        for desig, row in desig_row_pairs:
+            if row is None:
+                print(desig+' : problem with upsert')
+                count_dict['no_upsert'].append(desig)
+                continue
+            copied.append(desig)
+            yield row
+
+    try:
+        db.copy_upsert(rows(), table_name, columns=columns)
+        count_dict['obj_count'] += len(copied)
+    except (Exception, psycopg2.Error) as error :
+        print('problem with COPY/merge into '+table_name+' :', error)
+        count_dict['no_upsert'].extend(copied)
+        count_dict['no_upsert'].extend( desig for desig, row in desig_row_pairs )
+    return count_dict
+
+
+def _with_extra_columns(desig_row_pairs, extra_columns):
+    ''' Generator: add extra_columns[desig] (if any) to each (desig, row) pair '''
+    for desig, row in desig_row_pairs:
+        if row is not None and desig in extra_columns:
+            row = dict(row, **extra_columns[desig])
+        yield desig, row
+
+
+def prepare_row_to_insert( desig,
+                           count_dict,
+                           file_list=['eq0','eq1','rwo'],
+                           feldir='neofitelss/',
+                           obsdir='res/',
+                           addpardict=None,
+                           supplied_filedict=None ):
+    '''
+    For a single object: load the fit output, construct quality dictionary & upsert dictionary
+
+    returns:
+    --------
+    loaded            : Boolean
+     - False if the files could not be loaded (recorded in count_dict)
+    to_orbfit_results : dict or None
+     - None if there is nothing that can be upserted
+    '''
+    print('\n Attempting to insert to orbfit_results for: ', desig)
+    
+    # Read dictionaries direct from input
+    # Not really doing anything much, as the data is mainly/totally present in the desired manner ...
+    if isinstance( supplied_filedict , dict ):
+        filedict,count_dict = load_supplied_dict( supplied_filedict , count_dict)
+    else:
+        # load orbfit results files into python
+        try:
+            filedict,count_dict = load_orbfit_files(desig,file_list,count_dict,feldir=feldir,obsdir=obsdir)
+        except:
+            print(desig+' : problem with file/dict load')
+            count_dict['no_extract'].append(desig)
+            for filename in file_list:
+                count_dict['no_'+filename].append(desig)
+            return False, None
+
+    # construct quality dictionary
+    print('...filedict...')
+    for k,v in filedict.items(): print(k,v)
+    print('...')
+    qualitydict = check_quality(filedict,file_list)
+
+    # construct upsert dictionary
+    to_orbfit_results = dict_to_insert(desig,filedict,qualitydict,addpardict=addpardict) if filedict else None
+
+    return True, to_orbfit_results
+
+
+def iterate_rows_to_insert( primdesiglist,
+                            count_dict,
+                            file_list=['eq0','eq1','rwo'],
+                            feldir='neofitelss/',
+                            obsdir='res/',
+                            addpardict=None,
+                            filedictlist = None ):
+    '''
+    Generator: for each object fitted, check fit output, construct quality dictionary & upsert dictionary
+     - yields (desig, to_orbfit_results)
+     - to_orbfit_results is None if there is nothing that can be upserted
+     - designations whose files cannot be loaded are recorded in count_dict & skipped
+    '''
+    for desig, supplied_filedict in _ingest_tasks(primdesiglist, filedictlist):
+        loaded, to_orbfit_results = prepare_row_to_insert(desig, count_dict, file_list=file_list, feldir=feldir, obsdir=obsdir, addpardict=addpardict, supplied_filedict=supplied_filedict)
+        if loaded:
+            yield desig, to_orbfit_results
+
+
+def _ingest_tasks(primdesiglist, filedictlist):
+    ''' (desig, supplied-filedict-or-None) for each object '''
+    use_supplied = filedictlist is not None and len(filedictlist) == len(primdesiglist)
+    for n, desig in enumerate(primdesiglist):
+        yield desig, ( filedictlist[n] if use_supplied else None )
+
+
+def _ingest_worker(task_queue, result_queue, file_list, feldir, obsdir, addpardict):
+    '''
+    Pipeline worker: runs prepare_row_to_insert for each task until it receives a None sentinel
+     - each result carries the worker-local count_dict entries for that designation
+    '''
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        desig, supplied_filedict = task
+        local_count_dict = add_orbitfiles({'obj_count': 0, 'no_upsert': [], 'no_extract': []}, file_list)
+        try:
+            loaded, to_orbfit_results = prepare_row_to_insert(desig, local_count_dict, file_list=file_list, feldir=feldir, obsdir=obsdir, addpardict=addpardict, supplied_filedict=supplied_filedict)
+        except Exception as e:
+            print(desig+' : problem preparing row ...', e)
+            loaded, to_orbfit_results = True, None
+        result_queue.put( (desig, loaded, to_orbfit_results, local_count_dict) )
+    result_queue.put(None)
+
+
+def iterate_rows_to_insert_in_parallel( primdesiglist,
+                                        count_dict,
+                                        workers,
+                                        queue_size=None,
+                                        file_list=['eq0','eq1','rwo'],
+                                        feldir='neofitelss/',
+                                        obsdir='res/',
+                                        addpardict=None,
+                                        filedictlist = None ):
+    '''
+    Pipelined version of iterate_rows_to_insert
+     - a pool of worker processes runs the file-load / quality-check / dict_to_insert stage
+     - this process (the single writer) consumes the yielded rows, so file parsing & db writes overlap
+     - both queues are bounded (queue_size, default 2*workers) so that a slow writer
+       holds back the workers (backpressure) rather than accumulating rows in memory
+     - rows are yielded in completion order, not in the order of primdesiglist
+     - if the generator is closed before it is exhausted, the workers are terminated
+    '''
+    queue_size   = 2*workers if queue_size is None else queue_size
+    task_queue   = multiprocessing.Queue(maxsize=queue_size)
+    result_queue = multiprocessing.Queue(maxsize=queue_size)
+
+    processes = [ multiprocessing.Process(target=_ingest_worker, args=(task_queue, result_queue, file_list, feldir, obsdir, addpardict), daemon=True) for _ in range(workers) ]
+    for process in processes:
+        process.start()
+
+    # Feed the tasks from a thread, so that this process is free to drain the results
+    def feed():
+        for task in _ingest_tasks(primdesiglist, filedictlist):
+            task_queue.put(task)
+        for _ in processes:
+            task_queue.put(None)
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    # Drain until every worker has signalled completion
+    finished = 0
+    try:
+        while finished < len(processes):
+            result = result_queue.get()
+            if result is None:
+                finished += 1
+                continue
+
+            desig, loaded, to_orbfit_results, local_count_dict = result
+            for key, val in local_count_dict.items():
+                if isinstance(val, list):
+                    count_dict[key].extend(val)
+            if loaded:
+                yield desig, to_orbfit_results
+    finally:
+        # Abandoned part-way: the workers (& the feeder) would otherwise stay blocked on the full queues
+        if finished < len(processes):
+            task_queue.cancel_join_thread()
+            result_queue.cancel_join_thread()
+            for process in processes:
+                process.terminate()
+                process.join()
+
+    feeder.join()
+    for process in processes:
+        process.join()
+
+
 def main(   primdesiglist,
             file_list=['eq0','eq1','rwo'],
             table_name='orbfit_results',
@@ -421,16 +824,48 @@ def main(   primdesiglist,
             obsdir='res/',
             timestamp='',
             addpardict=None,
-            filedictlist = None ):
+            filedictlist = None,
+            load_method='row',
+            batch_size=500,
+            db=None,
+            workers=1,
+            extra_columns=None,
+            return_count_dict=False ):
     '''
     Generates dictionaries from orbfit output files listed in file_list for objects in primdesiglist 
     (primdesiglist = packed desigs; will assume Orbfit names are unpacked w/o spaces/punctuation)
     Checks orbit elements files for contents; generates quality summary
     Stores in specified orbit table
+
+    load_method: string
+     - 'row'  : upsert & commit each object as it is processed
+     - 'bulk' : collect objects and write them with DBConnect.bulk_upsert,
+                batch_size rows per statement, all within a single transaction
+     - 'copy' : stream all objects into a staging table with COPY and merge
+                them with a single set-based upsert (DBConnect.copy_upsert):
+                intended for very large reloads
+
+    db: DBConnect or None
+     - an existing connection to use (it is left open for the caller)
+     - if None, a connection is checked-out of the shared pool for this call
+
+    workers: int
+     - if > 1, the files are loaded & checked by a pool of worker processes while
+       this process writes to the database (see iterate_rows_to_insert_in_parallel)
+
+    extra_columns: dict or None
+     - {desig : {column : value}}: added to that desig's row, so that they are written in the same upsert
+       (e.g. the observation_fingerprint of the observations that orbit_checker fitted)
+
+    return_count_dict: Boolean
+     - if True, return (summarystr, count_dict), so that the caller can tell which desigs were
+       written (count_dict['no_upsert'] lists those that were not)
     '''
+    assert load_method in ['row','bulk','copy'], f'Unknown load_method: {load_method}'
 
-    # Establish connection to the database
-    db = DBConnect() 
+    # Establish connection to the database (if not passed-in)
+    close_db = db is None
+    db = DBConnect() if db is None else db
 
     # set up summary dictionary of info upserted
     count_dict = {
@@ -439,46 +874,55 @@ def main(   primdesiglist,
         'no_extract': []}
     count_dict = add_orbitfiles(count_dict,file_list)
 
-    # for each object fitted, check fit output, construct quality dictionary, upsert results
-    for n, desig in enumerate(primdesiglist):
-
-        print('\n Attempting to insert to orbfit_results for: ', desig)
-        
-        # Read dictionaries direct from input
-        # Not really doing anything much, as the data is mainly/totally present in the desired manner ...
-        if filedictlist is not None and len(filedictlist) == len(primdesiglist) and isinstance( filedictlist[n] , dict ):
-            filedict,count_dict = load_supplied_dict( filedictlist[n] , count_dict)
+    try:
+        # for each object fitted, check fit output, construct quality dictionary, upsert results
+        if workers > 1:
+            desig_row_pairs = iterate_rows_to_insert_in_parallel(primdesiglist, count_dict, workers, file_list=file_list, feldir=feldir, obsdir=obsdir, addpardict=addpardict, filedictlist=filedictlist)
         else:
-            # load orbfit results files into python
-            try:
-                filedict,count_dict = load_orbfit_files(desig,file_list,count_dict,feldir=feldir,obsdir=obsdir)
-            except:
-                print(desig+' : problem with file/dict load')
-                filedict = {}
-                count_dict['no_extract'].append(desig)
-                for filename in file_list:
-                    count_dict['no_'+filename].append(desig)
-                continue
+            desig_row_pairs = iterate_rows_to_insert(primdesiglist, count_dict, file_list=file_list, feldir=feldir, obsdir=obsdir, addpardict=addpardict, filedictlist=filedictlist)
 
-        # construct quality dictionary
-        print('...filedict...')
-        for k,v in filedict.items(): print(k,v)
-        print('...')
-        qualitydict = check_quality(filedict,file_list)
+        if extra_columns:
+            desig_row_pairs = _with_extra_columns(desig_row_pairs, extra_columns)
 
-        # construct upsert dictionary
-        if filedict:
-            to_orbfit_results = dict_to_insert(desig,filedict,qualitydict,addpardict=addpardict)
+        if load_method == 'copy':
+            copy_columns = ORBFIT_RESULTS_COLUMNS + sorted( set().union(*extra_columns.values()) - set(ORBFIT_RESULTS_COLUMNS) ) if extra_columns else None
+            count_dict = _record_copy_upsert(db, desig_row_pairs, table_name, count_dict, columns=copy_columns)
 
-        # upsert to specified table
-        try:
-            db.upsert(to_orbfit_results,table_name)
-            count_dict['obj_count'] += 1
-        except:
-            print(desig+' : problem with upsert')
-            count_dict['no_upsert'].append(desig)
-
-    db.db_close()
+        else:
+            # rows waiting to be bulk-upserted
+            pending = []
+
+            for desig, to_orbfit_results in desig_row_pairs:
+
+                if to_orbfit_results is None:
+                    print(desig+' : problem with upsert')
+                    count_dict['no_upsert'].append(desig)
+                    continue
+
+                # bulk: collect the rows & write a batch once enough have accumulated
+                # - the transaction is only committed after the final batch
+                if load_method == 'bulk':
+                    pending.append(to_orbfit_results)
+                    if len(pending) >= batch_size:
+                        count_dict = _record_bulk_upsert(db, pending, table_name, batch_size, count_dict, commit=False)
+                        pending = []
+                    continue
+
+                # upsert to specified table
+                try:
+                    db.upsert(to_orbfit_results,table_name)
+                    count_dict['obj_count'] += 1
+                except:
+                    print(desig+' : problem with upsert')
+                    count_dict['no_upsert'].append(desig)
+
+            if load_method == 'bulk':
+                count_dict = _record_bulk_upsert(db, pending, table_name, batch_size, count_dict, commit=True)
+
+    finally:
+        # Return a connection that was checked-out for this call to the pool (even if loading failed)
+        if close_db:
+            db.db_close()
         
     # count objects with missing orbfit results files
     missing_file_list = set([])
@@ -494,5 +938,6 @@ def main(   primdesiglist,
     summarystr = str(count_dict['obj_count'])+' object(s) saved to '+table_name+'; '+str(missing_file_count)+' object(s) missing at least one orbit file; '+str(len(count_dict['no_upsert']))+' object(s) with upsert issues'
     print(summarystr)
 
+    if return_count_dict:
+        return summarystr, count_dict
     return summarystr
-